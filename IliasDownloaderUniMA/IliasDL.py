@@ -1,16 +1,31 @@
 #!/usr/bin/env python3
 
-from requests import session, get, ConnectionError
-from bs4 import BeautifulSoup
 from urllib.parse import urljoin
 from pathlib import Path as plPath
-from dateparser import parse as parsedate
 from datetime import datetime
-from multiprocessing.pool import ThreadPool
+from functools import cached_property
+from concurrent.futures import ThreadPoolExecutor
+from .cache import PageCache
+from .manifest import SyncManifest, extractRefId
+from .parsing import (strainFolderPage, makeSoup, itemType, parseFileProperties, parseVideo,
+	parseContainerList, parseFolderSoup, parseFolderPage, parseTaskUnitPage)
+from .dates import parseIliasDate
+from .records import FileRecord, FileList
+from .metrics import Metrics
+from .throttle import AdaptiveLimiter, TokenBucket, parseSchedule, backoffDelay
+from .plan import DownloadPlan, download_orders, knownSize
+from .tasks import taskKey
+from .snapshot import readSnapshot
+from .watch import PollSchedule
+from . import cookies
+import hashlib
 import math
 import os	
-import shutil
+import queue
+import threading
+import time
 import re
+import sys
 
 class IliasDownloaderUniMA():
 	"""
@@ -19,28 +34,73 @@ class IliasDownloaderUniMA():
 	
 	base_url = "https://ilias.uni-mannheim.de/"
 	desktop_url = "https://ilias.uni-mannheim.de/ilias.php?baseClass=ilPersonalDesktopGUI"
+	cas_url = "https://cas.uni-mannheim.de/cas/login"
+	state_file = ".iliasdl.sqlite"
+	session_file = ".iliasdl.session"
+	chunk_size = 1 << 16
 
 
 	def __init__(self):
 		"""
 		Constructs a new instance.
 		"""
-		self.current_semester_pattern = self.getCurrentSemester()
 		self.courses = []
 		self.to_scan = []
-		self.files = []
+		self.files = FileList()
 		self.params = {
 			'num_scan_threads' : 5, 
 			'num_download_threads': 5, 
+			'max_host_connections': 10,
+			'parse_processes': 0,
+			'download_queue_size': 100,
+			'segment_threshold': 100,
+			'num_segments': 4,
+			'max_retries': 3,
+			'background_task_timeout': 600,
+			'max_bandwidth': 0,
+			'bandwidth_schedule': [],
+			'download_order': 'discovery',
 			'download_path': os.getcwd(),
 			'tutor_mode': False,
+			'page_cache': False,
+			'session_cache': False,
+			'deduplicate': False,
+			'extract_submissions': False,
+			'profile': False,
+			'dry_run': False,
 			'verbose' : False
 		}
 		self.session = None
+		self.adapters = {}
 		self.login_soup = None
-		self.background_task_files = []
-		self.background_tasks_to_clean = []
+		self.background_task_files = {}
+		self.background_tasks_to_clean = {}
+		self.submission_urls = set()
+		self.background_lock = threading.Lock()
 		self.external_scrapers = []
+		self.page_cache = None
+		self.manifest = None
+		self.probe_executor = None
+		self.parse_executor = None
+		self.probe_lock = threading.Lock()
+		self.download_queue = None
+		self.file_sinks = []
+		self.request_submissions = True
+		self.descend_unchanged = True
+		self.changed_pages = {}
+		self.watch_lock = threading.Lock()
+		self.watch_stop = threading.Event()
+		self.created_paths = set()
+		self.created_paths_lock = threading.Lock()
+		self.metrics = Metrics()
+		self.limiter = AdaptiveLimiter(self._maxInFlight())
+		self.download_limiter = AdaptiveLimiter(self.params['num_download_threads'])
+		self.bandwidth = TokenBucket()
+
+
+	@cached_property
+	def current_semester_pattern(self):
+		return self.getCurrentSemester()
 
 
 	def getCurrentSemester(self):
@@ -61,16 +121,30 @@ class IliasDownloaderUniMA():
 		:type       value:  str or int
 		"""
 
-		if param in ['num_scan_threads', 'num_download_threads']:
+		if param in ['num_scan_threads', 'num_download_threads', 'max_host_connections', 'parse_processes', 'download_queue_size',
+			'segment_threshold', 'num_segments', 'max_retries', 'background_task_timeout']:
 			if type(value) is int:
 				self.params[param] = value
+		if param == 'max_bandwidth':
+			if type(value) in (int, float) and value >= 0:
+				self.params[param] = value
+		if param == 'bandwidth_schedule':
+			try:
+				parseSchedule(value)
+			except (TypeError, ValueError):
+				pass
+			else:
+				self.params[param] = list(value)
+		if param == 'download_order':
+			if value in download_orders:
+				self.params[param] = value
 		if param == 'download_path':
 			if os.path.isdir(value):
 				self.params[param] = value
 		if param == 'verbose':
 			if type(value) is bool:
 				self.params[param] = value
-		if param == 'tutor_mode':
+		if param in ['tutor_mode', 'page_cache', 'session_cache', 'deduplicate', 'extract_submissions', 'profile', 'dry_run']:
 			if type(value) is bool:
 				self.params[param] = value
 
@@ -93,7 +167,10 @@ class IliasDownloaderUniMA():
 
 	def login(self, login_id, login_pw):
 		"""
-		create requests session and log into ilias.uni-mannheim.de
+		create requests session and log into ilias.uni-mannheim.de. If the
+		parameter 'session_cache' is set, the session cookies of the last 
+		run are restored and the CAS login is skipped as long as the 
+		session is still valid.
 	
 		:param      args:       login details (uni-id and password)
 		:type       args:       list
@@ -102,6 +179,13 @@ class IliasDownloaderUniMA():
 		"""
 		if type(login_id) is not str or type(login_pw) is not str:
 			raise TypeError("...")
+		# requests is imported on first use to keep the import fast
+		from .session import InstrumentedSession
+		self.session = InstrumentedSession(self.metrics, self.limiter, self.params['max_retries'], self.download_limiter)
+		self._mountAdapters()
+		secret = login_id + "\0" + login_pw
+		if self.params['session_cache'] and self._restoreSession(secret):
+			return
 		# User data and user-agent
 		data = {'username': login_id, 'password': login_pw}
 		head = {
@@ -110,15 +194,106 @@ class IliasDownloaderUniMA():
 							+ "Chrome/56.0.2924.87 Safari/537.36",
 			'Connection': 'keep-alive'
 		}
-		self.session = session()
-		self.login_soup = BeautifulSoup(self.session.get("https://cas.uni-mannheim.de/cas/login").content, "lxml")
+		self.login_soup = makeSoup(self.session.get(self.cas_url).content)
 		form_data = self.login_soup.select('form[action^="/cas/login"] input')
 		data.update({inp["name"]: inp["value"] for inp in form_data if inp["name"] not in data})
-		self.session.post('https://cas.uni-mannheim.de/cas/login', data=data, headers=head)
-		self.login_soup = BeautifulSoup(self.session.get(self.base_url).content, "lxml")
+		self.session.post(self.cas_url, data=data, headers=head)
+		self.login_soup = makeSoup(self.session.get(self.base_url).content)
 		# Login successful? FIY
 		if not self.login_soup.find("a", {'id' : 'mm_desktop'}):
+			from requests import ConnectionError
 			raise ConnectionError("Couldn't log into ILIAS. Make sure your provided uni-id and the password are correct.")
+		if self.params['session_cache'] and cookies.available():
+			cookies.saveCookies(self._sessionPath(), self.session.cookies, secret)
+
+
+	def _sessionPath(self):
+		return os.path.join(self.params['download_path'], self.session_file)
+
+
+	def _restoreSession(self, secret):
+		"""
+		Restores the encrypted session cookies and validates them by a 
+		single request of the ilias start page, which is kept as 
+		login_soup for addAllSemesterCourses().
+
+		:returns:   True if the restored session is still logged in
+		:rtype:     bool
+		"""
+
+		if not cookies.available():
+			print("The session cache needs the package 'cryptography', logging in...")
+			return False
+		if not cookies.loadCookies(self._sessionPath(), self.session.cookies, secret):
+			return False
+		self.login_soup = makeSoup(self.session.get(self.base_url).content)
+		if self.login_soup.find("a", {'id' : 'mm_desktop'}):
+			return True
+		# The session has expired
+		self.session.cookies.clear()
+		return False
+
+
+	def _poolSize(self):
+		"""
+		Returns the number of connections to ilias the threads may use 
+		concurrently: the scan threads, the threads probing the video sizes
+		and the download threads with their segments.
+		"""
+
+		p = self.params
+		return 2 * p['num_scan_threads'] + p['num_download_threads'] * max(1, p['num_segments'])
+
+
+	def _maxInFlight(self):
+		"""
+		Returns the upper bound for the adaptive limit of concurrent page
+		requests: the scan threads and the video size probes. The downloads
+		have a limit of their own, so a few long downloads can't take up all
+		the slots of a lowered limit and stall the scan.
+		"""
+
+		return 2 * self.params['num_scan_threads']
+
+
+	def _mountAdapters(self):
+		"""
+		Mounts separate connection pools for ilias and the CAS login. The 
+		ilias pool is sized such that every thread can keep its connection
+		alive instead of opening a new one. The adapters are only replaced
+		if the thread parameters changed.
+		"""
+
+		from requests.adapters import HTTPAdapter
+		size = self._poolSize()
+		if self.adapters and self.adapters[self.base_url]._pool_maxsize == size:
+			return
+		self.adapters = {
+			self.base_url: HTTPAdapter(pool_connections=1, pool_maxsize=size),
+			self.cas_url: HTTPAdapter(pool_connections=1, pool_maxsize=1)
+		}
+		for prefix, adapter in self.adapters.items():
+			self.session.mount(prefix, adapter)
+
+
+	def connectionStats(self):
+		"""
+		Returns the number of requests and opened connections of the 
+		connection pools. Each request that didn't open a new connection 
+		reused a kept-alive one.
+
+		:returns:   the requests and connections for each pool
+		:rtype:     dict
+		"""
+
+		stats = {}
+		for prefix, adapter in self.adapters.items():
+			pools = [adapter.poolmanager.pools[key] for key in adapter.poolmanager.pools.keys()]
+			stats[prefix] = {
+				'requests': sum(pool.num_requests for pool in pools),
+				'connections': sum(pool.num_connections for pool in pools)
+			}
+		return stats
 
 
 	def addCourse(self, iliasid, course_name=None):
@@ -131,7 +306,7 @@ class IliasDownloaderUniMA():
 
 		url = self.createIliasUrl(iliasid)
 		if not course_name:
-			soup = BeautifulSoup(self.session.get(url).content, "lxml")
+			soup = makeSoup(self.session.get(url).content)
 			course_name = soup.select_one("#mainscrolldiv > ol > li:nth-child(3) > a").text
 		if (course_name := re.sub(r"\[.*\] ", "", course_name)):
 			self.courses += [{'name' : course_name, 'url': url}]
@@ -180,26 +355,39 @@ class IliasDownloaderUniMA():
 						self.addCourse(iliasid, course_name)
 
 
+	def addFile(self, file):
+		"""
+		Adds a file to the files list. While downloadAllFiles() is running,
+		the file is passed straight to the download queue. The file is also
+		passed to the functions in 'file_sinks' (see iterFiles()).
+
+		:param      file:  The file
+		:type       file:  dict or FileRecord
+		"""
+
+		if not isinstance(file, FileRecord):
+			file = FileRecord.fromDict(file)
+		self.files.append(file)
+		self.metrics.count('files', file.course)
+		for sink in self.file_sinks:
+			sink(file)
+		if self.download_queue is not None:
+			self.download_queue.put(file)
+
+
 	def _determineItemType(self, url):
-		if "target=file" in url:
-			return "file"
-		elif "calldirectlink" in url:
-			return "link"
-		elif "showThreads" in url:
-			return "forum"
-		elif "showOverview" in url:
-			return "task"
-		elif "ilHTLMPresentationGUI" in url:
-			return "lernmaterialien"
-		else:
-			return "folder"
+		return itemType(url)
+
+
+	def _parseDate(self, text):
+		with self.metrics.stage('dates'):
+			return parseIliasDate(text)
 
 
 	def _parseFileProperties(self, bs_item):
 		"""
 		Tries to parse the file's size, modification date and the file ending.
-		Note: there are some cases where Ilias doesn't provide a modification 
-		date and/or a file size.
+		See parsing.parseFileProperties().
 
 		:param      bs_item:  The beautifulsoup item
 		:type       bs_item:  { type_description }
@@ -208,67 +396,30 @@ class IliasDownloaderUniMA():
 		:rtype:     tuple
 		"""
 
-		props = bs_item.find_all('span', 'il_ItemProperty')
-		p = [i for i in props if len(i.text.split()) > 0 and "Version" not in i.text]
-		# Parse the file ending
-		if len(p[0].text.split()) > 1:
-			file_ending = ""
-		else:
-			file_ending = "." + p[0].text.split()[0]
-
-		# Parse the file size
-		if len(p) > 1:
-			size_tmp = p[1].text.lower().replace(".","").replace(",", ".").split()
-			size = float(size_tmp[0])
-			if size_tmp[1] == "kb":
-				size *= 1e-3
-			elif size_tmp[1] == "bytes":
-				size *= 1e-6
-		else:
-			size = math.nan
-
-		# Parse the modification date
-		if len(p) > 2:
-			mod_date = parsedate(p[2].text)
-		else:
-			mod_date = datetime.fromisoformat('2000-01-01')
-
-		return file_ending, size, mod_date
+		return parseFileProperties(bs_item, self._parseDate)
 
 
 	def parseVideos(self, mc_soup):
-		# Checks if there's a video inside the mediacontainer:
-		if (vsoup := mc_soup.find('video', {"class": "ilPageVideo"})):
-			if (v_src := vsoup.find('source')['src']):
-				v_url = urljoin(self.base_url, v_src)
-				v_name = re.search(r"mobs/mm_\d+/(.*)\?il_wac_token.*", v_src).group(1)
-				try:
-					v_size = float(self.session.head(v_url).headers['Content-Length']) * 1e-6
-				except:
-					v_size = math.nan
-				# The HEAD requests misses the 'last-modified' key, so it's not
-				# possible to get the mod date from there :(
-				v_mod_date = datetime.fromisoformat('2000-01-01')
-			return v_name, v_size, v_mod_date, v_url
-		else:
-			return None
+		return parseVideo(mc_soup, self.base_url)
 
 
 	def scanMediaContainer(self, course_name, file_path, soup):
 		"""
 		Scans videos on the top of the course inside the MediaContainer and
-		adds them to the list 'to_scan'.
+		returns them.
 
 		:param      soup:  The soup
 		:type       soup:  { type_description }
+
+		:returns:   the found videos
+		:rtype:     list
 		"""
 
-		if self.params['verbose']:
-			print(f"Scanning Videos...")
+		videos = []
 		for mc in soup.find_all("figure", {"class": "ilc_media_cont_MediaContainer"}):
 			if (video := self.parseVideos(mc)):
 				v_name, v_size, v_mod_date, v_url = video
-				self.files += [{ 
+				videos += [{ 
 					'course': course_name, 
 					'type': 'file',
 					'name': v_name,
@@ -277,61 +428,189 @@ class IliasDownloaderUniMA():
 					'url': v_url,
 					'path': file_path
 				}]
+		return self._addVideos(videos)
+
+
+	def _addVideos(self, videos):
+		if self.params['verbose']:
+			print(f"Scanning Videos...")
+		self.probeVideoSizes(videos)
+		for v in videos:
+			self.addFile(v)
+		return videos
+
+
+	def _probeSize(self, url):
+		try:
+			return float(self.session.head(url).headers['Content-Length']) * 1e-6
+		except:
+			return math.nan
+
+
+	def probeVideoSizes(self, videos):
+		"""
+		Determines the sizes of the videos by concurrent HEAD requests. 
+		Videos whose media object (mm_<id>) is already known by the sync 
+		manifest are not probed again.
+
+		:param      videos:  The videos
+		:type       videos:  list
+		"""
+
+		to_probe = []
+		for v in videos:
+			if self.manifest is not None and (size := self.manifest.mediaSize(extractRefId(v['url']))) is not None:
+				v['size'] = size
+			else:
+				to_probe.append(v)
+		if not to_probe:
+			return
+		with self.probe_lock:
+			if self.probe_executor is None:
+				self.probe_executor = ThreadPoolExecutor(self.params['num_scan_threads'])
+		for v, size in zip(to_probe, self.probe_executor.map(self.metrics.bind(self._probeSize), [v['url'] for v in to_probe])):
+			v['size'] = size
+			if self.manifest is not None and not math.isnan(size):
+				self.manifest.recordMedia(extractRefId(v['url']), size)
 
 
 	def scanContainerList(self, course_name, file_path, soup):
 		"""
-		Scans the soup object for links inside the ContainerList and adds
-		them to the list 'to_scan'. See _determineItemType() for the possible types of links.
+		Scans the soup object for links inside the ContainerList, adds the
+		found files and returns the links to scan next. See parsing.itemType()
+		for the possible types of links.
 
 		:param      soup:  
 		:type       soup:  bs4.BeautifulSoup
+
+		:returns:   the folders, tasks and lernmaterialien to scan next
+		:rtype:     list
 		"""
 
-		for i in (items := soup.find_all("div", "il_ContainerListItem")):
-			if (subitem := i.find('a', href=True)):
-				el_url =  urljoin(self.base_url, subitem['href'])
-				el_name = subitem.text
-				el_type = self._determineItemType(el_url)
-				if el_type == "file":
-					ending, size, mod_date = self._parseFileProperties(i)
-					self.files += [{
-						'course': course_name, 
-						'type': el_type,
-						'name': el_name + ending,
-						'size': size,
-						'mod-date': mod_date,
-						'url': el_url,
-						'path': file_path
-					}]
-				elif el_type in ["folder", "task", "lernmaterialien"]:
-					self.to_scan += [{
-						'type': el_type, 
-						'name': el_name, 
-						'url': el_url
-					}]
+		files, to_scan = self._parseContainerList(course_name, file_path, 
+			soup.find_all("div", "il_ContainerListItem"))
+		for f in files:
+			self.addFile(f)
+		return to_scan
+
+
+	def _parseContainerList(self, course_name, file_path, items):
+		"""
+		Parses the ContainerList items.
+
+		:returns:   the found files, the items to scan next
+		:rtype:     tuple
+		"""
+
+		return parseContainerList(items, course_name, file_path, self.base_url, self._parseDate)
+
+
+	def _startParseProcesses(self):
+		"""
+		Starts the worker processes parsing the pages if 'parse_processes'
+		is set. The processes are forked where possible, so the calling
+		script isn't imported again. Forking a process with running threads
+		may deadlock on locks held by them, so this has to be called before
+		the scan and download threads are started.
+		"""
+
+		if self.params['parse_processes'] <= 0 or self.parse_executor is not None:
+			return
+		import multiprocessing
+		from concurrent.futures import ProcessPoolExecutor
+		fork = 'fork' in multiprocessing.get_all_start_methods() and sys.platform != "darwin"
+		self.parse_executor = ProcessPoolExecutor(self.params['parse_processes'], 
+			mp_context=multiprocessing.get_context('fork' if fork else None))
+		# The pool forks all its processes on the first task, so that's
+		# done right away instead of from a scan thread
+		self.parse_executor.submit(int).result()
+
+
+	def _parsePage(self, fun, *args):
+		"""
+		Runs the parse function in a worker process if 'parse_processes' 
+		is set and in the calling thread otherwise. The time is recorded as
+		the stage 'parse'.
+		"""
+
+		with self.metrics.stage('parse'):
+			if self.parse_executor is not None:
+				return self.parse_executor.submit(fun, *args).result()
+			return fun(*args)
 
 
 	def scanFolder(self, course_name, url_to_scan):
 		"""
-		Scans a folder.
+		Scans a folder. If the page cache is enabled, the ContainerList of 
+		an unchanged folder isn't parsed again, its cached files and nested 
+		items are reused instead. Folders with videos are always fetched in
+		full, since the access tokens of the video urls expire.
 
 		:param      course_name:  The name of the course the folder belongs to
 		:type       course_name:  str
 		:param      url_to_scan:  The url to scan
 		:type       url_to_scan:  str
-		"""
 
+		:returns:   the nested items to scan next
+		:rtype:     list
+		"""
 
 		url = urljoin(self.base_url, url_to_scan)
-		soup = BeautifulSoup(self.session.get(url).content, "lxml")
-		file_path = course_name + "/" +  "/".join(soup.find("body").find("ol").text.split("\n")[4:-1]) + "/"
-		file_path = file_path.replace(":", " - ")
+		entry = self.page_cache.get(url) if self.page_cache else None
+		# A 304 would reuse the cached video urls with their expired tokens
+		r = self.session.get(url, headers=PageCache.conditionalHeaders(entry if entry and not entry['videos'] else None))
+		if entry and r.status_code == 304:
+			if not self.descend_unchanged:
+				return []
+			if self.params['verbose']:
+				print(f"Unchanged Folder...\n{entry['file_path']}\n{url}")
+				print("-------------------------------------------------")
+			for f in entry['videos'] + entry['files']:
+				self.addFile(f)
+			return entry['children']
+		if r.status_code >= 400:
+			# Failures left after the retries are reported by the crawler
+			from requests import HTTPError
+			raise HTTPError(f"HTTP {r.status_code}", response=r)
+		cached = (entry['fingerprint'], entry['file_path']) if entry else None
+		if self.parse_executor is not None:
+			page = self._parsePage(parseFolderPage, r.content, course_name, self.base_url, bool(self.page_cache), cached)
+		else:
+			with self.metrics.stage('parse'):
+				soup = strainFolderPage(r.content)
+			page = parseFolderSoup(soup, course_name, self.base_url, bool(self.page_cache), cached, self._parseDate)
+		file_path = page['file_path']
+		unchanged = page['files'] is None
+		# The fingerprint only covers the ContainerList, the videos are 
+		# compared by their media object ids (the urls carry tokens)
+		videos_changed = entry is not None and self._videoIds(page['videos']) != self._videoIds(entry['videos'])
+		if unchanged and not videos_changed and not self.descend_unchanged:
+			# Watch mode: the files and folders of an unchanged folder are known
+			return []
+		if not unchanged or videos_changed:
+			with self.watch_lock:
+				self.changed_pages[course_name] = self.changed_pages.get(course_name, 0) + 1
 		if self.params['verbose']:
 			print(f"Scanning Folder...\n{file_path}\n{url}")
 			print("-------------------------------------------------")
-		self.scanMediaContainer(course_name, file_path, soup)
-		self.scanContainerList(course_name, file_path, soup)
+		videos = self._addVideos(page['videos'])
+		if unchanged:
+			# Unchanged ContainerList
+			files, to_scan = entry['files'], entry['children']
+		else:
+			files, to_scan = page['files'], page['children']
+		if self.page_cache:
+			self.page_cache.put(url, r, page['fingerprint'], file_path, videos, files, to_scan)
+		if unchanged and not self.descend_unchanged:
+			# Watch mode: only the videos changed
+			return []
+		for f in files:
+			self.addFile(f)
+		return to_scan
+
+
+	def _videoIds(self, videos):
+		return sorted(extractRefId(v['url']) or v['name'] for v in videos)
 
 
 	def scanTaskUnit(self, course_name, url_to_scan):
@@ -345,35 +624,32 @@ class IliasDownloaderUniMA():
 		"""
 
 		url = urljoin(self.base_url, url_to_scan)
-		soup = BeautifulSoup(self.session.get(url).content, "lxml")
-		task_unit_name = soup.find("a", {"class" : "ilAccAnchor"}).text  
-		file_path = course_name + "/" + "Aufgaben/" + task_unit_name + "/"
-		file_path = file_path.replace(":", " - ")
-		task_items = soup.find("div", {"id":"infoscreen_section_1"}).find_all("div", "form-group")
+		content = self.session.get(url).content
+		page = self._parsePage(parseTaskUnitPage, content, course_name, self.base_url)
+		file_path = page['file_path']
 		if self.params['verbose']:
 			print(f"Scanning TaskUnit...\n{file_path}\n{url}")
 			print("-------------------------------------------------")
-		for i in task_items:
-			el_url = urljoin(self.base_url, i.find('a')['href'])
-			el_name = i.find("div", 'il_InfoScreenProperty').text
-			el_type = 'file'
-			file_mod_date = datetime.fromisoformat('2000-01-01')
-			file_size = math.nan
-			self.files += [{
-				'course': course_name,
-				'type': el_type,
-				'name': el_name,
-				'size': file_size,
-				'mod-date': file_mod_date,
-				'url': el_url,
-				'path': file_path
-			}]
-		# Now scan the submissions
-		if self.params['tutor_mode']:
-			self.scanTaskUnitSubmissions(course_name, file_path, soup)
+		for f in page['files']:
+			self.addFile(f)
+		# Now scan the submissions, a dry run doesn't request their zips
+		if self._requestsSubmissions():
+			self.scanTaskUnitSubmissions(course_name, file_path, page)
+
+
+	def _requestsSubmissions(self):
+		return self.params['tutor_mode'] and self.request_submissions and not self.params['dry_run']
 
 
-	def scanTaskUnitSubmissions(self, course_name, file_path, soup):
+	def scanTaskUnitSubmissions(self, course_name, file_path, page):
+		"""
+		Requests the zip of all submissions of a task unit whose deadline has
+		expired. ILIAS builds it as a background task, see 
+		parseBackgroundTasks().
+
+		:param      page:  The task unit, see parsing.parseTaskUnitPage()
+		:type       page:  dict
+		"""
 
 		form_data = {
 			'user_login': '',
@@ -381,19 +657,21 @@ class IliasDownloaderUniMA():
 		}
 
 		# Deadline finished?
-		deadline = soup.select_one('#infoscreen_section_2 > div:nth-child(2) > div.il_InfoScreenPropertyValue.col-xs-9').text
-		if (deadline_time := parsedate(deadline)) < datetime.now():
+		if page['deadline'] is None:
+			return
+		if (deadline_time := parseIliasDate(page['deadline'])) < datetime.now():
 			# Access to the submissions?
-			if (tab_grades := soup.select_one('#tab_grades > a')):
-				tab_grades_url = urljoin(self.base_url, tab_grades['href'])
-				submissions_soup = BeautifulSoup(self.session.get(tab_grades_url).content, "lxml")
+			if (tab_grades_url := page['grades_url']):
+				submissions_soup = makeSoup(self.session.get(tab_grades_url).content)
 				form_action_url = urljoin(self.base_url, submissions_soup.find('form', {'id': 'ilToolbar'})['action'])
 				# Post form data
 				r = self.session.post(form_action_url, data=form_data)
 				el_name = submissions_soup.select_one('#il_mhead_t_focus').text.replace("\n", "") + ".zip"
-				# Add backgroundtask file to list, we parse the download links
-				# later from the background tasks tab from the page header
-				self.background_task_files += [{
+				# Add backgroundtask file to the index, we parse the download
+				# links later from the background tasks tab from the page header
+				with self.background_lock:
+					# Task units of different courses may have the same name
+					self.background_task_files.setdefault(taskKey(el_name), []).append({
 						'course': course_name, 
 						'type': 'file',
 						'name': el_name,
@@ -401,44 +679,52 @@ class IliasDownloaderUniMA():
 						'mod-date': deadline_time,
 						#'url': dl_url,
 						'path': file_path
-					}]
+					})
 
 
 	def searchBackgroundTaskFile(self, el_name):
-		#
-		# TO DO: Cleanup!!!
-		#
-		for idx, f in enumerate(self.background_task_files):
-			f["name"] = f["name"].encode()
-			f["name"] = f["name"].replace('ü'.encode(), b'ue')
-			f["name"] = f["name"].replace('Ü'.encode(), b'Ue')
-			f["name"] = f["name"].replace('ä'.encode(), b'ae')
-			f["name"] = f["name"].replace('Ä'.encode(), b'Ae')
-			f["name"] = f["name"].replace('ö'.encode(), b'oe')
-			f["name"] = f["name"].replace('Ö'.encode(), b'Oe')
-			f["name"] = f["name"].replace('ß'.encode(), b'ss')
-			f["name"] = f["name"].decode('utf-8')
-			if f["name"] == el_name:
-				return self.background_task_files.pop(idx)
+		"""
+		Returns and removes the pending submissions zip matching the title
+		of a background task, or None.
 
+		:param      el_name:  The background task title (with ".zip")
+		:type       el_name:  str
 
-	def parseBackgroundTasks(self):
-		# time.sleep(5) # Not really needed?
-		# Reload ilias main page to parse the background tasks bar on the top
-		desktop_soup = BeautifulSoup(self.session.get(self.desktop_url).content, "lxml") 
-		tasks_tab_url = urljoin(self.base_url, desktop_soup.select_one('#mm_tb_background_tasks')['refresh-uri'])
-		tasks_tab_soup = BeautifulSoup(self.session.get(tasks_tab_url).content, "lxml")
+		:returns:   the file
+		:rtype:     dict
+		"""
+
+		key = taskKey(el_name)
+		with self.background_lock:
+			if not (pending := self.background_task_files.get(key)):
+				return None
+			if len(pending) == 1:
+				del self.background_task_files[key]
+			return pending.pop(0)
+
+
+	def _pollBackgroundTasks(self, tasks_tab_url):
+		"""
+		Fetches the background tasks tab once and adds the finished zips of
+		pending submissions to the downloads. The remove url of each task
+		is kept to clean it up once its zip has been downloaded.
+		"""
+
+		tasks_tab_soup = makeSoup(self.session.get(tasks_tab_url).content)
 		# Extract the items
 		for i in tasks_tab_soup.find_all('div', {'class': 'il-item-task'}):
-			# Extract the download url and the remove url
-			dl, rm = i.find_all('button', {'class': 'btn btn-default'})
-			dl_url = urljoin(self.base_url, dl['data-action'])
-			rm_url = urljoin(self.base_url, rm['data-action'])
-			self.background_tasks_to_clean.append(rm_url)
-			# Add file to downloads
+			# The download button appears once the zip has been built
+			if len(buttons := i.find_all('button', {'class': 'btn btn-default'})) < 2:
+				continue
+			dl, rm = buttons[:2]
 			el_name = i.find('div', {'class' : 'il-item-task-title'}).text.replace("\n", "") + ".zip"
 			if (bt := self.searchBackgroundTaskFile(el_name)): 
-				self.files += [{
+				dl_url = urljoin(self.base_url, dl['data-action'])
+				with self.background_lock:
+					self.background_tasks_to_clean[dl_url] = urljoin(self.base_url, rm['data-action'])
+					self.submission_urls.add(dl_url)
+				# Add file to downloads
+				self.addFile({
 					'course': bt['course'], 
 					'type': 'file',
 					'name': el_name,
@@ -446,7 +732,34 @@ class IliasDownloaderUniMA():
 					'mod-date': bt['mod-date'],
 					'url': dl_url,
 					'path': bt['path']
-				}]
+				})
+
+
+	def parseBackgroundTasks(self):
+		"""
+		Polls the background tasks tab until the submission zips of all task
+		units are built (or 'background_task_timeout' seconds have passed).
+		The polling interval doubles from 0.5 up to 10 seconds. Each finished
+		zip is downloaded right away by the download threads.
+		"""
+
+		# Reload ilias main page to parse the background tasks bar on the top
+		desktop_soup = makeSoup(self.session.get(self.desktop_url).content) 
+		tasks_tab_url = urljoin(self.base_url, desktop_soup.select_one('#mm_tb_background_tasks')['refresh-uri'])
+		deadline = time.monotonic() + self.params['background_task_timeout']
+		delay = 0.5
+		while True:
+			self._pollBackgroundTasks(tasks_tab_url)
+			if not self.background_task_files:
+				return
+			if (remaining := deadline - time.monotonic()) <= 0:
+				break
+			with self.metrics.stage('poll'):
+				time.sleep(min(delay, remaining))
+			delay = min(2 * delay, 10.0)
+		for bt in (bt for pending in self.background_task_files.values() for bt in pending):
+			print(f"The submissions {bt['course']}: {bt['name']} weren't ready in time")
+		self.background_task_files.clear()
 
 
 	def scanLernmaterial(self, course_name, url_to_scan):
@@ -454,28 +767,52 @@ class IliasDownloaderUniMA():
 		# ... to do ...
 
 
-	def scanHelper(self, course_name, el):
-		if len(self.to_scan) > 0:
-			self.to_scan.pop()
-		if el['type'] == "folder":
-			self.scanFolder(course_name, el['url'])
-		if el['type'] == "task":
-			self.scanTaskUnit(course_name, el['url'])
-		elif el['type'] == 'lernmaterialien':
-			self.scanLernmaterial(course_name, el['url'])
+	def scanHelper(self, el):
+		"""
+		Scans a single work item of the crawl. Each item carries the name 
+		of the course it belongs to.
+
+		:param      el:   The work item
+		:type       el:   dict
+
+		:returns:   the nested items to scan next
+		:rtype:     list
+		"""
+
+		course_name = el['course']
+		with self.metrics.course(course_name):
+			if el['type'] == "folder":
+				return self.scanFolder(course_name, el['url'])
+			elif el['type'] == "task":
+				return self.scanTaskUnit(course_name, el['url'])
+			elif el['type'] == 'lernmaterialien':
+				return self.scanLernmaterial(course_name, el['url'])
 
 
-	def searchForFiles(self, course_name):
+	def searchForFiles(self, course_name=None):
 		"""
-		Scans an ilias url and all nested subfolders for files
+		Scans all items inside the list 'to_scan' and all nested subfolders 
+		for files. The items of all courses are crawled together and each 
+		folder (identified by its ref id) is visited once.
 	
-		:param      arg:  url for the "dateien" folder
-		:type       arg:  str
+		:param      course_name:  The course name for items without one
+		:type       course_name:  str
+
+		:returns:   list of (item, exception) tuples for failed scans
+		:rtype:     list
 		"""
-		while len(self.to_scan) > 0:
-			results = ThreadPool(self.params['num_scan_threads']).imap_unordered(lambda x: self.scanHelper(course_name, x), self.to_scan)
-			for r in results:
-				pass
+
+		items, self.to_scan = self.to_scan, []
+		for el in items:
+			el.setdefault('course', course_name)
+		# asyncio is slow to import, so the crawler is loaded on first use
+		from .crawler import Crawler
+		crawler = Crawler(self.metrics.profiled(self.scanHelper), self.params['num_scan_threads'], 
+			host_limit=self.params['max_host_connections'])
+		errors = crawler.run(items)
+		for el, e in errors:
+			print(f"Couldn't scan {el['name']} ({el['url']}): {e!r}")
+		return errors
 
 	def addExternalScraper(self, scraper, *args):
 		self.external_scrapers.append({'fun' : scraper, 'args': args})
@@ -488,68 +825,788 @@ class IliasDownloaderUniMA():
 
 		for course in self.courses:
 			self.to_scan += [{
+				'course': course['name'],
 				'type' : 'folder', 
 				'name': course['name'], 
 				'url': course['url']
 			}]
-			print(f"Scanning {course['name']} with {self.params['num_scan_threads']} Threads....")
-			self.searchForFiles(course['name'])
+		print(f"Scanning {len(self.courses)} courses with {self.params['num_scan_threads']} Threads....")
+		if self.params['page_cache'] and self.page_cache is None:
+			self.page_cache = PageCache(os.path.join(self.params['download_path'], self.state_file))
+		self._startParseProcesses()
+		try:
+			self.searchForFiles()
+		finally:
+			if self.parse_executor is not None:
+				self.parse_executor.shutdown()
+				self.parse_executor = None
+		if self.page_cache:
+			self.page_cache.commit()
+		with self.probe_lock:
+			if self.probe_executor is not None:
+				self.probe_executor.shutdown()
+				self.probe_executor = None
 		# External Scrapers
 		for d in self.external_scrapers:
 			print(f"Scanning {d['args'][0]} with the external Scraper....")
-			self.files += d['fun'](*d['args'])
+			for f in d['fun'](*d['args']):
+				self.addFile(f)
 			
 			
+	def iterFiles(self):
+		"""
+		Scans all courses (see scanCourses()) in a background thread and 
+		yields the files as the crawl discovers them. A failed scan raises
+		its exception once the found files have been yielded. Together with
+		writeSnapshot() the scan is written to disk while it's running:
+
+			writeSnapshot("scan.jsonl", m.iterFiles())
+
+		In tutor mode the submissions aren't requested: the download url of
+		a submissions zip only lasts until its background task is removed.
+
+		:returns:   generator of the found files
+		:rtype:     FileRecord
+		"""
+
+		found = queue.Queue()
+		done = object()
+		errors = []
+		def scan():
+			try:
+				self.request_submissions = False
+				self.scanCourses()
+			except Exception as e:
+				errors.append(e)
+			finally:
+				self.request_submissions = True
+				found.put(done)
+		self.file_sinks.append(found.put)
+		self._startParseProcesses()
+		threading.Thread(target=scan, daemon=True).start()
+		try:
+			while (file := found.get()) is not done:
+				yield file
+		finally:
+			self.file_sinks.remove(found.put)
+		if errors:
+			raise errors[0]
+
+
+	def _makeDirs(self, path):
+		"""
+		Creates the directory path (once per run or poll, the user may have
+		deleted it in between) if it doesn't exist yet.
+		"""
+
+		with self.created_paths_lock:
+			if path in self.created_paths:
+				return
+		# Only remember the path once it exists, other threads might
+		# want to write into it right away
+		plPath(path).mkdir(parents=True, exist_ok=True)
+		with self.created_paths_lock:
+			self.created_paths.add(path)
+
+
+	def isUpToDate(self, file, file_dl_path, record=True):
+		"""
+		Checks whether the file already exists locally in its newest version.
+		The sync manifest is used if available, files deleted locally are
+		downloaded again. Files missing in the manifest (e.g. downloaded by
+		an older version) are checked by their mtime and recorded.
+
+		:param      file:          The file
+		:type       file:          dict
+		:param      file_dl_path:  The local path of the file
+		:type       file_dl_path:  str
+		:param      record:        Record files missing in the manifest
+		:type       record:        bool
+
+		:returns:   True if the file doesn't need to be downloaded
+		:rtype:     bool
+		"""
+
+		path = os.path.join(file['path'], file['name'])
+		if self.manifest is not None:
+			if self.manifest.get(path) is not None:
+				return self.manifest.isUpToDate(path, file) and os.path.exists(file_dl_path)
+		if os.path.exists(file_dl_path) and file['mod-date'].timestamp() < os.path.getmtime(file_dl_path):
+			if self.manifest is not None and record:
+				self.manifest.record(path, file)
+			return True
+		return False
+
+
+	def _partOffset(self, file, part_path):
+		"""
+		Returns the number of bytes of a partial download that can be 
+		resumed. Partial downloads older than the remote file are removed.
+		"""
+
+		if not os.path.exists(part_path):
+			return 0
+		if file['mod-date'].timestamp() > os.path.getmtime(part_path):
+			self._removePart(part_path)
+			return 0
+		return os.path.getsize(part_path)
+
+
+	def _removePart(self, part_path):
+		for path in (part_path, part_path + ".validator"):
+			if os.path.exists(path):
+				os.remove(path)
+
+
+	def _saveValidator(self, r, part_path):
+		"""
+		Stores the strong ETag (or else the Last-Modified date) of the 
+		response next to the partial download. A resume sends it as If-Range,
+		so a file changed in the meantime is downloaded completely instead
+		of being appended to the old bytes. Videos and the files of task 
+		units have no modification date that would reveal the change.
+		"""
+
+		etag = r.headers.get('ETag')
+		validator = etag if etag and not etag.startswith("W/") else r.headers.get('Last-Modified')
+		if validator:
+			with open(part_path + ".validator", 'w') as f:
+				f.write(validator)
+		elif os.path.exists(part_path + ".validator"):
+			os.remove(part_path + ".validator")
+
+
+	def _loadValidator(self, part_path):
+		try:
+			with open(part_path + ".validator") as f:
+				return f.read().strip() or None
+		except OSError:
+			return None
+
+
+	def _writeSegment(self, r, path, start):
+		"""
+		Writes the response body into the preallocated file at the 
+		position start.
+		"""
+
+		with open(path, 'r+b') as f:
+			f.seek(start)
+			self._writeChunks(r, f)
+
+
+	def _writeChunks(self, r, f, hasher=None):
+		"""
+		Writes the streamed response body to f and updates the hasher (if 
+		given) with it. Each chunk passes the shared bandwidth limiter. The
+		time spent receiving, writing and waiting for the bandwidth limit is
+		recorded as the stages 'receive', 'write' and 'throttle'.
+		"""
+
+		write_time, throttle_time, nbytes = 0.0, 0.0, 0
+		start = time.perf_counter()
+		for chunk in r.iter_content(chunk_size=self.chunk_size):
+			t = time.perf_counter()
+			f.write(chunk)
+			if hasher is not None:
+				hasher.update(chunk)
+			write_time += time.perf_counter() - t
+			nbytes += len(chunk)
+			throttle_time += self.bandwidth.consume(len(chunk))
+		self.metrics.addStage('receive', time.perf_counter() - start - write_time - throttle_time, nbytes)
+		self.metrics.addStage('write', write_time, nbytes)
+		if throttle_time:
+			self.metrics.addStage('throttle', throttle_time, nbytes)
+		self.metrics.count('bytes', n=nbytes)
+
+
+	def _fetchSegment(self, url, path, start, end):
+		"""
+		Downloads the byte range [start, end] of the file into the 
+		preallocated file.
+		"""
+
+		r = self.session.get(url, stream=True, headers={'Range': f"bytes={start}-{end}"})
+		if r.status_code != 206 or not r.headers.get('Content-Range', '').startswith(f"bytes {start}-"):
+			from requests import ConnectionError
+			raise ConnectionError(f"Range request for bytes {start}-{end} failed ({r.status_code})")
+		self._writeSegment(r, path, start)
+
+
+	def _downloadSegmented(self, file, file_dl_path):
+		"""
+		Downloads a large file in 'num_segments' byte ranges in parallel.
+		The ranges are written into a preallocated '<name>.seg.part' file.
+
+		:returns:   the response of the first range if the server ignored 
+		            the Range header, None otherwise
+		:rtype:     requests.Response
+		"""
+
+		seg_path = file_dl_path + ".seg.part"
+		num_segments = self.params['num_segments']
+		seg_len = math.ceil(file['size'] * 1e6 / num_segments)
+		r = self.session.get(file['url'], stream=True, headers={'Range': f"bytes=0-{seg_len - 1}"})
+		if r.status_code != 206:
+			return r
+		if not (match := re.match(r"bytes 0-(\d+)/(\d+)", r.headers.get('Content-Range', ''))):
+			r.close()
+			return self.session.get(file['url'], stream=True)
+		first_end, total = int(match.group(1)), int(match.group(2))
+		# Split the remaining bytes into the other segments
+		bounds = [first_end + 1 + math.ceil(k * (total - first_end - 1) / (num_segments - 1)) for k in range(num_segments)]
+		ranges = [(start, end - 1) for start, end in zip(bounds, bounds[1:]) if start < end]
+		self._makeDirs(os.path.dirname(file_dl_path))
+		print(f"Downloading {file['course']}: {file['name']} ({file['size']:.1f} MB, {len(ranges) + 1} segments)...")
+		with open(seg_path, 'wb') as f:
+			f.truncate(total)
+		with ThreadPoolExecutor(max(1, len(ranges))) as executor:
+			futures = [executor.submit(self.metrics.bind(self._fetchSegment), file['url'], seg_path, start, end) for start, end in ranges]
+			self._writeSegment(r, seg_path, 0)
+			for future in futures:
+				future.result()
+		os.replace(seg_path, file_dl_path)
+		self._recordDownload(file, file_dl_path)
+
+
+	def _hashFile(self, path):
+		hasher = hashlib.sha256()
+		with open(path, 'rb') as f:
+			while (block := f.read(16 * self.chunk_size)):
+				hasher.update(block)
+		return hasher
+
+
+	def _linkFile(self, src, nbytes, dst):
+		"""
+		Replaces dst by a hardlink to src, if src still has nbytes bytes.
+
+		:returns:   True if the file was linked
+		:rtype:     bool
+		"""
+
+		tmp_path = dst + ".link"
+		try:
+			if os.path.getsize(src) != nbytes:
+				return False
+			self._makeDirs(os.path.dirname(dst))
+			if os.path.lexists(tmp_path):
+				os.remove(tmp_path)
+			os.link(src, tmp_path)
+			os.replace(tmp_path, dst)
+		except OSError:
+			# e.g. the file system doesn't support hardlinks
+			return False
+		return True
+
+
+	def _linkCopy(self, file, file_dl_path):
+		"""
+		Links the file to an already downloaded copy with the same ilias id, 
+		size and modification date instead of downloading it again.
+
+		:returns:   True if the file was linked
+		:rtype:     bool
+		"""
+
+		path = os.path.join(file['path'], file['name'])
+		if self.manifest is None or (copy := self.manifest.findCopy(file)) is None:
+			return False
+		src, entry = copy
+		if src == path or not self._linkFile(os.path.join(self.params['download_path'], src), entry['nbytes'], file_dl_path):
+			return False
+		print(f"Linking {file['course']}: {file['name']} to {src}...")
+		self.metrics.count('linked', file['course'])
+		self.metrics.count('saved', file['course'], entry['nbytes'])
+		self.metrics.count('not_downloaded', file['course'], entry['nbytes'])
+		self.manifest.record(path, file, entry['sha256'], entry['nbytes'])
+		return True
+
+
+	def _recordDownload(self, file, file_dl_path, hasher=None):
+		"""
+		Records a completed download. With deduplication, the sha256 of the 
+		content is recorded as well (computed while streaming or from the 
+		file if it was resumed or downloaded in segments) and the file is 
+		replaced by a hardlink if an identical file was downloaded before.
+		"""
+
+		self.metrics.count('downloads', file['course'])
+		if self.manifest is None:
+			return
+		path = os.path.join(file['path'], file['name'])
+		sha256 = nbytes = None
+		if self.params['deduplicate']:
+			sha256 = (hasher or self._hashFile(file_dl_path)).hexdigest()
+			nbytes = os.path.getsize(file_dl_path)
+			if (src := self.manifest.findHash(sha256, nbytes)) is not None and src != path \
+				and self._linkFile(os.path.join(self.params['download_path'], src), nbytes, file_dl_path):
+				if self.params['verbose']:
+					print(f"{file['course']}: {file['name']} is identical to {src}, linked")
+				self.metrics.count('linked', file['course'])
+				self.metrics.count('saved', file['course'], nbytes)
+		self.manifest.record(path, file, sha256, nbytes)
+
+
+	def _extractsSubmissions(self, file):
+		return self.params['extract_submissions'] and file['url'] in self.submission_urls
+
+
+	def _extractSubmissions(self, file, zip_path):
+		"""
+		Extracts a downloaded submissions zip into '<course>/Aufgaben/<unit>/
+		<student>/' and removes the zip. The folder named after the task unit
+		inside the zip is dropped. Entries recorded in the manifest with the
+		same CRC and size that still exist locally aren't written again.
+		"""
+
+		from zipfile import ZipFile, BadZipFile
+		written = unchanged = 0
+		try:
+			with ZipFile(zip_path) as z, self.metrics.stage('extract') as st:
+				# Zips written on Windows may separate the names by backslashes
+				entries = [(info, [p for p in re.split(r"[\\/]", info.filename) if p not in ("", ".", "..")])
+					for info in z.infolist() if not info.is_dir()]
+				entries = [(info, parts) for info, parts in entries if parts]
+				if len({tuple(parts[:1]) for _, parts in entries}) == 1 and all(len(parts) > 1 for _, parts in entries):
+					entries = [(info, parts[1:]) for info, parts in entries]
+				for info, parts in entries:
+					path = os.path.join(file['path'], *parts)
+					dl_path = os.path.join(self.params['download_path'], path)
+					if self.manifest.isExtracted(path, info.CRC, info.file_size) and os.path.exists(dl_path):
+						unchanged += 1
+						continue
+					self._makeDirs(os.path.dirname(dl_path))
+					with z.open(info) as src, open(dl_path + ".part", 'wb') as dst:
+						while (chunk := src.read(self.chunk_size)):
+							dst.write(chunk)
+					os.replace(dl_path + ".part", dl_path)
+					self.manifest.recordExtracted(path, info.CRC, info.file_size)
+					st['bytes'] += info.file_size
+					written += 1
+		except (BadZipFile, OSError) as e:
+			print(f"Couldn't extract {file['course']}: {file['name']}: {e!r}")
+			return
+		os.remove(zip_path)
+		print(f"Extracted {file['course']}: {file['name']} ({written} new or changed, {unchanged} unchanged files)")
+
+
 	def downloadFile(self, file):
 		"""
-		Downloads a file.
+		Downloads a file. The file is written to '<name>.part' and renamed
+		once it's complete. An existing '.part' file is resumed by a HTTP 
+		Range request if the server supports it and the file didn't change
+		(If-Range, see _saveValidator()). Files larger than 
+		'segment_threshold' MB are downloaded in parallel byte ranges. With
+		deduplication, files already downloaded elsewhere are hardlinked.
+		With 'extract_submissions', submission zips are downloaded on every
+		run and extracted, see _extractSubmissions().
 	
 		:param      file:  The file we want do download
 		:type       file:  dict
 	
-		:returns:   { description_of_the_return_value }
-		:rtype:     { return_type_description }
+		:returns:   the error if the download failed (after 'max_retries'
+		            retries of a broken transfer), None otherwise
+		:rtype:     OSError
 		"""
 
 		file_dl_path = os.path.join(self.params['download_path'],file['path'], file['name'])
-		file_mod_date = file['mod-date'].timestamp()
-		size = file['size']
+		extract = self._extractsSubmissions(file)
 		# Does the file already exists locally and is the newest version?
-		if os.path.exists(file_dl_path) and file_mod_date < os.path.getmtime(file_dl_path):
+		if not extract and self.isUpToDate(file, file_dl_path):
+			return
+		elif self.params['deduplicate'] and self._linkCopy(file, file_dl_path):
 			return
 		else:
-			# Download the file
-			r = self.session.get(file['url'], stream=True)
-			if r.status_code == 200:
+			# Download the file, the zip of the submissions is built anew.
+			# A transfer broken off by the network is retried and resumed
+			from requests import ConnectionError, Timeout
+			from requests.exceptions import ChunkedEncodingError
+			attempt = 0
+			while True:
 				try:
-					with open(file_dl_path, 'wb') as f:
-						print(f"Downloading {file['course']}: {file['name']} ({size:.1f} MB)...")
-						shutil.copyfileobj(r.raw, f)
-				except Exception as e:
+					return self._transfer(file, file_dl_path, extract)
+				except (ConnectionError, ChunkedEncodingError, Timeout) as e:
+					if attempt >= self.params['max_retries']:
+						return e
+					print(f"Download of {file['course']}: {file['name']} failed ({e!r}), retrying...")
+				except OSError as e:
 					return e
+				with self.metrics.stage('retry'):
+					time.sleep(backoffDelay(attempt))
+				attempt += 1
 
 
-	def downloadAllFiles(self):
+	def _transfer(self, file, file_dl_path, extract):
 		"""
-		Downloads all files inside the instance's files list.
+		Transfers the file into '<name>.part' (resuming it if possible) and
+		renames it once it's complete, see downloadFile().
+
+		:raises     OSError:  if the transfer or writing the file failed
 		"""
 
+		part_path = file_dl_path + ".part"
+		size = file['size']
+		offset = 0 if extract else self._partOffset(file, part_path)
+		r = None
+		if offset == 0 and self.params['num_segments'] > 1 and size >= self.params['segment_threshold'] > 0:
+			if (r := self._downloadSegmented(file, file_dl_path)) is None:
+				return
+		if r is None:
+			headers = {'Range': f"bytes={offset}-"} if offset else {}
+			if offset and (validator := self._loadValidator(part_path)):
+				headers['If-Range'] = validator
+			r = self.session.get(file['url'], stream=True, headers=headers)
+		if r.status_code == 416:
+			r.close()
+			if re.fullmatch(rf"bytes \*/{offset}", r.headers.get('Content-Range', '')):
+				# The partial download is already complete
+				os.replace(part_path, file_dl_path)
+				self._removePart(part_path)
+				self._recordDownload(file, file_dl_path)
+				return
+			# The partial download is broken, start again
+			self._removePart(part_path)
+			offset = 0
+			r = self.session.get(file['url'], stream=True)
+		if r.status_code == 206 and offset and r.headers.get('Content-Range', '').startswith(f"bytes {offset}-"):
+			mode = 'ab'
+		elif r.status_code == 200:
+			mode, offset = 'wb', 0
+		else:
+			print(f"Couldn't download {file['course']}: {file['name']} (HTTP {r.status_code})")
+			return
+		self._makeDirs(os.path.dirname(file_dl_path))
+		# The hash of a resumed download is computed from the file
+		hasher = hashlib.sha256() if self.params['deduplicate'] and not offset else None
+		with open(part_path, mode) as f:
+			if offset:
+				print(f"Resuming {file['course']}: {file['name']} ({size:.1f} MB)...")
+			else:
+				self._saveValidator(r, part_path)
+				print(f"Downloading {file['course']}: {file['name']} ({size:.1f} MB)...")
+			self._writeChunks(r, f, hasher)
+		os.replace(part_path, file_dl_path)
+		self._removePart(part_path)
+		if extract:
+			self.metrics.count('downloads', file['course'])
+			self._extractSubmissions(file, file_dl_path)
+		else:
+			self._recordDownload(file, file_dl_path, hasher)
+
+
+	def _planFile(self, file, record=True):
+		"""
+		Returns what downloadFile() would do with the file and the number 
+		of bytes it would transfer (None if the size is unknown), without 
+		touching the local files.
+		"""
+
+		file_dl_path = os.path.join(self.params['download_path'], file['path'], file['name'])
+		if self._extractsSubmissions(file):
+			return 'download', None
+		if self.isUpToDate(file, file_dl_path, record):
+			return 'skip', 0
+		if self.params['deduplicate'] and self.manifest is not None \
+			and (copy := self.manifest.findCopy(file)) is not None \
+			and copy[0] != os.path.join(file['path'], file['name']) \
+			and os.path.exists(os.path.join(self.params['download_path'], copy[0])):
+			return 'link', 0
+		nbytes = None if (size := knownSize(file)) is None else round(size * 1e6)
+		part_path = file_dl_path + ".part"
+		if os.path.exists(part_path) and file['mod-date'].timestamp() <= os.path.getmtime(part_path):
+			return 'resume', None if nbytes is None else max(0, nbytes - os.path.getsize(part_path))
+		return 'download', nbytes
+
+
+	def planDownloads(self):
+		"""
+		Computes for all found files (see scanCourses()) whether they will
+		be downloaded, resumed, linked or skipped and how many bytes will be
+		transferred. In a dry run the manifest isn't updated.
+
+		:returns:   the plan, see DownloadPlan.report() for the totals per course
+		:rtype:     DownloadPlan
+		"""
+
+		self._openManifest()
+		plan = DownloadPlan()
+		for file in self.files:
+			plan.add(file, *self._planFile(file, record=not self.params['dry_run']))
+		return plan
+
+
+	def _openManifest(self):
+		if self.manifest is None:
+			self.manifest = SyncManifest(os.path.join(self.params['download_path'], self.state_file))
+
+
+	def _scanAll(self):
 		# Scan all files
 		self.scanCourses()
-		if self.params['tutor_mode']:
+		if self._requestsSubmissions():
 			# Parse the background tasks, i.e. add them to the download files
 			self.parseBackgroundTasks()
-		# Check the file paths
-		paths = list(set([os.path.join(self.params['download_path'],f['path']) for f in self.files]))
-		for p in paths:
-			if not plPath(p).exists():
-				plPath(p).mkdir(parents=True, exist_ok=True)
-		# Download all files
-		for r in ThreadPool(self.params['num_download_threads']).imap_unordered(self.downloadFile, self.files):
-			pass
-		# Clean the background tasks tab
-		if self.params['tutor_mode']:
+
+
+	def _cleanBackgroundTask(self, url):
+		"""
+		Removes the background task whose zip has the download url, if any.
+		"""
+
+		with self.background_lock:
+			rm_url = self.background_tasks_to_clean.pop(url, None)
+			self.submission_urls.discard(url)
+		if rm_url is not None:
+			self.session.get(rm_url)
+
+
+	def _cleanBackgroundTasks(self):
+		# Clean the background tasks whose zips weren't downloaded (e.g. in
+		# a dry run), the others were removed after their download
+		if self.params['tutor_mode'] and self.background_tasks_to_clean:
 			if self.params['verbose']:
 				print("Tutor mode. Cleaning the background tasks...")
-			for r in ThreadPool(self.params['num_download_threads']).imap_unordered(lambda x: self.session.get(x), self.background_tasks_to_clean):
-				pass
+			with ThreadPoolExecutor(self.params['num_download_threads']) as executor:
+				list(executor.map(self._cleanBackgroundTask, list(self.background_tasks_to_clean)))
+
+
+	def _downloadWorker(self):
+		"""
+		Downloads the files from the download queue until it receives None.
+		"""
+
+		while (file := self.download_queue.get()) is not None:
+			try:
+				with self.download_limiter.slot(), self.metrics.course(file['course']):
+					if (error := self.downloadFile(file)) is not None:
+						print(f"Couldn't download {file['course']}: {file['name']}: {error!r}")
+						self.metrics.count('failed', file['course'])
+				# The request removing the task needs a slot of its own, so
+				# it's sent once the slot of the download has been released
+				self._cleanBackgroundTask(file['url'])
+			except Exception as e:
+				print(f"Couldn't download {file['course']}: {file['name']}: {e!r}")
+				self.metrics.count('failed', file['course'])
+
+
+	def _prepareDownloads(self):
+		# The thread parameters might have been changed after the login
+		self.limiter.setMaximum(self._maxInFlight())
+		self.download_limiter.setMaximum(self.params['num_download_threads'])
+		self.bandwidth.configure(self.params['max_bandwidth'] * 1e6, parseSchedule(self.params['bandwidth_schedule']))
+		if self.adapters:
+			self._mountAdapters()
+			self.session.retries = self.params['max_retries']
+		self._openManifest()
+		with self.created_paths_lock:
+			self.created_paths.clear()
+
+
+	def _startDownloadWorkers(self):
+		self.download_queue = queue.Queue(self.params['download_queue_size'])
+		workers = [threading.Thread(target=self.metrics.profiled(self._downloadWorker), daemon=True) 
+			for _ in range(self.params['num_download_threads'])]
+		for w in workers:
+			w.start()
+		return workers
+
+
+	def _stopDownloadWorkers(self, workers):
+		# Wait for the remaining downloads
+		for w in workers:
+			self.download_queue.put(None)
+		for w in workers:
+			w.join()
+		self.download_queue = None
+		self.manifest.commit()
+
+
+	def _downloadAllFiles(self, snapshot=None):
+		self._prepareDownloads()
+		if snapshot is None:
+			# Before any threads are started, see _startParseProcesses()
+			self._startParseProcesses()
+		files = None
+		if snapshot is not None:
+			# Only the files of the snapshot, not those of an earlier scan
+			self.files = FileList()
+			for file in readSnapshot(snapshot) if isinstance(snapshot, (str, os.PathLike)) else snapshot:
+				self.addFile(file)
+		if snapshot is not None or self.params['dry_run'] or self.params['download_order'] != 'discovery':
+			# Scan everything first, then download in the planned order
+			if snapshot is None:
+				self._scanAll()
+			plan = self.planDownloads()
+			print(plan.report())
+			if self.params['dry_run']:
+				self._cleanBackgroundTasks()
+				return
+			files = plan.ordered(self.params['download_order'])
+		workers = self._startDownloadWorkers()
+		try:
+			if files is None:
+				self._scanAll()
+			else:
+				for file in files:
+					self.download_queue.put(file)
+		finally:
+			self._stopDownloadWorkers(workers)
+		self._cleanBackgroundTasks()
+
+
+	def downloadAllFiles(self, snapshot=None):
+		"""
+		Scans all courses and downloads all found files. Each file is
+		passed to the download threads as soon as it has been found, so
+		the downloads start while the courses are still being scanned.
+		With a 'download_order' other than 'discovery' (or a 'dry_run'),
+		all courses are scanned first and the download plan is printed,
+		then the files are downloaded in that order (or not at all).
+		A summary of the collected metrics is printed at the end. If the
+		parameter 'profile' is set, the run is profiled by cProfile and the
+		profile is written to '<download_path>/iliasdl.prof'.
+
+		:param      snapshot:  Download the files of a snapshot (a path, see
+		                       writeSnapshot(), or the files, e.g. from 
+		                       diffSnapshots()) instead of scanning
+		:type       snapshot:  str or iterable
+		"""
+
+		self.metrics.profiling = self.params['profile']
+		try:
+			self.metrics.profiled(self._downloadAllFiles)(snapshot)
+		finally:
+			self.metrics.profiling = False
+		for prefix, stats in self.connectionStats().items():
+			self.metrics.recordPool(prefix, stats['requests'], stats['connections'])
+		for key, value in self.limiter.stats().items():
+			self.metrics.setGauge(f"concurrency_{key}", value)
+		for key, value in self.download_limiter.stats().items():
+			self.metrics.setGauge(f"download_concurrency_{key}", value)
+		print(self.metrics.report())
+		if self.params['profile']:
+			profile_path = os.path.join(self.params['download_path'], "iliasdl.prof")
+			self.metrics.dumpProfile(profile_path)
+			print(f"Profile written to {profile_path}")
+
+
+	def _sessionValid(self):
+		return makeSoup(self.session.get(self.base_url).content).find("a", {'id' : 'mm_desktop'}) is not None
+
+
+	def _pollCourse(self, course, full, credentials=None):
+		"""
+		Crawls a course in watch mode. Unless full is set, the crawl only
+		descends into folders whose ContainerList changed. An expired 
+		session is renewed if the credentials are given.
+
+		:returns:   the number of changed folder pages
+		:rtype:     int
+		"""
+
+		with self.watch_lock:
+			before = self.changed_pages.get(course['name'], 0)
+		root = {'course': course['name'], 'type': 'folder', 'name': course['name'], 'url': course['url']}
+		self.files = FileList()
+		with self.created_paths_lock:
+			self.created_paths.clear()
+		self.descend_unchanged = full
+		try:
+			self.to_scan = [dict(root)]
+			if self.searchForFiles() and credentials is not None and not self._sessionValid():
+				print("The session has expired, logging in again...")
+				self.login(*credentials)
+				self.to_scan = [dict(root)]
+				self.searchForFiles()
+		finally:
+			self.descend_unchanged = True
+		if self.params['tutor_mode'] and self.background_task_files:
+			# Download the submission zips requested by this poll, their
+			# background tasks are removed after the download
+			self.parseBackgroundTasks()
+		self.page_cache.commit()
+		self.manifest.commit()
+		with self.watch_lock:
+			return self.changed_pages.get(course['name'], 0) - before
+
+
+	def watch(self, min_interval=300, max_interval=3600, full_rescan=86400, login_id=None, login_pw=None, max_polls=None):
+		"""
+		Watches the courses and downloads new and changed files right away,
+		until stopWatching() is called (or Ctrl+C). The first poll of a 
+		course crawls it completely. Later polls fetch the course page and
+		only descend into folders whose ContainerList changed (the page 
+		cache is always used), so a poll of an unchanged course costs a 
+		single request. Each course is polled again after min_interval if
+		it changed, otherwise its interval doubles up to max_interval. 
+		Every full_rescan seconds a course is crawled completely again to 
+		find changes deep inside unchanged folders. 'self.files' only holds
+		the files found by the last poll. In tutor mode, the submissions of
+		the task units found by a poll are requested and downloaded before
+		the next poll, see parseBackgroundTasks().
+
+		:param      min_interval:  The seconds between polls of a changing course
+		:type       min_interval:  float
+		:param      max_interval:  The max. seconds between polls of a course
+		:type       max_interval:  float
+		:param      full_rescan:   The seconds between full crawls of a course
+		:type       full_rescan:   float
+		:param      login_id:      The uni-id to log in again once the 
+		                           session has expired
+		:type       login_id:      str
+		:param      login_pw:      The password
+		:type       login_pw:      str
+		:param      max_polls:     Stop after this number of polls (None: never)
+		:type       max_polls:     int
+		"""
+
+		if self.page_cache is None:
+			self.page_cache = PageCache(os.path.join(self.params['download_path'], self.state_file))
+		credentials = (login_id, login_pw) if login_id is not None else None
+		courses = {c['name']: c for c in self.courses}
+		schedule = PollSchedule(list(courses), min_interval, max_interval, full_rescan=full_rescan)
+		print(f"Watching {len(courses)} courses...")
+		self._prepareDownloads()
+		workers = self._startDownloadWorkers()
+		self.watch_stop.clear()
+		polls = 0
+		try:
+			while courses and (max_polls is None or polls < max_polls):
+				name, due, full = schedule.next()
+				if self.watch_stop.wait(max(0.0, due - time.monotonic())):
+					break
+				changed = self._pollCourse(courses[name], full, credentials)
+				schedule.done(name, changed > 0, full)
+				polls += 1
+				if self.params['verbose']:
+					print(f"Polled {name} ({'full, ' if full else ''}{changed} changed folders), "
+						f"next poll in {schedule.intervals[name]:.0f} s")
+		except KeyboardInterrupt:
+			pass
+		finally:
+			self._stopDownloadWorkers(workers)
+			self._cleanBackgroundTasks()
+			self.page_cache.commit()
+
+
+	def stopWatching(self):
+		"""
+		Stops watch() (e.g. from another thread or a signal handler).
+		"""
+
+		self.watch_stop.set()
+
+
+	def exportMetrics(self, path):
+		"""
+		Writes the collected request and stage metrics to a file, as JSON if
+		the file name ends with '.json' and in the Prometheus text format
+		otherwise.
+
+		:param      path:  The file path
+		:type       path:  str
+		"""
+
+		with open(path, 'w') as f:
+			f.write(self.metrics.toJSON() if path.endswith(".json") else self.metrics.toPrometheus())
@@ -0,0 +1,167 @@
+#!/usr/bin/env python3
+
+from datetime import datetime
+from hashlib import sha1
+from .manifest import ref_id_pattern
+import json
+import sqlite3
+import threading
+
+
+def pageKey(url):
+	"""
+	Returns the cache key of a page, i.e. the ilias ref id if the url
+	contains one and the url otherwise.
+	"""
+
+	if (match := ref_id_pattern.search(url)):
+		return match.group(1)
+	return url
+
+
+def fingerprintContainerList(items):
+	"""
+	Computes a fingerprint of the ContainerList items of a page. Only the
+	links and the visible text (names, sizes, dates) are taken into account.
+
+	:param      items:  The il_ContainerListItem divs
+	:type       items:  list
+
+	:returns:   the hex digest
+	:rtype:     str
+	"""
+
+	h = sha1()
+	for i in items:
+		if (subitem := i.find('a', href=True)):
+			h.update(subitem['href'].encode())
+		h.update(i.get_text("|", strip=True).encode())
+		h.update(b"\0")
+	return h.hexdigest()
+
+
+def encodeFiles(files):
+	return json.dumps([dict(f, **{'mod-date': f['mod-date'].isoformat()}) for f in files])
+
+
+def decodeFiles(data):
+	return [dict(f, **{'mod-date': datetime.fromisoformat(f['mod-date'])}) for f in json.loads(data)]
+
+
+class PageCache():
+	"""
+	Persistent cache for scanned folder pages. For each page it stores the
+	response validators (ETag/Last-Modified), a fingerprint of the parsed
+	ContainerList and the extracted files and child items. New entries are
+	written in batches.
+	"""
+
+	def __init__(self, path, batch_size=50):
+		"""
+		Opens (or creates) the cache database.
+
+		:param      path:        The path of the sqlite database
+		:type       path:        str
+		:param      batch_size:  The number of entries written at once
+		:type       batch_size:  int
+		"""
+
+		self.lock = threading.Lock()
+		self.batch_size = batch_size
+		self.pending = []
+		self.db = sqlite3.connect(path, timeout=30, check_same_thread=False)
+		self.db.execute("PRAGMA journal_mode=WAL")
+		self.db.execute("CREATE TABLE IF NOT EXISTS pages ("
+			"key TEXT PRIMARY KEY, etag TEXT, last_modified TEXT, "
+			"fingerprint TEXT, file_path TEXT, videos TEXT, files TEXT, children TEXT)")
+		self.db.commit()
+
+
+	def get(self, url):
+		"""
+		Returns the cache entry of a page or None.
+
+		:param      url:  The page url
+		:type       url:  str
+
+		:returns:   the cache entry
+		:rtype:     dict
+		"""
+
+		with self.lock:
+			row = self.db.execute("SELECT etag, last_modified, fingerprint, file_path, "
+				"videos, files, children FROM pages WHERE key = ?", (pageKey(url),)).fetchone()
+		if row is None:
+			return None
+		return {
+			'etag': row[0],
+			'last-modified': row[1],
+			'fingerprint': row[2],
+			'file_path': row[3],
+			'videos': decodeFiles(row[4]),
+			'files': decodeFiles(row[5]),
+			'children': json.loads(row[6])
+		}
+
+
+	def put(self, url, response, fingerprint, file_path, videos, files, children):
+		"""
+		Stores the scan results of a page.
+
+		:param      url:          The page url
+		:type       url:          str
+		:param      response:     The response of the page request
+		:type       response:     requests.Response
+		:param      fingerprint:  The ContainerList fingerprint
+		:type       fingerprint:  str
+		:param      file_path:    The local path of the folder
+		:type       file_path:    str
+		:param      videos:       The files found in the MediaContainers
+		:type       videos:       list
+		:param      files:        The files found in the ContainerList
+		:type       files:        list
+		:param      children:     The nested items to scan
+		:type       children:     list
+		"""
+
+		row = (pageKey(url), response.headers.get('ETag'), response.headers.get('Last-Modified'),
+			fingerprint, file_path, encodeFiles(videos), encodeFiles(files), json.dumps(children))
+		with self.lock:
+			self.pending.append(row)
+			if len(self.pending) >= self.batch_size:
+				self._write()
+
+
+	@staticmethod
+	def conditionalHeaders(entry):
+		"""
+		Returns the headers for a conditional GET of a cached page.
+		"""
+
+		headers = {}
+		if entry and entry['etag']:
+			headers['If-None-Match'] = entry['etag']
+		if entry and entry['last-modified']:
+			headers['If-Modified-Since'] = entry['last-modified']
+		return headers
+
+
+	def _write(self):
+		with self.db:
+			self.db.executemany("INSERT OR REPLACE INTO pages VALUES (?, ?, ?, ?, ?, ?, ?, ?)", self.pending)
+		self.pending = []
+
+
+	def commit(self):
+		"""
+		Writes all pending entries.
+		"""
+
+		with self.lock:
+			self._write()
+
+
+	def close(self):
+		with self.lock:
+			self._write()
+			self.db.close()
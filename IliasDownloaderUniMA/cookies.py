@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+
+from base64 import urlsafe_b64encode, b64encode, b64decode
+import hashlib
+import json
+import os
+
+kdf_iterations = 200000
+
+
+def available():
+	"""
+	Returns True if the cookie jar can be encrypted, i.e. the optional
+	dependency cryptography is installed (pip install 
+	IliasDownloaderUniMA[session]).
+	"""
+
+	try:
+		import cryptography.fernet
+	except ImportError:
+		return False
+	return True
+
+
+def _fernet(secret, salt):
+	from cryptography.fernet import Fernet
+	key = hashlib.pbkdf2_hmac('sha256', secret.encode(), salt, kdf_iterations, dklen=32)
+	return Fernet(urlsafe_b64encode(key))
+
+
+def saveCookies(path, cookies, secret):
+	"""
+	Encrypts the cookies with a key derived from the secret and writes
+	them to path (readable by the user only).
+
+	:param      path:     The file path
+	:type       path:     str
+	:param      cookies:  The cookie jar
+	:type       cookies:  requests.cookies.RequestsCookieJar
+	:param      secret:   The secret, e.g. the login credentials
+	:type       secret:   str
+	"""
+
+	data = json.dumps([{
+		'name': c.name,
+		'value': c.value,
+		'domain': c.domain,
+		'path': c.path,
+		'secure': c.secure,
+		'expires': c.expires
+	} for c in cookies]).encode()
+	salt = os.urandom(16)
+	content = json.dumps({
+		'salt': b64encode(salt).decode(),
+		'token': _fernet(secret, salt).encrypt(data).decode()
+	})
+	tmp_path = path + ".tmp"
+	fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+	with os.fdopen(fd, 'w') as f:
+		f.write(content)
+	os.replace(tmp_path, path)
+
+
+def loadCookies(path, cookies, secret):
+	"""
+	Decrypts the cookies stored in path and adds them to the cookie jar.
+
+	:param      path:     The file path
+	:type       path:     str
+	:param      cookies:  The cookie jar
+	:type       cookies:  requests.cookies.RequestsCookieJar
+	:param      secret:   The secret the cookies were encrypted with
+	:type       secret:   str
+
+	:returns:   True if the cookies were restored, False if there are none
+	            or they can't be decrypted (e.g. the password changed)
+	:rtype:     bool
+	"""
+
+	from cryptography.fernet import InvalidToken
+	try:
+		with open(path) as f:
+			content = json.load(f)
+		data = _fernet(secret, b64decode(content['salt'])).decrypt(content['token'].encode())
+	except (OSError, ValueError, KeyError, InvalidToken):
+		return False
+	for c in json.loads(data):
+		cookies.set(c['name'], c['value'], domain=c['domain'], path=c['path'],
+			secure=c['secure'], expires=c['expires'])
+	return True
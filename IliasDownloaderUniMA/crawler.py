@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlparse
+from .manifest import ref_id_pattern
+import asyncio
+
+
+def crawlKey(item):
+	"""
+	Returns the key used to detect duplicate visits of a work item, i.e.
+	the ilias ref id if the url contains one and the url otherwise.
+
+	:param      item:  The work item
+	:type       item:  dict
+
+	:returns:   the ref id or the url
+	:rtype:     str
+	"""
+
+	if (match := ref_id_pattern.search(item['url'])):
+		return match.group(1)
+	return item['url']
+
+
+class Crawler():
+	"""
+	Asyncio based crawl engine. A fixed number of workers take items from
+	a shared work queue and hand them to the blocking scan function, which
+	runs inside a thread pool and returns the child items to crawl next.
+	Every key is visited at most once and the number of concurrent scans
+	per host can be capped.
+	"""
+
+	def __init__(self, scan, num_workers=5, key=crawlKey, host_limit=None):
+		"""
+		Constructs a new instance.
+
+		:param      scan:         Blocking function item -> list of child items
+		:type       scan:         callable
+		:param      num_workers:  The number of concurrent workers
+		:type       num_workers:  int
+		:param      key:          Function item -> key for duplicate detection
+		:type       key:          callable
+		:param      host_limit:   Max. concurrent scans per host (None: no cap)
+		:type       host_limit:   int
+		"""
+
+		self.scan = scan
+		self.num_workers = max(1, num_workers)
+		self.key = key
+		self.host_limit = host_limit
+		self.host_semaphores = {}
+		self.visited = set()
+		self.errors = []
+
+
+	def run(self, items):
+		"""
+		Crawls the given items and all items discovered from them.
+
+		:param      items:  The start items
+		:type       items:  list
+
+		:returns:   list of (item, exception) tuples for failed scans
+		:rtype:     list
+		"""
+
+		asyncio.run(self._crawl(items))
+		return self.errors
+
+
+	def _enqueue(self, queue, item):
+		if (key := self.key(item)) not in self.visited:
+			self.visited.add(key)
+			queue.put_nowait(item)
+
+
+	def _hostSemaphore(self, item):
+		host = urlparse(item['url']).netloc
+		if host not in self.host_semaphores:
+			self.host_semaphores[host] = asyncio.Semaphore(self.host_limit)
+		return self.host_semaphores[host]
+
+
+	async def _scan(self, loop, executor, item):
+		if self.host_limit:
+			async with self._hostSemaphore(item):
+				return await loop.run_in_executor(executor, self.scan, item)
+		return await loop.run_in_executor(executor, self.scan, item)
+
+
+	async def _crawl(self, items):
+		loop = asyncio.get_running_loop()
+		queue = asyncio.Queue()
+		for item in items:
+			self._enqueue(queue, item)
+		with ThreadPoolExecutor(self.num_workers) as executor:
+			workers = [asyncio.ensure_future(self._worker(loop, executor, queue))
+				for _ in range(self.num_workers)]
+			try:
+				await queue.join()
+			finally:
+				for w in workers:
+					w.cancel()
+				await asyncio.gather(*workers, return_exceptions=True)
+
+
+	async def _worker(self, loop, executor, queue):
+		while True:
+			item = await queue.get()
+			try:
+				children = await self._scan(loop, executor, item)
+				for child in children or []:
+					self._enqueue(queue, child)
+			except Exception as e:
+				self.errors.append((item, e))
+			finally:
+				queue.task_done()
@@ -0,0 +1,64 @@
+#!/usr/bin/env python3
+
+from datetime import datetime, date, timedelta
+from functools import lru_cache
+import re
+
+months = {
+	'jan': 1, 'feb': 2, 'mär': 3, 'mae': 3, 'mrz': 3, 'mar': 3, 'apr': 4,
+	'mai': 5, 'may': 5, 'jun': 6, 'jul': 7, 'aug': 8, 'sep': 9, 'okt': 10,
+	'oct': 10, 'nov': 11, 'dez': 12, 'dec': 12
+}
+
+relative_days = {
+	'heute': 0, 'today': 0, 'gestern': -1, 'yesterday': -1, 'morgen': 1, 'tomorrow': 1
+}
+
+# e.g. "17. Sep 2020, 14:59" or "Montag, 12. Oktober 2020, 09:30"
+absolute_pattern = re.compile(r"(?:[^\d,]+,\s*)?(\d{1,2})\.\s*([^\W\d_]+)\.?\s+(\d{4}),?\s+(\d{1,2}):(\d{2})")
+# e.g. "Heute, 10:15" or "Yesterday, 09:30"
+relative_pattern = re.compile(r"([^\W\d_]+),\s*(\d{1,2}):(\d{2})")
+
+
+@lru_cache(maxsize=4096)
+def _parseDateText(text):
+	"""
+	Parses the normalized date text. Relative dates are returned as day
+	offset, so the cached result stays valid after midnight. Unknown formats
+	return None.
+	"""
+
+	if (match := absolute_pattern.fullmatch(text)):
+		day, month, year, hour, minute = match.groups()
+		if (month := months.get(month[:3].lower())):
+			return datetime(int(year), month, int(day), int(hour), int(minute))
+	if (match := relative_pattern.fullmatch(text)):
+		if (offset := relative_days.get(match.group(1).lower())) is not None:
+			return offset, int(match.group(2)), int(match.group(3))
+	return None
+
+
+def parseIliasDate(text):
+	"""
+	Parses the date formats used by ilias (german and english). The
+	results are cached and dateparser is only used as a fallback for
+	unknown formats. Its results aren't cached, since they may be relative
+	to now (e.g. "vor 5 Minuten").
+
+	:param      text:  The date text, e.g. "17. Sep 2020, 14:59"
+	:type       text:  str
+
+	:returns:   the date or None
+	:rtype:     datetime
+	"""
+
+	text = " ".join(text.split())
+	if (parsed := _parseDateText(text)) is None:
+		# dateparser is slow to import, so it's only loaded when needed
+		from dateparser import parse as parsedate
+		return parsedate(text)
+	if isinstance(parsed, datetime):
+		return parsed
+	offset, hour, minute = parsed
+	day = date.today() + timedelta(days=offset)
+	return datetime(day.year, day.month, day.day, hour, minute)
@@ -0,0 +1,292 @@
+#!/usr/bin/env python3
+
+from datetime import datetime
+import math
+import re
+import sqlite3
+import threading
+
+ref_id_pattern = re.compile(r"ref_id=(\d+)")
+
+ref_patterns = [
+	re.compile(r"target=(file_\d+)"),
+	re.compile(r"mobs/(mm_\d+)/"),
+	ref_id_pattern
+]
+
+
+def extractRefId(url):
+	"""
+	Extracts the ilias id of a file from its url, e.g. 'file_1234' for
+	files, 'mm_1234' for media objects (videos) or the ref id.
+
+	:param      url:  The file url
+	:type       url:  str
+
+	:returns:   the id or None
+	:rtype:     str
+	"""
+
+	for pattern in ref_patterns:
+		if (match := pattern.search(url)):
+			return match.group(1)
+	return None
+
+
+class SyncManifest():
+	"""
+	Persistent record of all completed downloads. Each entry stores the url,
+	the ilias id, the size and the remote modification date of a file, keyed
+	by its local path relative to the download path. All entries are loaded
+	once, so a lookup doesn't touch the filesystem. New entries are written
+	in batches. Additionally, the sizes of probed media objects (videos) are
+	stored by their mm_<id>. For deduplication, the sha256 and the number 
+	of bytes of a downloaded file can be recorded and looked up. The CRC
+	and size of files extracted from submission zips are stored by their
+	local path, so unchanged entries aren't extracted again.
+	"""
+
+	def __init__(self, path, batch_size=100):
+		"""
+		Opens (or creates) the manifest database.
+
+		:param      path:        The path of the sqlite database
+		:type       path:        str
+		:param      batch_size:  The number of entries written at once
+		:type       batch_size:  int
+		"""
+
+		self.lock = threading.Lock()
+		self.batch_size = batch_size
+		self.pending = []
+		self.pending_media = []
+		self.pending_archive = []
+		self.db = sqlite3.connect(path, timeout=30, check_same_thread=False)
+		self.db.execute("PRAGMA journal_mode=WAL")
+		self.db.execute("CREATE TABLE IF NOT EXISTS files ("
+			"path TEXT PRIMARY KEY, url TEXT, ref_id TEXT, size REAL, mod_date TEXT, sha256 TEXT, nbytes INTEGER)")
+		# Manifests of older versions don't have the dedup columns yet
+		columns = [row[1] for row in self.db.execute("PRAGMA table_info(files)")]
+		for column, column_type in [('sha256', "TEXT"), ('nbytes', "INTEGER")]:
+			if column not in columns:
+				self.db.execute(f"ALTER TABLE files ADD COLUMN {column} {column_type}")
+		self.db.execute("CREATE INDEX IF NOT EXISTS files_ref_id ON files (ref_id)")
+		self.db.execute("CREATE TABLE IF NOT EXISTS media (mob_id TEXT PRIMARY KEY, size REAL)")
+		self.db.execute("CREATE TABLE IF NOT EXISTS archive_entries (path TEXT PRIMARY KEY, crc INTEGER, size INTEGER)")
+		self.db.commit()
+		self.entries = {}
+		self.by_ref_id = {}
+		self.by_hash = {}
+		for row in self.db.execute("SELECT path, url, ref_id, size, mod_date, sha256, nbytes FROM files"):
+			self._add(row[0], {'url': row[1], 'ref_id': row[2], 'size': row[3], 
+				'mod-date': datetime.fromisoformat(row[4]), 'sha256': row[5], 'nbytes': row[6]})
+		self.media = dict(self.db.execute("SELECT mob_id, size FROM media"))
+		self.archive_entries = {row[0]: (row[1], row[2]) for row in self.db.execute("SELECT path, crc, size FROM archive_entries")}
+		for entry in self.entries.values():
+			if entry['ref_id'] and entry['ref_id'].startswith("mm_") and entry['size'] is not None:
+				self.media.setdefault(entry['ref_id'], entry['size'])
+
+
+	def _add(self, path, entry):
+		if (old := self.entries.get(path)) is not None:
+			self.by_ref_id.get(old['ref_id'], set()).discard(path)
+			if self.by_hash.get((old['sha256'], old['nbytes'])) == path:
+				del self.by_hash[(old['sha256'], old['nbytes'])]
+		self.entries[path] = entry
+		if entry['sha256'] is not None:
+			if entry['ref_id'] is not None:
+				self.by_ref_id.setdefault(entry['ref_id'], set()).add(path)
+			self.by_hash.setdefault((entry['sha256'], entry['nbytes']), path)
+
+
+	def get(self, path):
+		"""
+		Returns the manifest entry of a local file or None.
+
+		:param      path:  The local path relative to the download path
+		:type       path:  str
+		"""
+
+		return self.entries.get(path)
+
+
+	def isUpToDate(self, path, file):
+		"""
+		Checks whether the local file is the newest version of the file.
+
+		:param      path:  The local path relative to the download path
+		:type       path:  str
+		:param      file:  The scanned file
+		:type       file:  dict
+
+		:returns:   True if the file doesn't need to be downloaded
+		:rtype:     bool
+		"""
+
+		if (entry := self.entries.get(path)) is None:
+			return False
+		if file['mod-date'] > entry['mod-date']:
+			return False
+		# Videos don't have a modification date, so compare the sizes
+		size, old_size = file['size'], entry['size']
+		if size is None or old_size is None or math.isnan(size) or math.isnan(old_size):
+			return True
+		return math.isclose(size, old_size, abs_tol=1e-6)
+
+
+	def record(self, path, file, sha256=None, nbytes=None):
+		"""
+		Records a completed download.
+
+		:param      path:    The local path relative to the download path
+		:type       path:    str
+		:param      file:    The downloaded file
+		:type       file:    dict
+		:param      sha256:  The sha256 hex digest of the content (optional)
+		:type       sha256:  str
+		:param      nbytes:  The number of bytes of the content (optional)
+		:type       nbytes:  int
+		"""
+
+		entry = {
+			'url': file['url'],
+			'ref_id': extractRefId(file['url']),
+			'size': file['size'],
+			'mod-date': file['mod-date'],
+			'sha256': sha256,
+			'nbytes': nbytes
+		}
+		with self.lock:
+			self._add(path, entry)
+			self.pending.append((path, entry['url'], entry['ref_id'], entry['size'], entry['mod-date'].isoformat(),
+				sha256, nbytes))
+			if len(self.pending) >= self.batch_size:
+				self._write()
+
+
+	def findCopy(self, file):
+		"""
+		Returns a downloaded file with the same ilias id (file_<id> or 
+		mm_<id>), size and modification date, i.e. the same content. Only
+		files with a recorded hash are considered.
+
+		:param      file:  The scanned file
+		:type       file:  dict
+
+		:returns:   the local path and the entry, or None
+		:rtype:     tuple
+		"""
+
+		if (ref_id := extractRefId(file['url'])) is None:
+			return None
+		with self.lock:
+			for path in self.by_ref_id.get(ref_id, ()):
+				entry = self.entries[path]
+				if entry['mod-date'] < file['mod-date']:
+					continue
+				size, old_size = file['size'], entry['size']
+				if size is None or old_size is None or math.isnan(size) or math.isnan(old_size) \
+					or math.isclose(size, old_size, abs_tol=1e-6):
+					return path, entry
+		return None
+
+
+	def findHash(self, sha256, nbytes):
+		"""
+		Returns the local path of a downloaded file with the given content 
+		hash and number of bytes or None.
+		"""
+
+		with self.lock:
+			return self.by_hash.get((sha256, nbytes))
+
+
+	def mediaSize(self, mob_id):
+		"""
+		Returns the known size of a media object or None.
+
+		:param      mob_id:  The media object id, e.g. 'mm_1234'
+		:type       mob_id:  str
+		"""
+
+		return self.media.get(mob_id)
+
+
+	def recordMedia(self, mob_id, size):
+		"""
+		Records the probed size of a media object.
+
+		:param      mob_id:  The media object id, e.g. 'mm_1234'
+		:type       mob_id:  str
+		:param      size:    The size in MB
+		:type       size:    float
+		"""
+
+		with self.lock:
+			self.media[mob_id] = size
+			self.pending_media.append((mob_id, size))
+			if len(self.pending_media) >= self.batch_size:
+				self._write()
+
+
+	def isExtracted(self, path, crc, size):
+		"""
+		Checks whether a zip entry with the given CRC and size has been 
+		extracted to the local path before.
+
+		:param      path:  The local path relative to the download path
+		:type       path:  str
+		:param      crc:   The CRC-32 of the entry
+		:type       crc:   int
+		:param      size:  The uncompressed size in bytes
+		:type       size:  int
+
+		:rtype:     bool
+		"""
+
+		return self.archive_entries.get(path) == (crc, size)
+
+
+	def recordExtracted(self, path, crc, size):
+		"""
+		Records a zip entry extracted to the local path.
+
+		:param      path:  The local path relative to the download path
+		:type       path:  str
+		:param      crc:   The CRC-32 of the entry
+		:type       crc:   int
+		:param      size:  The uncompressed size in bytes
+		:type       size:  int
+		"""
+
+		with self.lock:
+			self.archive_entries[path] = (crc, size)
+			self.pending_archive.append((path, crc, size))
+			if len(self.pending_archive) >= self.batch_size:
+				self._write()
+
+
+	def _write(self):
+		with self.db:
+			self.db.executemany("INSERT OR REPLACE INTO files (path, url, ref_id, size, mod_date, sha256, nbytes) "
+				"VALUES (?, ?, ?, ?, ?, ?, ?)", self.pending)
+			self.db.executemany("INSERT OR REPLACE INTO media VALUES (?, ?)", self.pending_media)
+			self.db.executemany("INSERT OR REPLACE INTO archive_entries VALUES (?, ?, ?)", self.pending_archive)
+		self.pending = []
+		self.pending_media = []
+		self.pending_archive = []
+
+
+	def commit(self):
+		"""
+		Writes all pending entries.
+		"""
+
+		with self.lock:
+			self._write()
+
+
+	def close(self):
+		with self.lock:
+			self._write()
+			self.db.close()
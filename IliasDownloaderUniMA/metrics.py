@@ -0,0 +1,275 @@
+#!/usr/bin/env python3
+
+from contextlib import contextmanager
+import json
+import threading
+import time
+
+
+class Metrics():
+	"""
+	Thread-safe collector for the request and stage timings of a sync.
+	Requests are counted per method/status and per course, the stages
+	(e.g. 'parse', 'dates', 'write') by their number of calls, seconds and
+	bytes. The course of the current thread is set by course().
+	"""
+
+	def __init__(self):
+		self.lock = threading.Lock()
+		self.local = threading.local()
+		self.requests = {}
+		self.courses = {}
+		self.stages = {}
+		self.pools = {}
+		self.gauges = {}
+		self.profilers = []
+		self.profiling = False
+
+
+	@contextmanager
+	def course(self, name):
+		"""
+		Assigns the requests and stages of the current thread to the course.
+		"""
+
+		previous = getattr(self.local, 'course', None)
+		self.local.course = name
+		try:
+			yield
+		finally:
+			self.local.course = previous
+
+
+	def bind(self, fun):
+		"""
+		Wraps the function such that it runs with the course of the calling
+		thread, e.g. when it's submitted to an executor.
+		"""
+
+		course = getattr(self.local, 'course', None)
+		def wrapper(*args, **kwargs):
+			with self.course(course):
+				return fun(*args, **kwargs)
+		return wrapper
+
+
+	def _course(self, name=None):
+		name = name or getattr(self.local, 'course', None) or "-"
+		if name not in self.courses:
+			self.courses[name] = {'requests': 0, 'bytes': 0, 'seconds': 0.0, 'files': 0, 'downloads': 0,
+				'failed': 0, 'linked': 0, 'saved': 0, 'not_downloaded': 0}
+		return self.courses[name]
+
+
+	def recordRequest(self, method, status, nbytes, seconds):
+		"""
+		Records a finished request.
+
+		:param      method:   The HTTP method
+		:type       method:   str
+		:param      status:   The status code (None if the request failed)
+		:type       status:   int
+		:param      nbytes:   The number of received body bytes
+		:type       nbytes:   int
+		:param      seconds:  The time until the response was received
+		:type       seconds:  float
+		"""
+
+		with self.lock:
+			key = (method, status)
+			if key not in self.requests:
+				self.requests[key] = {'count': 0, 'bytes': 0, 'seconds': 0.0}
+			entry = self.requests[key]
+			entry['count'] += 1
+			entry['bytes'] += nbytes
+			entry['seconds'] += seconds
+			course = self._course()
+			course['requests'] += 1
+			course['bytes'] += nbytes
+			course['seconds'] += seconds
+
+
+	def count(self, key, course=None, n=1):
+		"""
+		Increases a per course counter, i.e. 'files', 'downloads', 'failed'
+		(downloads), 'bytes' or the deduplication counters 'linked' (files), 'saved' (bytes on disk)
+		and 'not_downloaded' (bytes). Without a course the course of the 
+		current thread is used.
+		"""
+
+		with self.lock:
+			self._course(course)[key] += n
+
+
+	def addStage(self, name, seconds, nbytes=0):
+		with self.lock:
+			if name not in self.stages:
+				self.stages[name] = {'count': 0, 'bytes': 0, 'seconds': 0.0}
+			entry = self.stages[name]
+			entry['count'] += 1
+			entry['bytes'] += nbytes
+			entry['seconds'] += seconds
+
+
+	def recordPool(self, name, requests, connections):
+		"""
+		Records the number of requests and opened connections of a 
+		connection pool.
+		"""
+
+		with self.lock:
+			self.pools[name] = {'requests': requests, 'connections': connections}
+
+
+	def setGauge(self, name, value):
+		with self.lock:
+			self.gauges[name] = value
+
+
+	@contextmanager
+	def stage(self, name):
+		"""
+		Measures the time of a stage. Bytes processed by the stage can be
+		added to the yielded dict.
+
+		:param      name:  The stage name
+		:type       name:  str
+		"""
+
+		info = {'bytes': 0}
+		start = time.perf_counter()
+		try:
+			yield info
+		finally:
+			self.addStage(name, time.perf_counter() - start, info['bytes'])
+
+
+	def profiled(self, fun):
+		"""
+		Wraps the function such that it runs under the cProfile profiler of
+		the calling thread while profiling is enabled.
+		"""
+
+		def wrapper(*args, **kwargs):
+			if not self.profiling:
+				return fun(*args, **kwargs)
+			if (profiler := getattr(self.local, 'profiler', None)) is None:
+				import cProfile
+				profiler = self.local.profiler = cProfile.Profile()
+				with self.lock:
+					self.profilers.append(profiler)
+			profiler.enable()
+			try:
+				return fun(*args, **kwargs)
+			finally:
+				profiler.disable()
+		return wrapper
+
+
+	def dumpProfile(self, path):
+		"""
+		Merges the profiles of all threads and writes them to path (readable
+		by pstats or snakeviz).
+		"""
+
+		with self.lock:
+			profilers, self.profilers = self.profilers, []
+		self.local.profiler = None
+		if profilers:
+			import pstats
+			stats = pstats.Stats(profilers[0])
+			for p in profilers[1:]:
+				stats.add(p)
+			stats.dump_stats(path)
+
+
+	def summary(self):
+		"""
+		Returns the collected metrics.
+
+		:returns:   the metrics
+		:rtype:     dict
+		"""
+
+		with self.lock:
+			return {
+				'requests': [{'method': m, 'status': s, **v} for (m, s), v in self.requests.items()],
+				'courses': {k: dict(v) for k, v in self.courses.items()},
+				'stages': {k: dict(v) for k, v in self.stages.items()},
+				'pools': {k: dict(v) for k, v in self.pools.items()},
+				'gauges': dict(self.gauges)
+			}
+
+
+	def report(self):
+		"""
+		Returns a short human readable summary.
+		"""
+
+		s = self.summary()
+		lines = []
+		num_requests = sum(r['count'] for r in s['requests'])
+		req_time = sum(r['seconds'] for r in s['requests'])
+		statuses = ", ".join(f"{r['method']} {r['status']}: {r['count']}"
+			for r in sorted(s['requests'], key=lambda r: (r['method'], str(r['status']))))
+		lines.append(f"Requests: {num_requests} ({req_time:.1f} s) [{statuses}]")
+		for name, v in sorted(s['pools'].items()):
+			reused = 1 - v['connections'] / v['requests'] if v['requests'] else 0
+			lines.append(f"Pool {name}: {v['connections']} connections for {v['requests']} requests ({reused:.0%} reused)")
+		if s['gauges']:
+			lines.append(", ".join(f"{name}: {value:g}" for name, value in sorted(s['gauges'].items())))
+		for name, v in sorted(s['stages'].items()):
+			line = f"{name}: {v['count']} x, {v['seconds']:.2f} s"
+			if v['bytes']:
+				line += f", {v['bytes'] * 1e-6:.1f} MB"
+			lines.append(line)
+		if (linked := sum(v['linked'] for v in s['courses'].values())):
+			saved = sum(v['saved'] for v in s['courses'].values())
+			not_downloaded = sum(v['not_downloaded'] for v in s['courses'].values())
+			lines.append(f"Deduplication: {linked} files linked, {saved * 1e-6:.1f} MB disk space saved, "
+				f"{not_downloaded * 1e-6:.1f} MB not downloaded")
+		for name, v in sorted(s['courses'].items()):
+			failed = f" ({v['failed']} failed)" if v['failed'] else ""
+			lines.append(f"{name}: {v['requests']} requests, {v['files']} files, "
+				f"{v['downloads']} downloads{failed}, {v['bytes'] * 1e-6:.1f} MB")
+		return "\n".join(lines)
+
+
+	def toJSON(self):
+		return json.dumps(self.summary(), indent=2)
+
+
+	def toPrometheus(self):
+		"""
+		Returns the metrics in the Prometheus text exposition format.
+		"""
+
+		def label(value):
+			return str(value).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+		s = self.summary()
+		lines = []
+		def metric(name, help_text, samples):
+			lines.append(f"# HELP {name} {help_text}")
+			lines.append(f"# TYPE {name} counter")
+			for labels, value in samples:
+				labels = ",".join(f"{k}=\"{label(v)}\"" for k, v in labels.items())
+				lines.append(f"{name}{{{labels}}} {value}")
+
+		for key, help_text in [('count', "HTTP requests"), ('seconds', "Seconds until the responses were received"),
+			('bytes', "Received body bytes of non-streamed responses")]:
+			name = "iliasdl_requests_total" if key == 'count' else f"iliasdl_request_{key}_total"
+			metric(name, help_text, [({'method': r['method'], 'status': r['status'] or "error"}, r[key]) for r in s['requests']])
+		for key in ['requests', 'bytes', 'seconds', 'files', 'downloads', 'failed', 'linked', 'saved', 'not_downloaded']:
+			metric(f"iliasdl_course_{key}_total", f"{key.replace('_', ' ').capitalize()} per course",
+				[({'course': c}, v[key]) for c, v in s['courses'].items()])
+		for key in ['count', 'seconds', 'bytes']:
+			metric(f"iliasdl_stage_{key}_total", f"Stage {key}",
+				[({'stage': n}, v[key]) for n, v in s['stages'].items()])
+		for name, value in s['gauges'].items():
+			lines.append(f"# TYPE iliasdl_{name} gauge")
+			lines.append(f"iliasdl_{name} {value}")
+		for key in ['requests', 'connections']:
+			metric(f"iliasdl_pool_{key}_total", f"{key.capitalize()} per connection pool",
+				[({'pool': n}, v[key]) for n, v in s['pools'].items()])
+		return "\n".join(lines) + "\n"
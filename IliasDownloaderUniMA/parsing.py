@@ -0,0 +1,309 @@
+#!/usr/bin/env python3
+
+from urllib.parse import urljoin
+from datetime import datetime
+from functools import lru_cache
+from .cache import fingerprintContainerList
+from .dates import parseIliasDate
+import math
+import re
+
+# bs4 and lxml are imported on first use to keep the import of the
+# package fast
+
+
+def _hasClass(name):
+	return f"contains(concat(' ', normalize-space(@class), ' '), ' {name} ')"
+
+item_xpath = f"div[{_hasClass('il_ContainerListItem')}]"
+figure_xpath = f"figure[{_hasClass('ilc_media_cont_MediaContainer')}]"
+
+
+@lru_cache(maxsize=None)
+def folderXPath():
+	"""
+	Returns the compiled XPath selecting the breadcrumb, the 
+	MediaContainers and the ContainerList items of a folder page (in 
+	document order, without nested duplicates).
+	"""
+
+	from lxml import etree
+	return etree.XPath(
+		"(//body//ol)[1]"
+		f" | //{figure_xpath}[not(ancestor::{item_xpath})]"
+		f" | //{item_xpath}[not(ancestor::{item_xpath}) and not(ancestor::{figure_xpath})]"
+	)
+
+
+def makeSoup(content):
+	"""
+	Parses a page with BeautifulSoup and lxml.
+
+	:param      content:  The page content
+	:type       content:  bytes or str
+
+	:returns:   the soup
+	:rtype:     bs4.BeautifulSoup
+	"""
+
+	from bs4 import BeautifulSoup
+	return BeautifulSoup(content, "lxml")
+
+
+def strainFolderPage(content):
+	"""
+	Parses a folder page with lxml and builds a BeautifulSoup object that
+	only contains the breadcrumb ol, the MediaContainers and the
+	ContainerList items. Building the full BeautifulSoup tree of a page is
+	much slower than parsing it with lxml.
+
+	:param      content:  The page content
+	:type       content:  bytes
+
+	:returns:   the soup
+	:rtype:     bs4.BeautifulSoup
+	"""
+
+	from bs4 import UnicodeDammit
+	import lxml.html
+	markup = UnicodeDammit(content, ["utf-8"]).unicode_markup
+	elements = folderXPath()(lxml.html.document_fromstring(markup))
+	if not any(e.tag == "ol" for e in elements):
+		# Unexpected page, fall back to the full tree
+		return makeSoup(markup)
+	return makeSoup("".join(lxml.html.tostring(e, encoding='unicode', with_tail=False)
+		for e in elements))
+
+
+# The parse functions below only depend on their arguments and return
+# plain dicts, so they can run in worker processes (see 'parse_processes')
+
+def itemType(url):
+	"""
+	Determines the type of a ContainerList link: 'file', 'link', 'forum',
+	'task', 'lernmaterialien' or 'folder'.
+
+	:param      url:  The link url
+	:type       url:  str
+
+	:returns:   the type
+	:rtype:     str
+	"""
+
+	if "target=file" in url:
+		return "file"
+	elif "calldirectlink" in url:
+		return "link"
+	elif "showThreads" in url:
+		return "forum"
+	elif "showOverview" in url:
+		return "task"
+	elif "ilHTLMPresentationGUI" in url:
+		return "lernmaterialien"
+	else:
+		return "folder"
+
+
+def parseFileProperties(bs_item, parse_date=parseIliasDate):
+	"""
+	Tries to parse the file's size, modification date and the file ending.
+	Note: there are some cases where Ilias doesn't provide a modification 
+	date and/or a file size.
+
+	:param      bs_item:     The ContainerList item
+	:type       bs_item:     bs4.element.Tag
+	:param      parse_date:  The function parsing the modification date
+	:type       parse_date:  callable
+
+	:returns:   file ending, file size, file modification date
+	:rtype:     tuple
+	"""
+
+	props = bs_item.find_all('span', 'il_ItemProperty')
+	p = [i for i in props if len(i.text.split()) > 0 and "Version" not in i.text]
+	# Parse the file ending
+	if len(p[0].text.split()) > 1:
+		file_ending = ""
+	else:
+		file_ending = "." + p[0].text.split()[0]
+
+	# Parse the file size
+	if len(p) > 1:
+		size_tmp = p[1].text.lower().replace(".","").replace(",", ".").split()
+		size = float(size_tmp[0])
+		if size_tmp[1] == "kb":
+			size *= 1e-3
+		elif size_tmp[1] == "bytes":
+			size *= 1e-6
+	else:
+		size = math.nan
+
+	# Parse the modification date
+	if len(p) > 2:
+		mod_date = parse_date(p[2].text)
+	else:
+		mod_date = datetime.fromisoformat('2000-01-01')
+
+	return file_ending, size, mod_date
+
+
+def parseVideo(mc_soup, base_url):
+	"""
+	Parses the video inside a MediaContainer.
+
+	:returns:   name, size (nan), modification date and url of the video 
+	            or None
+	:rtype:     tuple
+	"""
+
+	# Checks if there's a video inside the mediacontainer:
+	if (vsoup := mc_soup.find('video', {"class": "ilPageVideo"})):
+		if (v_src := vsoup.find('source')['src']):
+			v_url = urljoin(base_url, v_src)
+			v_name = re.search(r"mobs/mm_\d+/(.*)\?il_wac_token.*", v_src).group(1)
+			# The size is determined later by probeVideoSizes()
+			v_size = math.nan
+			# The HEAD requests misses the 'last-modified' key, so it's not
+			# possible to get the mod date from there :(
+			v_mod_date = datetime.fromisoformat('2000-01-01')
+		return v_name, v_size, v_mod_date, v_url
+	else:
+		return None
+
+
+def parseContainerList(items, course_name, file_path, base_url, parse_date=parseIliasDate):
+	"""
+	Parses the ContainerList items.
+
+	:returns:   the found files, the items to scan next
+	:rtype:     tuple
+	"""
+
+	files = []
+	to_scan = []
+	for i in items:
+		if (subitem := i.find('a', href=True)):
+			el_url =  urljoin(base_url, subitem['href'])
+			el_name = subitem.text
+			el_type = itemType(el_url)
+			if el_type == "file":
+				ending, size, mod_date = parseFileProperties(i, parse_date)
+				files += [{
+					'course': course_name, 
+					'type': el_type,
+					'name': el_name + ending,
+					'size': size,
+					'mod-date': mod_date,
+					'url': el_url,
+					'path': file_path
+				}]
+			elif el_type in ["folder", "task", "lernmaterialien"]:
+				to_scan += [{
+					'course': course_name,
+					'type': el_type, 
+					'name': el_name, 
+					'url': el_url
+				}]
+	return files, to_scan
+
+
+def parseFolderSoup(soup, course_name, base_url, fingerprint=False, cached=None, parse_date=parseIliasDate):
+	"""
+	Extracts the local path, the videos, the files and the nested items 
+	of a folder page.
+
+	:param      soup:         The (strained) folder page
+	:type       soup:         bs4.BeautifulSoup
+	:param      course_name:  The name of the course
+	:type       course_name:  str
+	:param      base_url:     The ilias base url
+	:type       base_url:     str
+	:param      fingerprint:  Compute the fingerprint of the ContainerList
+	:type       fingerprint:  bool
+	:param      cached:       The fingerprint and the path of the cached
+	                          page. If both are unchanged, the ContainerList
+	                          isn't parsed and 'files' and 'children' are None
+	:type       cached:       tuple
+	:param      parse_date:   The function parsing the modification dates
+	:type       parse_date:   callable
+
+	:returns:   dict with the keys 'file_path', 'videos', 'fingerprint',
+	            'files' and 'children'
+	:rtype:     dict
+	"""
+
+	file_path = course_name + "/" +  "/".join(soup.find("body").find("ol").text.split("\n")[4:-1]) + "/"
+	file_path = file_path.replace(":", " - ")
+	videos = []
+	for mc in soup.find_all("figure", {"class": "ilc_media_cont_MediaContainer"}):
+		if (video := parseVideo(mc, base_url)):
+			v_name, v_size, v_mod_date, v_url = video
+			videos += [{ 
+				'course': course_name, 
+				'type': 'file',
+				'name': v_name,
+				'size': v_size,
+				'mod-date': v_mod_date,
+				'url': v_url,
+				'path': file_path
+			}]
+	items = soup.find_all("div", "il_ContainerListItem")
+	page = {'file_path': file_path, 'videos': videos, 'fingerprint': None, 'files': None, 'children': None}
+	if fingerprint:
+		page['fingerprint'] = fingerprintContainerList(items)
+	if cached is None or cached != (page['fingerprint'], file_path):
+		page['files'], page['children'] = parseContainerList(items, course_name, file_path, base_url, parse_date)
+	return page
+
+
+def parseFolderPage(content, course_name, base_url, fingerprint=False, cached=None):
+	"""
+	Parses a folder page, see parseFolderSoup().
+
+	:param      content:  The page content
+	:type       content:  bytes
+	"""
+
+	return parseFolderSoup(strainFolderPage(content), course_name, base_url, fingerprint, cached)
+
+
+def parseTaskUnitPage(content, course_name, base_url):
+	"""
+	Parses the page of a task unit.
+
+	:param      content:      The page content
+	:type       content:      bytes
+	:param      course_name:  The name of the course
+	:type       course_name:  str
+	:param      base_url:     The ilias base url
+	:type       base_url:     str
+
+	:returns:   dict with the keys 'file_path', 'files', 'deadline' (the 
+	            text or None) and 'grades_url' (the submissions tab or None)
+	:rtype:     dict
+	"""
+
+	soup = makeSoup(content)
+	task_unit_name = soup.find("a", {"class" : "ilAccAnchor"}).text  
+	file_path = course_name + "/" + "Aufgaben/" + task_unit_name + "/"
+	file_path = file_path.replace(":", " - ")
+	files = []
+	for i in soup.find("div", {"id":"infoscreen_section_1"}).find_all("div", "form-group"):
+		files += [{
+			'course': course_name,
+			'type': 'file',
+			'name': i.find("div", 'il_InfoScreenProperty').text,
+			'size': math.nan,
+			'mod-date': datetime.fromisoformat('2000-01-01'),
+			'url': urljoin(base_url, i.find('a')['href']),
+			'path': file_path
+		}]
+	deadline = soup.select_one('#infoscreen_section_2 > div:nth-child(2) > div.il_InfoScreenPropertyValue.col-xs-9')
+	tab_grades = soup.select_one('#tab_grades > a')
+	return {
+		'file_path': file_path,
+		'files': files,
+		'deadline': deadline.text if deadline else None,
+		'grades_url': urljoin(base_url, tab_grades['href']) if tab_grades else None
+	}
+
@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+
+import math
+
+
+def knownSize(file):
+	"""
+	Returns the size of the file in MB or None if it's unknown (videos
+	whose size couldn't be probed).
+	"""
+
+	size = file['size']
+	return None if size is None or math.isnan(size) else size
+
+
+# Sort keys of the download orders, files of unknown size come last
+download_orders = {
+	'discovery': None,
+	'smallest': lambda f: (knownSize(f) is None, knownSize(f) or 0.0),
+	'largest': lambda f: (knownSize(f) is None, -(knownSize(f) or 0.0)),
+	'newest': lambda f: -f['mod-date'].timestamp(),
+	'oldest': lambda f: f['mod-date'].timestamp()
+}
+
+
+class DownloadPlan():
+	"""
+	The files found by a scan together with what a download will do with
+	them: 'download', 'resume' (a partial download), 'link' (hardlink an
+	identical file, see 'deduplicate') or 'skip' (up to date). The bytes
+	to transfer are totaled per course.
+	"""
+
+	actions = ('download', 'resume', 'link', 'skip')
+
+	def __init__(self):
+		self.entries = []
+		self.courses = {}
+
+
+	def add(self, file, action, nbytes=None):
+		"""
+		Adds a file to the plan.
+
+		:param      file:    The file
+		:type       file:    FileRecord
+		:param      action:  One of DownloadPlan.actions
+		:type       action:  str
+		:param      nbytes:  The bytes to transfer (None: unknown)
+		:type       nbytes:  int
+		"""
+
+		self.entries.append((file, action, nbytes))
+		totals = self.courses.setdefault(file['course'], dict.fromkeys(('files', 'bytes', 'unknown') + self.actions, 0))
+		totals['files'] += 1
+		totals[action] += 1
+		if action in ('download', 'resume'):
+			if nbytes is None:
+				totals['unknown'] += 1
+			else:
+				totals['bytes'] += nbytes
+
+
+	def total(self):
+		"""
+		Returns the totals of all courses.
+
+		:rtype:     dict
+		"""
+
+		total = dict.fromkeys(('files', 'bytes', 'unknown') + self.actions, 0)
+		for totals in self.courses.values():
+			for key, value in totals.items():
+				total[key] += value
+		return total
+
+
+	def ordered(self, order='discovery'):
+		"""
+		Returns the files to download, resume or link in the given order.
+
+		:param      order:  A key of download_orders
+		:type       order:  str
+
+		:returns:   the files
+		:rtype:     list
+		"""
+
+		files = [file for file, action, _ in self.entries if action != 'skip']
+		if (key := download_orders[order]) is not None:
+			files.sort(key=key)
+		return files
+
+
+	def report(self):
+		"""
+		Returns a human readable summary of the plan.
+
+		:rtype:     str
+		"""
+
+		def line(name, t):
+			unknown = f" + {t['unknown']} of unknown size" if t['unknown'] else ""
+			return (f"  {name}: {t['download'] + t['resume']} to download ({t['bytes'] / 1e6:.1f} MB{unknown}), "
+				f"{t['resume']} resumed, {t['link']} linked, {t['skip']} up to date")
+
+		lines = ["Download plan:"]
+		lines += [line(name, totals) for name, totals in sorted(self.courses.items())]
+		lines.append(line("Total", self.total()))
+		return "\n".join(lines)
@@ -0,0 +1,150 @@
+#!/usr/bin/env python3
+
+import sys
+import threading
+
+
+class FileRecord():
+	"""
+	Compact record of a found file. The course, type and path strings are
+	interned, since they are shared by many files. For existing callers a
+	record can still be used like the old dict with the keys 'course',
+	'type', 'name', 'size', 'mod-date', 'url' and 'path'.
+	"""
+
+	__slots__ = ('course', 'type', 'name', 'size', 'mod_date', 'url', 'path')
+
+	fields = {
+		'course': 'course',
+		'type': 'type',
+		'name': 'name',
+		'size': 'size',
+		'mod-date': 'mod_date',
+		'url': 'url',
+		'path': 'path'
+	}
+
+
+	def __init__(self, course, type, name, size, mod_date, url, path):
+		self.course = sys.intern(course)
+		self.type = sys.intern(type)
+		self.name = name
+		self.size = size
+		self.mod_date = mod_date
+		self.url = url
+		self.path = sys.intern(path)
+
+
+	@classmethod
+	def fromDict(cls, d):
+		"""
+		Creates a record from a file dict (e.g. returned by an external
+		scraper).
+
+		:param      d:    The file dict
+		:type       d:    dict
+
+		:returns:   the record
+		:rtype:     FileRecord
+		"""
+
+		return cls(d['course'], d['type'], d['name'], d['size'], d['mod-date'], d['url'], d['path'])
+
+
+	def asDict(self):
+		return {key: getattr(self, attr) for key, attr in self.fields.items()}
+
+
+	def keys(self):
+		return self.fields.keys()
+
+
+	def items(self):
+		return self.asDict().items()
+
+
+	def get(self, key, default=None):
+		return getattr(self, self.fields[key]) if key in self.fields else default
+
+
+	def __getitem__(self, key):
+		return getattr(self, self.fields[key])
+
+
+	def __setitem__(self, key, value):
+		setattr(self, self.fields[key], value)
+
+
+	def __contains__(self, key):
+		return key in self.fields
+
+
+	def __eq__(self, other):
+		if isinstance(other, (FileRecord, dict)):
+			return self.asDict() == dict(other)
+		return NotImplemented
+
+
+	def __repr__(self):
+		return f"FileRecord({self.asDict()!r})"
+
+
+class FileList():
+	"""
+	Thread-safe, append-only list of FileRecords. Appended dicts are
+	converted to FileRecords.
+	"""
+
+	def __init__(self, files=()):
+		self.lock = threading.Lock()
+		self.records = []
+		self.extend(files)
+
+
+	def append(self, file):
+		if not isinstance(file, FileRecord):
+			file = FileRecord.fromDict(file)
+		with self.lock:
+			self.records.append(file)
+
+
+	def extend(self, files):
+		records = [f if isinstance(f, FileRecord) else FileRecord.fromDict(f) for f in files]
+		with self.lock:
+			self.records.extend(records)
+
+
+	def __iadd__(self, files):
+		self.extend(files)
+		return self
+
+
+	def asDicts(self):
+		"""
+		Returns the files as list of dicts.
+		"""
+
+		return [f.asDict() for f in self]
+
+
+	def __len__(self):
+		return len(self.records)
+
+
+	def __iter__(self):
+		with self.lock:
+			return iter(self.records[:])
+
+
+	def __getitem__(self, idx):
+		return self.records[idx]
+
+
+	def __eq__(self, other):
+		if isinstance(other, (FileList, list)):
+			return list(self) == list(other)
+		return NotImplemented
+
+
+	def __repr__(self):
+		return f"FileList({self.records!r})"
@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+
+from requests import Session, ConnectionError, Timeout
+from contextlib import nullcontext
+from .throttle import retry_statuses, backoffDelay, retryAfter
+import time
+
+
+class InstrumentedSession(Session):
+	"""
+	requests Session that records every request in the metrics. Streamed
+	responses are recorded without their body, the bytes are counted by
+	the stage that consumes the stream.
+
+	If a limiter is set, the requests are gated by it and feed their
+	latency and failures back to it. Streamed requests (the downloads)
+	feed back to stream_limiter instead and aren't gated, the download
+	consuming the stream holds its slot. Idempotent
+	requests failing transiently (connection errors, 429 and 5xx) are
+	retried up to 'retries' times with jittered exponential backoff or
+	after the delay requested by the server.
+	"""
+
+	idempotent_methods = {'GET', 'HEAD', 'OPTIONS'}
+
+	def __init__(self, metrics, limiter=None, retries=0, stream_limiter=None):
+		super().__init__()
+		self.metrics = metrics
+		self.limiter = limiter
+		self.stream_limiter = stream_limiter
+		self.retries = retries
+
+
+	def _send(self, method, url, *args, **kwargs):
+		start = time.perf_counter()
+		try:
+			r = super().request(method, url, *args, **kwargs)
+		except Exception:
+			self.metrics.recordRequest(method, None, 0, time.perf_counter() - start)
+			raise
+		nbytes = 0 if kwargs.get('stream') else len(r.content)
+		latency = time.perf_counter() - start
+		self.metrics.recordRequest(method, r.status_code, nbytes, latency)
+		return r, latency
+
+
+	def request(self, method, url, *args, **kwargs):
+		method = method.upper()
+		stream = kwargs.get('stream')
+		limiter = self.stream_limiter if stream else self.limiter
+		retries = self.retries if method in self.idempotent_methods else 0
+		attempt = 0
+		while True:
+			with limiter.slot() if limiter and not stream else nullcontext():
+				try:
+					r, latency = self._send(method, url, *args, **kwargs)
+				except (ConnectionError, Timeout):
+					if limiter:
+						limiter.onFailure()
+					if attempt >= retries:
+						raise
+					r = None
+			if r is not None and r.status_code not in retry_statuses:
+				if limiter:
+					limiter.onSuccess(latency, method)
+				return r
+			if r is not None:
+				if limiter:
+					limiter.onFailure()
+				if attempt >= retries:
+					return r
+				delay = retryAfter(r) or backoffDelay(attempt)
+				r.close()
+			else:
+				delay = backoffDelay(attempt)
+			with self.metrics.stage('retry'):
+				time.sleep(delay)
+			attempt += 1
@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+
+from datetime import datetime
+from .records import FileRecord
+from .manifest import extractRefId
+import json
+import math
+import os
+
+snapshot_version = 1
+
+
+def _open(path, mode, compressed):
+	if compressed:
+		import gzip
+		return gzip.open(path, mode + 't', encoding='utf-8')
+	return open(path, mode, encoding='utf-8')
+
+
+def writeSnapshot(path, files):
+	"""
+	Writes the files to a snapshot in the JSON Lines format (gzipped if
+	the path ends with '.gz'): a header line followed by one line per file.
+	The files are written as they are yielded, e.g. by iterFiles(), and
+	the snapshot replaces path once it's complete.
+
+	:param      path:   The snapshot path
+	:type       path:   str
+	:param      files:  The files
+	:type       files:  iterable of dicts or FileRecords
+
+	:returns:   the number of files written
+	:rtype:     int
+	"""
+
+	tmp_path = os.fspath(path) + ".tmp"
+	count = 0
+	with _open(tmp_path, 'w', os.fspath(path).endswith(".gz")) as f:
+		f.write(json.dumps({'snapshot': snapshot_version, 'created': datetime.now().isoformat()}) + "\n")
+		for file in files:
+			size = file['size']
+			f.write(json.dumps([file['course'], file['type'], file['name'],
+				None if size is None or math.isnan(size) else size,
+				file['mod-date'].isoformat(), file['url'], file['path']], ensure_ascii=False) + "\n")
+			count += 1
+	os.replace(tmp_path, path)
+	return count
+
+
+def readSnapshot(path):
+	"""
+	Reads the files of a snapshot written by writeSnapshot().
+
+	:param      path:  The snapshot path
+	:type       path:  str
+
+	:returns:   generator of the files
+	:rtype:     FileRecord
+
+	:raises     ValueError:  if the file isn't a snapshot
+	"""
+
+	with _open(path, 'r', os.fspath(path).endswith(".gz")) as f:
+		header = json.loads(f.readline() or "{}")
+		if not isinstance(header, dict) or header.get('snapshot') != snapshot_version:
+			raise ValueError(f"{path} isn't a snapshot (version {snapshot_version})")
+		for line in f:
+			course, type, name, size, mod_date, url, file_path = json.loads(line)
+			yield FileRecord(course, type, name, math.nan if size is None else size,
+				datetime.fromisoformat(mod_date), url, file_path)
+
+
+def _files(snapshot):
+	if isinstance(snapshot, (str, os.PathLike)):
+		return readSnapshot(snapshot)
+	return snapshot
+
+
+def diffSnapshots(old, new):
+	"""
+	Yields the files of the new snapshot that are missing in the old one
+	or differ in size, modification date or ilias id. The urls themselves
+	aren't compared, since the access tokens of the video urls change on
+	every page load. Only the old snapshot is held in memory, as a dict of
+	its keys.
+
+	:param      old:  The old snapshot (path or files)
+	:type       old:  str or iterable
+	:param      new:  The new snapshot (path or files)
+	:type       new:  str or iterable
+
+	:returns:   generator of the added or changed files
+	:rtype:     FileRecord
+	"""
+
+	def state(file):
+		size = file['size']
+		return (None if size is None or math.isnan(size) else round(size, 6), file['mod-date'],
+			extractRefId(file['url']) or file['url'])
+
+	known = {(f['path'], f['name']): state(f) for f in _files(old)}
+	for file in _files(new):
+		if known.get((file['path'], file['name'])) != state(file):
+			yield file if isinstance(file, FileRecord) else FileRecord.fromDict(file)
@@ -0,0 +1,23 @@
+#!/usr/bin/env python3
+
+import unicodedata
+
+# ILIAS replaces the umlauts in the titles of the background tasks
+umlauts = str.maketrans({'ä': 'ae', 'ö': 'oe', 'ü': 'ue', 'Ä': 'Ae', 'Ö': 'Oe', 'Ü': 'Ue', 'ß': 'ss'})
+
+
+def taskKey(name):
+	"""
+	Returns the key matching the name of a submissions zip with the title
+	of its background task, i.e. the name with umlauts replaced, collapsed
+	whitespace and case folded.
+
+	:param      name:  The zip name or the background task title
+	:type       name:  str
+
+	:returns:   the key
+	:rtype:     str
+	"""
+
+	name = unicodedata.normalize('NFC', name).translate(umlauts)
+	return " ".join(name.split()).casefold()
@@ -0,0 +1,257 @@
+#!/usr/bin/env python3
+
+from contextlib import contextmanager
+from datetime import datetime, timezone
+import random
+import threading
+import time
+
+# Status codes of transient failures worth a retry
+retry_statuses = {429, 500, 502, 503, 504}
+
+
+def backoffDelay(attempt, base=0.5, cap=30.0):
+	"""
+	Returns the delay before the retry number attempt (0, 1, ...) with
+	exponential backoff and full jitter.
+	"""
+
+	return random.uniform(0, min(cap, base * 2 ** attempt))
+
+
+def retryAfter(response, cap=60.0):
+	"""
+	Returns the delay in seconds requested by the Retry-After header of
+	the response (seconds or HTTP date) or None.
+	"""
+
+	if not (value := response.headers.get('Retry-After')):
+		return None
+	try:
+		return min(cap, max(0.0, float(value)))
+	except ValueError:
+		pass
+	from email.utils import parsedate_to_datetime
+	try:
+		return min(cap, max(0.0, (parsedate_to_datetime(value) - datetime.now(timezone.utc)).total_seconds()))
+	except (TypeError, ValueError):
+		return None
+
+
+class AdaptiveLimiter():
+	"""
+	AIMD controller for the number of concurrent work items (page requests
+	or file downloads). The limit grows by one per limit successful
+	requests (additive increase) and is halved on a failure or throttling
+	by the server (multiplicative decrease). A request much slower than the
+	smoothed latency of its kind (e.g. GET or HEAD) shrinks the limit a
+	little, since it indicates a queue on the server side. Decreases happen
+	at most once per cooldown, so a burst of failures of concurrent requests
+	counts once.
+	"""
+
+	def __init__(self, max_limit, min_limit=1, latency_factor=4.0, min_latency=0.1, cooldown=1.0):
+		"""
+		Constructs a new instance.
+
+		:param      max_limit:       The maximal limit (the number of threads)
+		:type       max_limit:       int
+		:param      min_limit:       The minimal limit
+		:type       min_limit:       int
+		:param      latency_factor:  Latencies above latency_factor times the
+		                             smoothed latency shrink the limit
+		:type       latency_factor:  float
+		:param      min_latency:     Latencies below are never too slow (e.g.
+		                             jitter of a fast server)
+		:type       min_latency:     float
+		:param      cooldown:        Min. seconds between two decreases
+		:type       cooldown:        float
+		"""
+
+		self.cond = threading.Condition()
+		self.min_limit = min_limit
+		self.max_limit = max(min_limit, max_limit)
+		self.limit = float(self.max_limit)
+		self.latency_factor = latency_factor
+		self.min_latency = min_latency
+		self.cooldown = cooldown
+		self.baselines = {}
+		self.in_flight = 0
+		self.last_decrease = 0.0
+		self.decreases = 0
+		self.lowest = self.limit
+
+
+	def setMaximum(self, max_limit):
+		with self.cond:
+			self.max_limit = max(self.min_limit, max_limit)
+			self.limit = min(max(self.limit, self.min_limit), self.max_limit)
+			self.cond.notify_all()
+
+
+	@contextmanager
+	def slot(self):
+		"""
+		Waits until the number of work items in flight is below the limit
+		and occupies a slot until the block is left.
+		"""
+
+		with self.cond:
+			while self.in_flight >= int(self.limit):
+				self.cond.wait()
+			self.in_flight += 1
+		try:
+			yield
+		finally:
+			with self.cond:
+				self.in_flight -= 1
+				self.cond.notify()
+
+
+	def _decrease(self, factor):
+		now = time.monotonic()
+		if now - self.last_decrease < self.cooldown:
+			return
+		self.last_decrease = now
+		self.limit = max(self.min_limit, self.limit * factor)
+		self.lowest = min(self.lowest, self.limit)
+		self.decreases += 1
+
+
+	def onSuccess(self, latency, kind=None):
+		"""
+		Feeds back the latency of a successful request. The latencies of
+		different kinds of requests (e.g. small HEAD probes and pages with
+		their body) are smoothed separately.
+
+		:param      latency:  The seconds of the request
+		:type       latency:  float
+		:param      kind:     The kind of the request, e.g. the method
+		:type       kind:     str
+		"""
+
+		with self.cond:
+			baseline = self.baselines.get(kind, latency)
+			# Exponentially smoothed, so it follows a permanently slower server
+			self.baselines[kind] = baseline + 0.1 * (latency - baseline)
+			if latency > max(self.min_latency, self.latency_factor * baseline):
+				self._decrease(0.9)
+				return
+			self.limit = min(self.max_limit, self.limit + 1 / self.limit)
+			self.cond.notify_all()
+
+
+	def onFailure(self):
+		"""
+		Feeds back a failed or throttled request.
+		"""
+
+		with self.cond:
+			self._decrease(0.5)
+
+
+	def stats(self):
+		with self.cond:
+			return {'limit': self.limit, 'lowest': self.lowest, 'decreases': self.decreases}
+
+
+def parseSchedule(schedule):
+	"""
+	Converts a bandwidth schedule [(start, end, mbps), ...] with times
+	"HH:MM" into [(start_minute, end_minute, bytes_per_second), ...]. A
+	window with start > end wraps around midnight.
+
+	:param      schedule:  The schedule
+	:type       schedule:  list
+
+	:returns:   the parsed schedule
+	:rtype:     list
+
+	:raises     ValueError:  if a window is malformed
+	"""
+
+	def minute(hhmm):
+		if not isinstance(hhmm, str):
+			raise ValueError(f"Invalid time {hhmm!r}")
+		hours, minutes = map(int, hhmm.split(":"))
+		if not (0 <= hours < 24 and 0 <= minutes < 60 or (hours, minutes) == (24, 0)):
+			raise ValueError(f"Invalid time {hhmm!r}")
+		return 60 * hours + minutes
+
+	return [(minute(start), minute(end), float(mbps) * 1e6) for start, end, mbps in schedule]
+
+
+class TokenBucket():
+	"""
+	Bandwidth limiter shared by all download threads. Each chunk reserves
+	its transfer time on a common time line, so the threads are served in
+	the order they ask (FIFO) and a small file waits for at most one chunk
+	of each concurrent download instead of for whole videos. Up to burst
+	seconds of unused bandwidth can be spent at once. The rate can depend
+	on the time of day, e.g. a lower cap during working hours.
+	"""
+
+	def __init__(self, rate=0.0, schedule=(), burst=1.0):
+		"""
+		Constructs a new instance.
+
+		:param      rate:      The default rate in bytes per second (0: unlimited)
+		:type       rate:      float
+		:param      schedule:  Parsed windows with other rates, see parseSchedule()
+		:type       schedule:  list
+		:param      burst:     The seconds of unused bandwidth that can be saved
+		:type       burst:     float
+		"""
+
+		self.lock = threading.Lock()
+		self.burst = burst
+		self.next_free = 0.0
+		self.waited = 0.0
+		self.configure(rate, schedule)
+
+
+	def configure(self, rate, schedule=()):
+		with self.lock:
+			self.rate = rate
+			self.schedule = list(schedule)
+
+
+	def rateAt(self, now=None):
+		"""
+		Returns the rate in bytes per second (0: unlimited) at the given time
+		(default: now).
+
+		:param      now:  The time
+		:type       now:  datetime
+		"""
+
+		if not self.schedule:
+			return self.rate
+		now = now or datetime.now()
+		minute = 60 * now.hour + now.minute
+		for start, end, rate in self.schedule:
+			if start <= minute < end or (start > end and (minute >= start or minute < end)):
+				return rate
+		return self.rate
+
+
+	def consume(self, nbytes):
+		"""
+		Blocks until nbytes may be transferred.
+
+		:returns:   the seconds waited
+		:rtype:     float
+		"""
+
+		if not (rate := self.rateAt()):
+			return 0.0
+		with self.lock:
+			now = time.monotonic()
+			start = max(self.next_free, now - self.burst)
+			self.next_free = start + nbytes / rate
+			delay = max(0.0, start - now)
+			self.waited += delay
+		if delay:
+			time.sleep(delay)
+		return delay
+
@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+
+import time
+
+
+class PollSchedule():
+	"""
+	Adaptive polling schedule of the courses in watch mode. A course that
+	changed is polled again after min_interval. Every poll without a change
+	multiplies the interval of the course by backoff, up to max_interval.
+	So active courses are polled often and dormant ones rarely. Every
+	full_rescan seconds a course is due for a full crawl, which also finds
+	changes deep inside folders whose parents look unchanged.
+	"""
+
+	def __init__(self, courses, min_interval=300.0, max_interval=3600.0, backoff=2.0, full_rescan=86400.0,
+		clock=time.monotonic):
+		"""
+		Constructs a new instance. All courses are due (for a full crawl)
+		right away.
+
+		:param      courses:       The course names
+		:type       courses:       list
+		:param      min_interval:  The seconds between polls of a changing course
+		:type       min_interval:  float
+		:param      max_interval:  The max. seconds between polls
+		:type       max_interval:  float
+		:param      backoff:       The factor of the interval after a poll without changes
+		:type       backoff:       float
+		:param      full_rescan:   The seconds between full crawls (None: never)
+		:type       full_rescan:   float
+		:param      clock:         The clock
+		:type       clock:         callable
+		"""
+
+		self.min_interval = min_interval
+		self.max_interval = max(min_interval, max_interval)
+		self.backoff = backoff
+		self.full_rescan = full_rescan
+		self.clock = clock
+		now = clock()
+		self.intervals = {c: min_interval for c in courses}
+		self.due = {c: now for c in courses}
+		self.last_full = {c: None for c in courses}
+
+
+	def next(self):
+		"""
+		Returns the course polled next.
+
+		:returns:   the course, the time it's due (of the clock) and whether
+		            a full crawl is due
+		:rtype:     tuple
+		"""
+
+		course = min(self.due, key=self.due.get)
+		return course, self.due[course], self.isFullDue(course)
+
+
+	def isFullDue(self, course):
+		last = self.last_full[course]
+		return last is None or (self.full_rescan is not None and self.clock() - last >= self.full_rescan)
+
+
+	def done(self, course, changed, full=False):
+		"""
+		Reschedules a course after a poll.
+
+		:param      course:   The course
+		:type       course:   str
+		:param      changed:  Whether the course changed
+		:type       changed:  bool
+		:param      full:     Whether it was a full crawl
+		:type       full:     bool
+		"""
+
+		now = self.clock()
+		if changed:
+			self.intervals[course] = self.min_interval
+		else:
+			self.intervals[course] = min(self.max_interval, self.intervals[course] * self.backoff)
+		if full:
+			self.last_full[course] = now
+		self.due[course] = now + self.intervals[course]
@@ -0,0 +1,44 @@
+#!/usr/bin/env python3
+"""
+Micro-benchmark of the per-item date parsing cost: dateparser vs.
+parseIliasDate (cold cache and warm cache).
+
+	python benchmarks/bench_dates.py
+"""
+
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from IliasDownloaderUniMA.dates import parseIliasDate, _parseDateText
+from dateparser import parse as parsedate
+import random
+import timeit
+
+month_names = ["Jan", "Feb", "Mär", "Apr", "Mai", "Jun", "Jul", "Aug", "Sep", "Okt", "Nov", "Dez"]
+
+
+def samples(n, distinct):
+	random.seed(0)
+	texts = [f"{random.randint(1, 28)}. {random.choice(month_names)} 2020, {random.randint(0, 23):02d}:{random.randint(0, 59):02d}"
+		for _ in range(distinct)] + ["Heute, 10:15", "Gestern, 09:30"]
+	return [random.choice(texts) for _ in range(n)]
+
+
+def perItem(fun, texts, repeat=3):
+	return min(timeit.repeat(lambda: [fun(t) for t in texts], number=1, repeat=repeat)) / len(texts)
+
+
+if __name__ == "__main__":
+	texts = samples(2000, 200)
+	before = perItem(parsedate, texts[:200])
+	def cold(t):
+		_parseDateText.cache_clear()
+		return parseIliasDate(t)
+	after_cold = perItem(cold, texts)
+	after_warm = perItem(parseIliasDate, texts)
+	print(f"dateparser.parse:         {before * 1e6:9.1f} us/item")
+	print(f"parseIliasDate (no cache): {after_cold * 1e6:8.1f} us/item")
+	print(f"parseIliasDate (cached):   {after_warm * 1e6:8.1f} us/item")
+	print(f"speedup (cached):          {before / after_warm:8.0f}x")
@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+"""
+End-to-end benchmark against the offline fake ilias server (tests/fake_ilias.py).
+Runs login -> addAllSemesterCourses -> downloadAllFiles on a generated
+course tree and reports pages/s, files/s, MB/s and the peak RSS.
+
+	python benchmarks/bench_e2e.py --courses 5 --depth 3 --fanout 3 --latency 20
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "tests"))
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from IliasDownloaderUniMA import IliasDownloaderUniMA
+from fake_ilias import FakeIlias, FakeIliasServer
+
+
+def peakRSS():
+	"""
+	Returns the peak resident set size in MB (or nan if unsupported).
+	"""
+
+	try:
+		import resource
+	except ImportError:
+		return float('nan')
+	rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+	# Linux reports KB, macOS bytes
+	return rss / 1e6 if sys.platform == "darwin" else rss / 1e3
+
+
+def sync(server, download_path, args):
+	"""
+	Runs a full sync and returns the timings and the server statistics.
+	"""
+
+	m = IliasDownloaderUniMA()
+	server.configure(m)
+	m.setParam('download_path', download_path)
+	m.setParam('num_scan_threads', args.scan_threads)
+	m.setParam('num_download_threads', args.download_threads)
+	m.setParam('parse_processes', args.parse_processes)
+	m.setParam('tutor_mode', args.tutor_mode)
+	m.setParam('page_cache', args.page_cache)
+	before = dict(server.stats)
+	start = time.perf_counter()
+	m.login(server.username, server.password)
+	m.addAllSemesterCourses(r"\(HWS 2020\)")
+	login_time = time.perf_counter() - start
+	m.downloadAllFiles()
+	total_time = time.perf_counter() - start
+	stats = {k: v - before.get(k, 0) for k, v in server.stats.items()}
+	return login_time, total_time, stats
+
+
+def report(name, login_time, total_time, stats):
+	print(f"{name}:")
+	print(f"  login + courses: {login_time:8.2f} s")
+	print(f"  total:           {total_time:8.2f} s")
+	print(f"  requests:        {stats.get('requests', 0):8d}   connections: {stats.get('connections', 0)}")
+	print(f"  pages/s:         {stats.get('pages', 0) / total_time:8.1f}   ({stats.get('pages', 0)} pages)")
+	print(f"  files/s:         {stats.get('files', 0) / total_time:8.1f}   ({stats.get('files', 0)} files)")
+	print(f"  MB/s:            {stats.get('bytes', 0) * 1e-6 / total_time:8.1f}   ({stats.get('bytes', 0) * 1e-6:.1f} MB)")
+	print(f"  peak RSS:        {peakRSS():8.1f} MB")
+
+
+def main():
+	parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+	parser.add_argument('--courses', type=int, default=3)
+	parser.add_argument('--depth', type=int, default=3)
+	parser.add_argument('--fanout', type=int, default=3)
+	parser.add_argument('--files', type=int, default=5, help="files per folder")
+	parser.add_argument('--file-size', type=int, default=200, help="file size in KB")
+	parser.add_argument('--videos', type=int, default=0, help="videos per folder")
+	parser.add_argument('--video-size', type=float, default=20, help="video size in MB")
+	parser.add_argument('--task-units', type=int, default=2)
+	parser.add_argument('--latency', type=float, default=10, help="latency per request in ms")
+	parser.add_argument('--error-rate', type=float, default=0.0)
+	parser.add_argument('--scan-threads', type=int, default=5)
+	parser.add_argument('--download-threads', type=int, default=5)
+	parser.add_argument('--parse-processes', type=int, default=0, help="parse the pages in worker processes")
+	parser.add_argument('--tutor-mode', action='store_true')
+	parser.add_argument('--page-cache', action='store_true')
+	parser.add_argument('--incremental', action='store_true', help="run a second, incremental sync")
+	args = parser.parse_args()
+
+	ilias = FakeIlias(num_courses=args.courses, depth=args.depth, fanout=args.fanout,
+		files_per_folder=args.files, file_size=args.file_size * 1000, videos_per_folder=args.videos,
+		video_size=int(args.video_size * 1e6), task_units=args.task_units)
+	print(f"Course tree: {len(ilias.nodes)} nodes, {len(ilias.files())} files")
+	with FakeIliasServer(ilias, latency=args.latency * 1e-3, error_rate=args.error_rate) as server, \
+		tempfile.TemporaryDirectory() as download_path:
+		report("full sync", *sync(server, download_path, args))
+		if args.incremental:
+			report("incremental sync", *sync(server, download_path, args))
+
+
+if __name__ == "__main__":
+	main()
@@ -0,0 +1,71 @@
+#!/usr/bin/env python3
+"""
+Scaling of the folder page parsing with the number of workers: threads
+(limited by the GIL) vs. worker processes ('parse_processes'). The pages
+are fetched once from the offline fake ilias server (tests/fake_ilias.py)
+and then parsed from memory.
+
+	python benchmarks/bench_parse.py --max-workers 8 --files 50
+"""
+
+import argparse
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from urllib.request import Request, urlopen
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "tests"))
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from IliasDownloaderUniMA.parsing import parseFolderPage
+from fake_ilias import FakeIlias, FakeIliasServer
+
+
+def fetchPages(ilias, server):
+	"""
+	Returns the contents of all folder pages.
+	"""
+
+	headers = {'Cookie': f"PHPSESSID={server.session_id}"}
+	return [urlopen(Request(f"{server.base_url}ilias.php?ref_id={node_id}&cmd=view", headers=headers)).read()
+		for node_id, node in ilias.nodes.items() if node['kind'] in ('course', 'folder')]
+
+
+def pagesPerSecond(executor, pages, base_url, repeat):
+	work = pages * repeat
+	# Warm up the workers (imports, compiled XPath)
+	list(executor.map(parseFolderPage, pages[:executor._max_workers], ["Course"] * len(pages), [base_url] * len(pages)))
+	start = time.perf_counter()
+	list(executor.map(parseFolderPage, work, ["Course"] * len(work), [base_url] * len(work), chunksize=1))
+	return len(work) / (time.perf_counter() - start)
+
+
+def main():
+	parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+	parser.add_argument('--courses', type=int, default=2)
+	parser.add_argument('--depth', type=int, default=2)
+	parser.add_argument('--fanout', type=int, default=3)
+	parser.add_argument('--files', type=int, default=30, help="files per folder")
+	parser.add_argument('--repeat', type=int, default=5, help="parse every page this often")
+	parser.add_argument('--max-workers', type=int, default=os.cpu_count())
+	args = parser.parse_args()
+
+	ilias = FakeIlias(num_courses=args.courses, depth=args.depth, fanout=args.fanout,
+		files_per_folder=args.files, task_units=0)
+	with FakeIliasServer(ilias) as server:
+		pages = fetchPages(ilias, server)
+		base_url = server.base_url
+	print(f"{len(pages)} folder pages, {sum(map(len, pages)) / len(pages) / 1e3:.1f} KB per page, "
+		f"{os.cpu_count()} cores")
+	print(f"{'workers':>8} {'threads':>14} {'processes':>14}")
+	for n in range(1, args.max_workers + 1):
+		with ThreadPoolExecutor(n) as executor:
+			threads = pagesPerSecond(executor, pages, base_url, args.repeat)
+		with ProcessPoolExecutor(n) as executor:
+			processes = pagesPerSecond(executor, pages, base_url, args.repeat)
+		print(f"{n:8d} {threads:9.1f} pg/s {processes:9.1f} pg/s")
+
+
+if __name__ == "__main__":
+	main()
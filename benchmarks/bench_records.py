@@ -0,0 +1,67 @@
+#!/usr/bin/env python3
+"""
+Memory per file record and append throughput of the files list: plain
+dicts in a list vs. FileRecords in a FileList.
+
+	python benchmarks/bench_records.py
+"""
+
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from IliasDownloaderUniMA.records import FileRecord, FileList
+from datetime import datetime
+import threading
+import time
+import tracemalloc
+
+num_records = 100000
+num_threads = 8
+
+
+def fileDict(i):
+	# Build the strings at runtime like the scanner does
+	course = "".join(["Course ", str(i % 20)])
+	return {
+		'course': course,
+		'type': "".join(["fi", "le"]),
+		'name': f"file_{i}.pdf",
+		'size': 0.5,
+		'mod-date': datetime(2020, 9, 17, 14, 59),
+		'url': f"https://ilias.uni-mannheim.de/goto.php?target=file_{i}_download",
+		'path': "".join([course, "/Folder ", str(i % 100), "/"])
+	}
+
+
+def memoryPerRecord(make):
+	tracemalloc.start()
+	records = [make(fileDict(i)) for i in range(num_records)]
+	size, _ = tracemalloc.get_traced_memory()
+	tracemalloc.stop()
+	return size / len(records)
+
+
+def appendThroughput(files, append):
+	dicts = [fileDict(i) for i in range(num_records)]
+	chunk = num_records // num_threads
+	def add(k):
+		for d in dicts[k * chunk:(k + 1) * chunk]:
+			append(d)
+	threads = [threading.Thread(target=add, args=(k,)) for k in range(num_threads)]
+	start = time.perf_counter()
+	for t in threads:
+		t.start()
+	for t in threads:
+		t.join()
+	return len(files) / (time.perf_counter() - start)
+
+
+if __name__ == "__main__":
+	print(f"dict:       {memoryPerRecord(lambda d: d):8.0f} bytes/record")
+	print(f"FileRecord: {memoryPerRecord(FileRecord.fromDict):8.0f} bytes/record")
+	files = []
+	print(f"list += [dict]:     {appendThroughput(files, lambda d: files.__iadd__([d])):10.0f} appends/s")
+	files = FileList()
+	print(f"FileList.append:    {appendThroughput(files, files.append):10.0f} appends/s")
@@ -25,5 +25,8 @@ setup(
 		"requests",
 		"python-dateutil",
 		"lxml",
-	]
+	],
+	extras_require = {
+		"session": ["cryptography"],
+	}
 )
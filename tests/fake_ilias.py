@@ -0,0 +1,503 @@
+"""
+Offline stand-in for ilias.uni-mannheim.de and cas.uni-mannheim.de.
+
+FakeIlias generates a deterministic course tree (folders, files, videos,
+task units with submissions) and FakeIliasServer serves it over HTTP with
+the markup the downloader parses. Latency and error rates can be injected
+per request. Used by the end-to-end tests and the benchmarks:
+
+	with FakeIliasServer(FakeIlias(num_courses=2, depth=2)) as server:
+		m = IliasDownloaderUniMA()
+		server.configure(m)
+		m.login(server.username, server.password)
+		...
+"""
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+import html
+import io
+import random
+import re
+import threading
+import time
+import zipfile
+
+umlauts = [('ü', 'ue'), ('Ü', 'Ue'), ('ä', 'ae'), ('Ä', 'Ae'), ('ö', 'oe'), ('Ö', 'Oe'), ('ß', 'ss')]
+
+
+def replaceUmlauts(text):
+	for a, b in umlauts:
+		text = text.replace(a, b)
+	return text
+
+
+def fileContent(node_id, start, end):
+	"""
+	Returns the bytes [start, end) of the deterministic content of a file.
+	"""
+
+	pattern = bytes((node_id * 7 + i) % 256 for i in range(256))
+	first = start % 256
+	data = (pattern[first:] + pattern * ((end - start) // 256 + 1))[:end - start]
+	return data
+
+
+class FakeIlias():
+	"""
+	Generated ilias course tree. Every node has an id, which is used as ref
+	id (courses, folders, task units), file id or media object id.
+	"""
+
+	def __init__(self, num_courses=2, depth=2, fanout=2, files_per_folder=3, file_size=20000,
+		videos_per_folder=0, video_size=500000, task_units=1, task_files=1, num_submissions=3,
+		semester="HWS 2020", mod_date="17. Sep 2020, 14:59", deadline="12. Okt 2020, 09:30",
+		background_task_delay=0.0, seed=0):
+		"""
+		Generates the course tree.
+
+		:param      num_courses:            The number of courses
+		:param      depth:                  The depth of the folder tree per course
+		:param      fanout:                 The number of subfolders per folder
+		:param      files_per_folder:       The number of files per folder
+		:param      file_size:              The size of each file in bytes
+		:param      videos_per_folder:      The number of videos per folder
+		:param      video_size:             The size of each video in bytes
+		:param      task_units:             The number of task units per course
+		:param      task_files:             The number of files per task unit
+		:param      num_submissions:        The number of submissions per task unit
+		:param      semester:               The semester in the course names
+		:param      mod_date:               The modification date of the files
+		:param      deadline:               The deadline of the task units
+		:param      background_task_delay:  Seconds until a submission zip is ready
+		:param      seed:                   The random seed
+		"""
+
+		self.semester = semester
+		self.mod_date = mod_date
+		self.deadline = deadline
+		self.background_task_delay = background_task_delay
+		self.num_submissions = num_submissions
+		self.lock = threading.Lock()
+		self.random = random.Random(seed)
+		self.nodes = {}
+		self.courses = []
+		self.background_tasks = {}
+		self.next_task_id = 0
+		self.next_id = 1000
+		for c in range(num_courses):
+			course = self.addNode(None, 'course', f"Course {c + 1} [V] ({semester})")
+			self.courses.append(course)
+			self._generateFolder(course, depth, fanout, files_per_folder, file_size, videos_per_folder, video_size)
+			for t in range(task_units):
+				unit = self.addNode(course, 'task', f"Übungsblatt {t + 1}")
+				for k in range(task_files):
+					self.addNode(unit, 'file', f"blatt_{t + 1}_{k + 1}.pdf", file_size)
+
+
+	def _generateFolder(self, folder, depth, fanout, files_per_folder, file_size, videos_per_folder, video_size):
+		for k in range(files_per_folder):
+			self.addNode(folder, 'file', f"Datei {k + 1}", file_size)
+		for k in range(videos_per_folder):
+			self.addNode(folder, 'video', f"Video_{k + 1}.mp4", video_size)
+		if depth > 0:
+			for k in range(fanout):
+				sub = self.addNode(folder, 'folder', f"Ordner {depth}.{k + 1}")
+				self._generateFolder(sub, depth - 1, fanout, files_per_folder, file_size, videos_per_folder, video_size)
+
+
+	def addNode(self, parent, kind, name, size=0, mod_date=None, content=None):
+		"""
+		Adds a node to the tree, e.g. to simulate a new upload. A file can
+		have the content of another file (content=<node id>).
+
+		:returns:   the node id
+		:rtype:     int
+		"""
+
+		with self.lock:
+			node_id = self.next_id
+			self.next_id += 1
+			self.nodes[node_id] = {
+				'id': node_id,
+				'kind': kind,
+				'name': name,
+				'parent': parent,
+				'children': [],
+				'size': size,
+				'mod_date': mod_date or self.mod_date,
+				'content': content or node_id
+			}
+			if parent is not None:
+				self.nodes[parent]['children'].append(node_id)
+		return node_id
+
+
+	def linkNode(self, parent, node_id):
+		"""
+		Shows an existing node in another folder as well (same id).
+		"""
+
+		with self.lock:
+			self.nodes[parent]['children'].append(node_id)
+
+
+	def breadcrumb(self, node_id):
+		names = []
+		while node_id is not None:
+			names.append(self.nodes[node_id]['name'])
+			node_id = self.nodes[node_id]['parent']
+		return ["Magazin", self.semester] + names[::-1]
+
+
+	def courseOf(self, node_id):
+		while self.nodes[node_id]['parent'] is not None:
+			node_id = self.nodes[node_id]['parent']
+		return node_id
+
+
+	def files(self):
+		"""
+		Returns all file, video and task unit file nodes.
+		"""
+
+		return [n for n in self.nodes.values() if n['kind'] in ('file', 'video')]
+
+
+	def submissionZip(self, unit_id):
+		"""
+		Returns the submissions zip of a task unit.
+		"""
+
+		unit = self.nodes[unit_id]
+		buf = io.BytesIO()
+		with zipfile.ZipFile(buf, 'w') as z:
+			for k in range(self.num_submissions):
+				z.writestr(f"{unit['name']}/Student_{k + 1}_stud{k + 1}/abgabe.pdf", fileContent(unit_id + k, 0, 2000))
+		return buf.getvalue()
+
+
+class Handler(BaseHTTPRequestHandler):
+
+	protocol_version = "HTTP/1.1"
+
+
+	def log_message(self, *args):
+		pass
+
+
+	@property
+	def ilias(self):
+		return self.server.ilias
+
+
+	def do_HEAD(self):
+		self.handle_request('HEAD')
+
+
+	def do_GET(self):
+		self.handle_request('GET')
+
+
+	def do_POST(self):
+		length = int(self.headers.get('Content-Length') or 0)
+		self.body = parse_qs(self.rfile.read(length).decode())
+		self.handle_request('POST')
+
+
+	def handle_request(self, method):
+		self.method = method
+		server = self.server
+		if server.latency:
+			time.sleep(server.latency)
+		url = urlparse(self.path)
+		self.query = {k: v[0] for k, v in parse_qs(url.query).items()}
+		server.count('requests')
+		if server.error_rate and server.random.random() < server.error_rate:
+			server.count('errors')
+			return self.send(503, b"Service Unavailable")
+		if url.path == "/cas/login":
+			return self.cas()
+		if self.query.get('ticket') == f"ST-{server.session_id}":
+			# Redirect target of the CAS login, sets the session cookie
+			return self.desktop({'Set-Cookie': f"PHPSESSID={server.session_id}; Path=/"})
+		if not self.authenticated():
+			return self.send(200, self.page("<form action='/cas/login'>Login</form>"))
+		if url.path.startswith("/data/ILIAS/mobs/"):
+			match = re.match(r"/data/ILIAS/mobs/mm_(\d+)/", url.path)
+			return self.download(int(match.group(1)))
+		if url.path == "/goto.php":
+			match = re.match(r"file_(\d+)_download", self.query.get('target', ''))
+			return self.download(int(match.group(1)))
+		if 'bgtasks' in self.query:
+			return self.backgroundTasks()
+		if 'bgtask' in self.query:
+			return self.backgroundTask(int(self.query['bgtask']))
+		if 'ref_id' in self.query:
+			return self.repository(int(self.query['ref_id']))
+		return self.desktop()
+
+
+	def send(self, status, body=b"", headers={}):
+		self.send_response(status)
+		for k, v in headers.items():
+			self.send_header(k, v)
+		if 'Content-Type' not in headers:
+			self.send_header('Content-Type', 'text/html; charset=utf-8')
+		self.send_header('Content-Length', str(len(body)))
+		self.end_headers()
+		if self.method != 'HEAD':
+			self.wfile.write(body)
+
+
+	def authenticated(self):
+		return f"PHPSESSID={self.server.session_id}" in (self.headers.get('Cookie') or "")
+
+
+	def page(self, body, breadcrumb=None):
+		ol = ""
+		if breadcrumb:
+			ol = "<ol>\n" + "".join(f"<li><a href=\"#\">{html.escape(b)}</a></li>\n" for b in breadcrumb) + "</ol>"
+		return ("<!DOCTYPE html>\n<html><head><meta charset=\"utf-8\"><title>ILIAS</title></head>"
+			f"<body><div id=\"mainscrolldiv\">\n{ol}\n</div>\n{body}\n</body></html>").encode()
+
+
+	def cas(self):
+		server = self.server
+		if self.method == 'POST':
+			if self.body.get('username') == [server.username] and self.body.get('password') == [server.password] \
+				and self.body.get('execution') == ['e1s1']:
+				return self.send(302, headers={'Location': f"{server.base_url}?ticket=ST-{server.session_id}"})
+			return self.send(200, self.page("<p>Invalid credentials.</p>"))
+		return self.send(200, self.page(
+			"<form action=\"/cas/login\" method=\"post\">"
+			"<input name=\"username\" value=\"\"/><input name=\"password\" value=\"\"/>"
+			"<input type=\"hidden\" name=\"execution\" value=\"e1s1\"/>"
+			"<input type=\"hidden\" name=\"_eventId\" value=\"submit\"/></form>"))
+
+
+	def desktop(self, headers={}):
+		self.server.count('pages')
+		ilias = self.ilias
+		courses = "".join(
+			f"<div class=\"il_ContainerListItem\"><a class=\"il_ContainerItemTitle\" href=\"ilias.php?ref_id={c}"
+			f"&amp;cmdClass=ilrepositorygui&amp;cmdNode=vi&amp;baseClass=ilrepositorygui\">"
+			f"{html.escape(ilias.nodes[c]['name'])}</a></div>" for c in ilias.courses)
+		return self.send(200, self.page(
+			"<a id=\"mm_desktop\" href=\"#\">Dashboard</a>"
+			"<li id=\"mm_tb_background_tasks\" refresh-uri=\"ilias.php?bgtasks=1\"></li>" + courses), headers)
+
+
+	def repository(self, ref_id):
+		if (node := self.ilias.nodes.get(ref_id)) is None:
+			return self.send(404, self.page("<p>Not found</p>"))
+		if node['kind'] in ('course', 'folder'):
+			return self.folder(node)
+		if node['kind'] == 'task':
+			if self.query.get('cmd') == 'members':
+				return self.submissions(node)
+			if self.method == 'POST':
+				return self.requestSubmissions(node)
+			return self.taskUnit(node)
+		return self.send(404, self.page("<p>Not found</p>"))
+
+
+	def folder(self, node):
+		self.server.count('pages')
+		ilias = self.ilias
+		videos, items = [], []
+		for child in [ilias.nodes[c] for c in node['children']]:
+			name = html.escape(child['name'])
+			if child['kind'] == 'video':
+				videos.append(
+					"<figure class=\"ilc_media_cont_MediaContainer\"><div class=\"ilc_Mob\">"
+					"<video class=\"ilPageVideo\" preload=\"none\">"
+					f"<source src=\"./data/ILIAS/mobs/mm_{child['id']}/{name}?il_wac_token=abc{child['id']}"
+					"&amp;il_wac_ttl=3&amp;il_wac_ts=1603624381\" type=\"video/mp4\"/>"
+					"</video></div></figure>")
+			elif child['kind'] == 'file':
+				size = f"{child['size'] / 1000:.1f} KB".replace(".", ",")
+				items.append(
+					f"<div class=\"il_ContainerListItem\"><div class=\"il_ContainerItemTitle\">"
+					f"<a href=\"goto.php?target=file_{child['id']}_download&amp;client_id=ILIAS\">{name}</a></div>"
+					"<div class=\"ilListItemSection il_ItemProperties\">"
+					"<span class=\"il_ItemProperty\">pdf&nbsp;&nbsp;</span>"
+					f"<span class=\"il_ItemProperty\">{size}&nbsp;&nbsp;</span>"
+					f"<span class=\"il_ItemProperty\">{child['mod_date']}&nbsp;&nbsp;</span></div></div>")
+			elif child['kind'] in ('folder', 'task'):
+				cmd = "view&amp;cmdClass=ilrepositorygui" if child['kind'] == 'folder' else "showOverview&amp;cmdClass=ilobjexercisegui"
+				items.append(
+					f"<div class=\"il_ContainerListItem\"><div class=\"il_ContainerItemTitle\">"
+					f"<a href=\"ilias.php?ref_id={child['id']}&amp;cmd={cmd}&amp;baseClass=ilrepositorygui\">{name}</a>"
+					"</div></div>")
+		body = "<div class=\"ilc_page_Page\">" + "".join(videos) + "</div><div class=\"ilContainerBlock\">" + "".join(items) + "</div>"
+		return self.send(200, self.page(body, self.ilias.breadcrumb(node['id'])))
+
+
+	def taskUnit(self, node):
+		self.server.count('pages')
+		ilias = self.ilias
+		files = "".join(
+			"<div class=\"form-group\">"
+			f"<div class=\"il_InfoScreenProperty\">{html.escape(ilias.nodes[c]['name'])}</div>"
+			f"<div><a href=\"goto.php?target=file_{c}_download\">Herunterladen</a></div></div>"
+			for c in node['children'])
+		body = (f"<a class=\"ilAccAnchor\" href=\"#\">{html.escape(node['name'])}</a>"
+			f"<div id=\"infoscreen_section_1\">{files}</div>"
+			"<div id=\"infoscreen_section_2\"><div class=\"ilHeader\">Termine</div>"
+			"<div class=\"form-group\"><div class=\"il_InfoScreenProperty\">Abgabetermin</div>"
+			f"<div class=\"il_InfoScreenPropertyValue col-xs-9\">{ilias.deadline}</div></div></div>"
+			f"<ul id=\"ilTab\"><li id=\"tab_grades\"><a href=\"ilias.php?ref_id={node['id']}&amp;cmd=members\">Abgaben</a></li></ul>")
+		return self.send(200, self.page(body, self.ilias.breadcrumb(node['id'])))
+
+
+	def submissions(self, node):
+		self.server.count('pages')
+		body = (f"<form id=\"ilToolbar\" method=\"post\" action=\"ilias.php?ref_id={node['id']}&amp;cmd=post\"></form>"
+			f"<h1><span id=\"il_mhead_t_focus\">\n{html.escape(node['name'])}\n</span></h1>")
+		return self.send(200, self.page(body, self.ilias.breadcrumb(node['id'])))
+
+
+	def requestSubmissions(self, node):
+		ilias = self.ilias
+		with ilias.lock:
+			ilias.next_task_id += 1
+			task_id = ilias.next_task_id
+			ilias.background_tasks[task_id] = {
+				'unit': node['id'],
+				'title': replaceUmlauts(node['name']),
+				'ready': time.monotonic() + ilias.background_task_delay
+			}
+		return self.send(200, self.page("<p>Der Download wird vorbereitet.</p>"))
+
+
+	def backgroundTasks(self):
+		self.server.count('pages')
+		items = []
+		for task_id, task in list(self.ilias.background_tasks.items()):
+			buttons = f"<button class=\"btn btn-default\" data-action=\"ilias.php?bgtask={task_id}&amp;cmd=remove\">Entfernen</button>"
+			if time.monotonic() >= task['ready']:
+				buttons = (f"<button class=\"btn btn-default\" data-action=\"ilias.php?bgtask={task_id}&amp;cmd=download\">"
+					"Herunterladen</button>" + buttons)
+			items.append(f"<div class=\"il-item-task\"><div class=\"il-item-task-title\">{html.escape(task['title'])}</div>{buttons}</div>")
+		return self.send(200, self.page("".join(items)))
+
+
+	def backgroundTask(self, task_id):
+		ilias = self.ilias
+		if (task := ilias.background_tasks.get(task_id)) is None:
+			return self.send(404, b"")
+		if self.query.get('cmd') == 'remove':
+			with ilias.lock:
+				ilias.background_tasks.pop(task_id, None)
+			return self.send(200, b"")
+		data = ilias.submissionZip(task['unit'])
+		self.server.count('files')
+		self.server.count('bytes', len(data))
+		return self.send(200, data, {'Content-Type': 'application/zip'})
+
+
+	def download(self, node_id):
+		if (node := self.ilias.nodes.get(node_id)) is None:
+			return self.send(404, b"")
+		size = node['size']
+		headers = {'Content-Type': 'application/octet-stream', 'Accept-Ranges': 'bytes'}
+		start, end, status = 0, size, 200
+		if (match := re.match(r"bytes=(\d+)-(\d*)", self.headers.get('Range') or "")):
+			start = int(match.group(1))
+			end = min(size, int(match.group(2)) + 1 if match.group(2) else size)
+			if start >= size:
+				return self.send(416, b"", {'Content-Range': f"bytes */{size}"})
+			status = 206
+			headers['Content-Range'] = f"bytes {start}-{end - 1}/{size}"
+		if self.method == 'HEAD':
+			self.send_response(200)
+			self.send_header('Content-Length', str(size))
+			self.end_headers()
+			return
+		self.server.count('files')
+		self.server.count('bytes', end - start)
+		self.send_response(status)
+		for k, v in headers.items():
+			self.send_header(k, v)
+		self.send_header('Content-Length', str(end - start))
+		self.end_headers()
+		chunk = 1 << 16
+		for pos in range(start, end, chunk):
+			self.wfile.write(fileContent(node['content'], pos, min(end, pos + chunk)))
+
+
+class FakeIliasServer(ThreadingHTTPServer):
+	"""
+	HTTP server for a FakeIlias tree on 127.0.0.1. Counts requests, pages,
+	files, bytes and new connections.
+	"""
+
+	daemon_threads = True
+
+
+	def __init__(self, ilias, latency=0.0, error_rate=0.0, username="user", password="secret", seed=0):
+		"""
+		:param      ilias:       The course tree
+		:param      latency:     Seconds of delay for every request
+		:param      error_rate:  Fraction of requests answered with 503
+		"""
+
+		super().__init__(("127.0.0.1", 0), Handler)
+		self.ilias = ilias
+		self.latency = latency
+		self.error_rate = error_rate
+		self.username = username
+		self.password = password
+		self.session_id = "fake%08d" % seed
+		self.random = random.Random(seed)
+		self.stats_lock = threading.Lock()
+		self.stats = {}
+		self.base_url = f"http://127.0.0.1:{self.server_address[1]}/"
+		self.desktop_url = self.base_url + "ilias.php?baseClass=ilPersonalDesktopGUI"
+		self.cas_url = self.base_url + "cas/login"
+		self.thread = None
+
+
+	def handle_error(self, request, client_address):
+		# Clients closing their keep-alive connections are not an error
+		pass
+
+
+	def count(self, key, n=1):
+		with self.stats_lock:
+			self.stats[key] = self.stats.get(key, 0) + n
+
+
+	def process_request(self, request, client_address):
+		self.count('connections')
+		super().process_request(request, client_address)
+
+
+	def configure(self, downloader):
+		"""
+		Points an IliasDownloaderUniMA instance at this server.
+		"""
+
+		downloader.base_url = self.base_url
+		downloader.desktop_url = self.desktop_url
+		downloader.cas_url = self.cas_url
+
+
+	def start(self):
+		self.thread = threading.Thread(target=self.serve_forever, daemon=True)
+		self.thread.start()
+		return self
+
+
+	def stop(self):
+		self.shutdown()
+		self.server_close()
+
+
+	def __enter__(self):
+		return self.start()
+
+
+	def __exit__(self, *args):
+		self.stop()
@@ -0,0 +1,22 @@
+from IliasDownloaderUniMA import IliasDownloaderUniMA
+from IliasDownloaderUniMA.tasks import taskKey
+import math
+
+### Tests for matching the submission zips with the background tasks
+# ------------------------------------------------------------------------------
+
+def test_task_key():
+	assert taskKey("Übungsblatt 1: Größen.zip") == taskKey("Uebungsblatt  1: Groessen.zip")
+	assert taskKey(taskKey("Übung.zip")) == taskKey("Übung.zip")
+	# Decomposed umlauts (e.g. from macOS) match as well
+	assert taskKey("Übung.zip") == taskKey("Übung.zip")
+
+def test_search_background_task_file():
+	m = IliasDownloaderUniMA()
+	for course in ["Course 1", "Course 2"]:
+		m.background_task_files.setdefault(taskKey("Übungsblatt 1.zip"), []).append(
+			{'course': course, 'name': "Übungsblatt 1.zip", 'size': math.nan})
+	assert m.searchBackgroundTaskFile("Uebungsblatt 1.zip")['course'] == "Course 1"
+	assert m.searchBackgroundTaskFile("Uebungsblatt 1.zip")['course'] == "Course 2"
+	assert m.searchBackgroundTaskFile("Uebungsblatt 1.zip") is None
+	assert m.background_task_files == {}
@@ -0,0 +1,52 @@
+from IliasDownloaderUniMA.crawler import Crawler, crawlKey
+import threading
+
+### Tests for the Crawler
+# ------------------------------------------------------------------------------
+
+def folder(ref_id):
+	return {'type': 'folder', 'name': str(ref_id), 'url': f"ilias.php?ref_id={ref_id}&cmd=view"}
+
+# Every folder links to its two children and back to the root folder 1
+tree = {i: [folder(2*i), folder(2*i + 1), folder(1)] for i in range(1, 64)}
+
+def test_crawlKey():
+	assert crawlKey(folder(42)) == "42"
+	assert crawlKey({'url': "goto.php?target=file_1_download"}) == "goto.php?target=file_1_download"
+
+def test_visits_every_folder_once():
+	visits = []
+	lock = threading.Lock()
+	def scan(item):
+		with lock:
+			visits.append(item['name'])
+		return tree.get(int(item['name']), [])
+	errors = Crawler(scan, num_workers=8).run([folder(1)])
+	assert errors == []
+	assert sorted(visits, key=int) == [str(i) for i in range(1, 128)]
+
+def test_failing_scan_is_reported():
+	def scan(item):
+		if item['name'] == "3":
+			raise ValueError("broken page")
+		return tree.get(int(item['name']), [])
+	errors = Crawler(scan, num_workers=4).run([folder(1)])
+	assert len(errors) == 1
+	assert errors[0][0]['name'] == "3"
+	assert isinstance(errors[0][1], ValueError)
+
+def test_host_limit():
+	running = []
+	peak = []
+	lock = threading.Lock()
+	def scan(item):
+		with lock:
+			running.append(item)
+			peak.append(len(running))
+		threading.Event().wait(0.005)
+		with lock:
+			running.remove(item)
+		return tree.get(int(item['name']), [])
+	errors = Crawler(scan, num_workers=8, host_limit=2).run([folder(1)])
+	assert errors == []
+	assert max(peak) <= 2
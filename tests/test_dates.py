@@ -0,0 +1,46 @@
+from IliasDownloaderUniMA.dates import parseIliasDate
+from dateparser import parse as parsedate
+import datetime
+
+### Tests for parseIliasDate()
+# ------------------------------------------------------------------------------
+
+samples = [
+	"17. Sep 2020, 14:59",
+	"12. Okt 2020, 09:30",
+	"1. Mär 2021, 08:00",
+	"3. Dez 2020, 23:59",
+	"12. Oct 2020, 09:30",
+	"24. Dec 2020, 18:00",
+	"31. Aug 2020, 12:31\xa0\xa0",
+]
+
+def test_absolute_dates():
+	assert parseIliasDate("17. Sep 2020, 14:59") == datetime.datetime(2020, 9, 17, 14, 59)
+	assert parseIliasDate("\n\t\t12. Okt 2020, 09:30\xa0\xa0") == datetime.datetime(2020, 10, 12, 9, 30)
+	assert parseIliasDate("Montag, 12. Oktober 2020, 09:30") == datetime.datetime(2020, 10, 12, 9, 30)
+	assert parseIliasDate("1. Mär 2021, 08:00") == datetime.datetime(2021, 3, 1, 8, 0)
+
+def test_same_as_dateparser():
+	for s in samples:
+		assert parseIliasDate(s) == parsedate(s)
+
+def test_relative_dates():
+	today = datetime.date.today()
+	assert parseIliasDate("Heute, 10:15") == datetime.datetime(today.year, today.month, today.day, 10, 15)
+	yesterday = today - datetime.timedelta(days=1)
+	assert parseIliasDate("Yesterday, 09:30") == datetime.datetime(yesterday.year, yesterday.month, yesterday.day, 9, 30)
+	tomorrow = today + datetime.timedelta(days=1)
+	assert parseIliasDate("Morgen, 23:59") == datetime.datetime(tomorrow.year, tomorrow.month, tomorrow.day, 23, 59)
+
+def test_fallback():
+	assert parseIliasDate("2020-09-17 14:59") == datetime.datetime(2020, 9, 17, 14, 59)
+
+def test_fallback_isnt_cached(monkeypatch):
+	import dateparser
+	calls = []
+	monkeypatch.setattr(dateparser, 'parse', lambda text: calls.append(text) or datetime.datetime.now())
+	# Relative to now, e.g. in the watch mode
+	parseIliasDate("vor 5 Minuten")
+	parseIliasDate("vor 5 Minuten")
+	assert calls == ["vor 5 Minuten"] * 2
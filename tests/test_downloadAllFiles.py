@@ -0,0 +1,45 @@
+from IliasDownloaderUniMA import IliasDownloaderUniMA
+import datetime
+import threading
+
+### Tests for the scan -> download pipeline of downloadAllFiles()
+# ------------------------------------------------------------------------------
+
+def fileRecord(i):
+	return {
+		'course': 'Course',
+		'type': 'file',
+		'name': f"file_{i}.pdf",
+		'size': 0.1,
+		'mod-date': datetime.datetime(2020, 9, 17, 14, 59),
+		'url': f"https://ilias.uni-mannheim.de/goto.php?target=file_{i}_download",
+		'path': 'Course/'
+	}
+
+class PipelineDownloader(IliasDownloaderUniMA):
+	def __init__(self):
+		super().__init__()
+		self.downloaded = []
+		self.first_download = threading.Event()
+		self.lock = threading.Lock()
+
+	def scanCourses(self):
+		self.addFile(fileRecord(0))
+		# The first file is downloaded while the scan is still running
+		assert self.first_download.wait(5)
+		for i in range(1, 50):
+			self.addFile(fileRecord(i))
+
+	def downloadFile(self, file):
+		with self.lock:
+			self.downloaded.append(file['name'])
+		self.first_download.set()
+
+def test_downloads_start_before_scan_finishes(tmp_path):
+	m = PipelineDownloader()
+	m.setParam('download_path', str(tmp_path))
+	m.setParam('download_queue_size', 4)
+	m.downloadAllFiles()
+	assert sorted(m.downloaded) == sorted(f['name'] for f in m.files)
+	assert len(m.downloaded) == 50
+	assert m.download_queue is None
@@ -0,0 +1,192 @@
+from IliasDownloaderUniMA import IliasDownloaderUniMA
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from requests import session
+import datetime
+import os
+import pytest
+import re
+import threading
+
+### Tests for downloadFile() against a local HTTP server
+# ------------------------------------------------------------------------------
+
+content = bytes(range(256)) * 4096
+
+class Handler(BaseHTTPRequestHandler):
+	support_range = True
+	etag = None
+	broken = 0
+	requests = []
+
+	def do_GET(self):
+		Handler.requests.append(self.headers.get('Range'))
+		match = re.match(r"bytes=(\d+)-(\d*)", self.headers.get('Range') or "")
+		# The range of another version of the file is ignored
+		if_range = self.headers.get('If-Range')
+		if match and self.support_range and (if_range is None or if_range == self.etag):
+			start = int(match.group(1))
+			end = int(match.group(2)) if match.group(2) else len(content) - 1
+			if start >= len(content):
+				self.send_response(416)
+				self.send_header('Content-Range', f"bytes */{len(content)}")
+				self.end_headers()
+				return
+			self.send_response(206)
+			self.send_header('Content-Range', f"bytes {start}-{end}/{len(content)}")
+			body = content[start:end + 1]
+		else:
+			self.send_response(200)
+			body = content
+		self.send_header('Content-Length', str(len(body)))
+		self.send_header('Accept-Ranges', 'bytes')
+		if self.etag:
+			self.send_header('ETag', self.etag)
+		self.end_headers()
+		if Handler.broken:
+			# The connection breaks off after 100 KB
+			Handler.broken -= 1
+			self.wfile.write(body[:100000])
+			self.close_connection = True
+			return
+		self.wfile.write(body)
+
+	def log_message(self, *args):
+		pass
+
+@pytest.fixture
+def server():
+	Handler.support_range = True
+	Handler.etag = None
+	Handler.broken = 0
+	Handler.requests = []
+	httpd = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+	thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+	thread.start()
+	yield f"http://127.0.0.1:{httpd.server_address[1]}/file.mp4"
+	httpd.shutdown()
+	httpd.server_close()
+
+def downloader(tmp_path):
+	m = IliasDownloaderUniMA()
+	m.setParam('download_path', str(tmp_path))
+	m.session = session()
+	return m
+
+def fileRecord(url):
+	return {
+		'course': 'Course',
+		'type': 'file',
+		'name': 'video.mp4',
+		'size': len(content) * 1e-6,
+		'mod-date': datetime.datetime(2020, 9, 17, 14, 59),
+		'url': url,
+		'path': 'Course/'
+	}
+
+def test_download_is_renamed(tmp_path, server):
+	m = downloader(tmp_path)
+	(tmp_path / "Course").mkdir()
+	m.downloadFile(fileRecord(server))
+	assert (tmp_path / "Course" / "video.mp4").read_bytes() == content
+	assert not (tmp_path / "Course" / "video.mp4.part").exists()
+
+def test_resume_part_file(tmp_path, server):
+	m = downloader(tmp_path)
+	(tmp_path / "Course").mkdir()
+	(tmp_path / "Course" / "video.mp4.part").write_bytes(content[:1000])
+	m.downloadFile(fileRecord(server))
+	assert Handler.requests == ["bytes=1000-"]
+	assert (tmp_path / "Course" / "video.mp4").read_bytes() == content
+
+def test_resume_checks_the_version(tmp_path, server):
+	Handler.etag = '"v2"'
+	m = downloader(tmp_path)
+	part = tmp_path / "Course" / "video.mp4.part"
+	part.parent.mkdir()
+	part.write_bytes(b"x" * 1000)
+	(tmp_path / "Course" / "video.mp4.part.validator").write_text('"v1"')
+	# The remote file changed, so it's downloaded completely
+	m.downloadFile(fileRecord(server))
+	assert Handler.requests == ["bytes=1000-"]
+	assert (tmp_path / "Course" / "video.mp4").read_bytes() == content
+	assert os.listdir(tmp_path / "Course") == ["video.mp4"]
+
+def test_interrupted_download_is_resumed(tmp_path, server):
+	Handler.etag = '"v1"'
+	m = downloader(tmp_path)
+	def interrupted(r, f, hasher=None):
+		f.write(r.raw.read(1000))
+		raise OSError("Connection lost")
+	m._writeChunks = interrupted
+	assert isinstance(m.downloadFile(fileRecord(server)), OSError)
+	assert (tmp_path / "Course" / "video.mp4.part.validator").read_text() == '"v1"'
+	del m._writeChunks
+	m.downloadFile(fileRecord(server))
+	assert Handler.requests == [None, "bytes=1000-"]
+	assert (tmp_path / "Course" / "video.mp4").read_bytes() == content
+	assert os.listdir(tmp_path / "Course") == ["video.mp4"]
+
+def test_broken_transfer_is_retried(tmp_path, server):
+	Handler.etag = '"v1"'
+	Handler.broken = 1
+	m = downloader(tmp_path)
+	assert m.downloadFile(fileRecord(server)) is None
+	# The chunks received before are kept
+	assert Handler.requests == [None, f"bytes={m.chunk_size}-"]
+	assert (tmp_path / "Course" / "video.mp4").read_bytes() == content
+	assert os.listdir(tmp_path / "Course") == ["video.mp4"]
+
+def test_broken_transfer_fails_after_retries(tmp_path, server):
+	Handler.broken = 3
+	m = downloader(tmp_path)
+	m.setParam('max_retries', 1)
+	assert isinstance(m.downloadFile(fileRecord(server)), OSError)
+	assert len(Handler.requests) == 2
+	# The next run resumes the partial download
+	assert (tmp_path / "Course" / "video.mp4.part").exists()
+
+def test_complete_part_file_is_kept(tmp_path, server):
+	m = downloader(tmp_path)
+	(tmp_path / "Course").mkdir()
+	(tmp_path / "Course" / "video.mp4.part").write_bytes(content)
+	m.downloadFile(fileRecord(server))
+	assert Handler.requests == [f"bytes={len(content)}-"]
+	assert (tmp_path / "Course" / "video.mp4").read_bytes() == content
+	assert os.listdir(tmp_path / "Course") == ["video.mp4"]
+
+def test_resume_without_range_support(tmp_path, server):
+	Handler.support_range = False
+	m = downloader(tmp_path)
+	(tmp_path / "Course").mkdir()
+	(tmp_path / "Course" / "video.mp4.part").write_bytes(b"x" * 1000)
+	m.downloadFile(fileRecord(server))
+	assert (tmp_path / "Course" / "video.mp4").read_bytes() == content
+
+def test_outdated_part_file_is_discarded(tmp_path, server):
+	m = downloader(tmp_path)
+	(tmp_path / "Course").mkdir()
+	part = tmp_path / "Course" / "video.mp4.part"
+	part.write_bytes(b"x" * 1000)
+	os.utime(part, (0, 0))
+	m.downloadFile(fileRecord(server))
+	assert Handler.requests == [None]
+	assert (tmp_path / "Course" / "video.mp4").read_bytes() == content
+
+def test_segmented_download(tmp_path, server):
+	m = downloader(tmp_path)
+	m.setParam('segment_threshold', 1)
+	m.setParam('num_segments', 4)
+	m.downloadFile(fileRecord(server))
+	assert len(Handler.requests) == 4
+	assert all(r.startswith("bytes=") for r in Handler.requests)
+	assert (tmp_path / "Course" / "video.mp4").read_bytes() == content
+	assert os.listdir(tmp_path / "Course") == ["video.mp4"]
+
+def test_segmented_download_without_range_support(tmp_path, server):
+	Handler.support_range = False
+	m = downloader(tmp_path)
+	m.setParam('segment_threshold', 1)
+	m.setParam('num_segments', 4)
+	m.downloadFile(fileRecord(server))
+	assert len(Handler.requests) == 1
+	assert (tmp_path / "Course" / "video.mp4").read_bytes() == content
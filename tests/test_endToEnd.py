@@ -0,0 +1,288 @@
+from IliasDownloaderUniMA import IliasDownloaderUniMA
+from fake_ilias import FakeIlias, FakeIliasServer, fileContent
+from requests import ConnectionError
+import os
+import shutil
+import pytest
+import threading
+import zipfile
+
+### End-to-end tests against the offline fake ilias server
+# ------------------------------------------------------------------------------
+
+semester_pattern = r"\(HWS 2020\)"
+
+def downloader(server, tmp_path):
+	m = IliasDownloaderUniMA()
+	server.configure(m)
+	m.setParam('download_path', str(tmp_path))
+	m.login(server.username, server.password)
+	m.addAllSemesterCourses(semester_pattern)
+	return m
+
+def localFiles(tmp_path):
+	return sorted(os.path.relpath(os.path.join(d, f), tmp_path)
+		for d, _, files in os.walk(tmp_path) for f in files if not f.startswith(".iliasdl"))
+
+def test_login_fails_with_wrong_password():
+	with FakeIliasServer(FakeIlias(num_courses=1)) as server:
+		m = IliasDownloaderUniMA()
+		server.configure(m)
+		with pytest.raises(ConnectionError):
+			m.login(server.username, "wrong")
+
+def test_full_sync(tmp_path):
+	ilias = FakeIlias(num_courses=2, depth=2, fanout=2, files_per_folder=2, videos_per_folder=1)
+	with FakeIliasServer(ilias) as server:
+		m = downloader(server, tmp_path)
+		assert [c['name'] for c in m.courses] == ["Course 1 (HWS 2020)", "Course 2 (HWS 2020)"]
+		m.downloadAllFiles()
+		assert len(m.files) == len(ilias.files())
+		files = localFiles(tmp_path)
+		assert len(files) == len(ilias.files())
+		assert "Course 1 (HWS 2020)/Ordner 2.1/Ordner 1.2/Datei 2.pdf" in files
+		assert "Course 2 (HWS 2020)/Aufgaben/Übungsblatt 1/blatt_1_1.pdf" in files
+		video = [n for n in ilias.files() if n['kind'] == 'video'][0]
+		path = os.path.join(str(tmp_path), "Course 1 (HWS 2020)", video['name'])
+		assert open(path, 'rb').read() == fileContent(video['id'], 0, video['size'])
+		# Nothing changed, so the next run doesn't download anything
+		downloaded = server.stats['files']
+		m = downloader(server, tmp_path)
+		m.downloadAllFiles()
+		assert server.stats['files'] == downloaded
+		# A file deleted locally is downloaded again
+		os.remove(path)
+		m = downloader(server, tmp_path)
+		m.downloadAllFiles()
+		assert server.stats['files'] == downloaded + 1
+		assert open(path, 'rb').read() == fileContent(video['id'], 0, video['size'])
+
+def test_deleted_folder_is_restored(tmp_path):
+	ilias = FakeIlias(num_courses=1, depth=1, fanout=1, files_per_folder=1, task_units=0)
+	with FakeIliasServer(ilias) as server:
+		m = downloader(server, tmp_path)
+		m.downloadAllFiles()
+		files = localFiles(tmp_path)
+		assert len(files) == len(ilias.files())
+		# The same instance syncs again after the course folder was deleted
+		shutil.rmtree(os.path.join(str(tmp_path), "Course 1 (HWS 2020)"))
+		m.downloadAllFiles()
+		assert localFiles(tmp_path) == files
+
+def test_parse_processes(tmp_path):
+	ilias = FakeIlias(num_courses=2, depth=2, fanout=2, files_per_folder=2, videos_per_folder=1)
+	with FakeIliasServer(ilias) as server:
+		m = downloader(server, tmp_path)
+		m.setParam('parse_processes', 2)
+		m.setParam('page_cache', True)
+		m.setParam('tutor_mode', True)
+		# The processes are forked before the download threads are started
+		forked = []
+		startDownloadWorkers = m._startDownloadWorkers
+		m._startDownloadWorkers = lambda: forked.append(len(m.parse_executor._processes)) or startDownloadWorkers()
+		m.downloadAllFiles()
+		assert forked == [2]
+		assert m.parse_executor is None
+		assert len(localFiles(tmp_path)) == len(ilias.files()) + 2
+		# Same records as parsing in the scan threads (without the submissions)
+		threads = downloader(server, tmp_path)
+		threads.scanCourses()
+		assert sorted(repr(f) for f in m.files if "bgtask" not in f['url']) == sorted(map(repr, threads.files))
+
+def test_tutor_mode(tmp_path):
+	ilias = FakeIlias(num_courses=1, depth=0, files_per_folder=1, task_units=2, num_submissions=2)
+	with FakeIliasServer(ilias) as server:
+		m = downloader(server, tmp_path)
+		m.setParam('tutor_mode', True)
+		m.downloadAllFiles()
+		path = os.path.join(str(tmp_path), "Course 1 (HWS 2020)/Aufgaben/Übungsblatt 2/Uebungsblatt 2.zip")
+		with zipfile.ZipFile(path) as z:
+			assert len(z.namelist()) == 2
+		# The background tasks have been cleaned
+		assert ilias.background_tasks == {}
+
+def test_tutor_mode_with_minimal_concurrency(tmp_path):
+	ilias = FakeIlias(num_courses=1, depth=0, files_per_folder=1, task_units=2, num_submissions=2)
+	with FakeIliasServer(ilias) as server:
+		m = downloader(server, tmp_path)
+		m.setParam('tutor_mode', True)
+		# The limits after a few failures
+		m._maxInFlight = lambda: 1
+		m.setParam('num_download_threads', 1)
+		run = threading.Thread(target=m.downloadAllFiles, daemon=True)
+		run.start()
+		run.join(timeout=60)
+		assert not run.is_alive()
+		assert len([f for f in localFiles(tmp_path) if f.endswith(".zip")]) == 2
+		assert ilias.background_tasks == {}
+
+def test_extract_submissions(tmp_path):
+	ilias = FakeIlias(num_courses=1, depth=0, files_per_folder=1, task_units=2, num_submissions=2)
+	with FakeIliasServer(ilias) as server:
+		m = downloader(server, tmp_path)
+		m.setParam('tutor_mode', True)
+		m.setParam('extract_submissions', True)
+		m.downloadAllFiles()
+		unit = os.path.join("Course 1 (HWS 2020)", "Aufgaben", "Übungsblatt 2")
+		files = localFiles(tmp_path)
+		assert os.path.join(unit, "Student_2_stud2", "abgabe.pdf") in files
+		assert not [f for f in files if f.endswith(".zip")]
+		assert len([f for f in files if f.endswith("abgabe.pdf")]) == 4
+		first = os.path.join(str(tmp_path), unit, "Student_1_stud1", "abgabe.pdf")
+		mtime = os.path.getmtime(first)
+		# A new submission arrived, only that one is written
+		ilias.num_submissions = 3
+		m = downloader(server, tmp_path)
+		m.setParam('tutor_mode', True)
+		m.setParam('extract_submissions', True)
+		m.downloadAllFiles()
+		assert len([f for f in localFiles(tmp_path) if f.endswith("abgabe.pdf")]) == 6
+		assert os.path.getmtime(first) == mtime
+		assert m.metrics.summary()['stages']['extract']['bytes'] == 2 * 2000
+		assert ilias.background_tasks == {}
+
+def test_tutor_mode_dry_run(tmp_path):
+	ilias = FakeIlias(num_courses=1, depth=0, files_per_folder=1, task_units=2, num_submissions=2,
+		background_task_delay=60.0)
+	with FakeIliasServer(ilias) as server:
+		m = downloader(server, tmp_path)
+		m.setParam('tutor_mode', True)
+		m.setParam('dry_run', True)
+		m.downloadAllFiles()
+		# No zips are requested, so there's nothing to wait for
+		assert ilias.next_task_id == 0
+		assert 'poll' not in m.metrics.summary()['stages']
+		assert localFiles(tmp_path) == []
+
+def test_extract_stays_inside_the_unit(tmp_path):
+	from IliasDownloaderUniMA.manifest import SyncManifest
+	m = IliasDownloaderUniMA()
+	m.setParam('download_path', str(tmp_path))
+	m.manifest = SyncManifest(str(tmp_path / ".iliasdl.sqlite"))
+	zip_path = str(tmp_path / "Blatt 1.zip")
+	with zipfile.ZipFile(zip_path, 'w') as z:
+		z.writestr("Blatt 1\\Student_1\\abgabe.pdf", b"1")
+		z.writestr("..\\..\\Blatt 1\\Student_2\\abgabe.pdf", b"2")
+	m._extractSubmissions({'course': "Course", 'name': "Blatt 1.zip", 'path': os.path.join("Course", "Blatt 1")}, zip_path)
+	assert localFiles(tmp_path) == [os.path.join("Course", "Blatt 1", s, "abgabe.pdf") for s in ("Student_1", "Student_2")]
+
+def test_tutor_mode_waits_for_background_tasks(tmp_path):
+	ilias = FakeIlias(num_courses=2, depth=0, files_per_folder=1, task_units=3, num_submissions=2,
+		background_task_delay=1.0)
+	with FakeIliasServer(ilias) as server:
+		m = downloader(server, tmp_path)
+		m.setParam('tutor_mode', True)
+		m.downloadAllFiles()
+		zips = [f for f in localFiles(tmp_path) if f.endswith(".zip")]
+		assert len(zips) == 6
+		assert ilias.background_tasks == {}
+		assert m.metrics.summary()['stages']['poll']['count'] > 0
+
+def test_connection_pools(tmp_path):
+	ilias = FakeIlias(num_courses=2, depth=2, fanout=3, files_per_folder=4)
+	with FakeIliasServer(ilias) as server:
+		m = IliasDownloaderUniMA()
+		server.configure(m)
+		m.setParam('download_path', str(tmp_path))
+		m.setParam('num_scan_threads', 8)
+		m.setParam('num_download_threads', 12)
+		m.login(server.username, server.password)
+		m.addAllSemesterCourses(semester_pattern)
+		m.downloadAllFiles()
+		assert m.adapters[m.base_url]._pool_maxsize == m._poolSize()
+		stats = m.connectionStats()
+		assert stats[m.cas_url] == {'requests': 2, 'connections': 1}
+		# Every thread keeps its connection alive
+		assert stats[m.base_url]['connections'] <= m._poolSize()
+		assert server.stats['connections'] == stats[m.base_url]['connections'] + 1
+
+def test_session_cache(tmp_path):
+	pytest.importorskip("cryptography")
+	ilias = FakeIlias(num_courses=1, depth=0, files_per_folder=1)
+	with FakeIliasServer(ilias) as server:
+		def login(password=server.password):
+			m = IliasDownloaderUniMA()
+			server.configure(m)
+			m.setParam('download_path', str(tmp_path))
+			m.setParam('session_cache', True)
+			before = server.stats.get('requests', 0)
+			m.login(server.username, password)
+			m.addAllSemesterCourses(semester_pattern)
+			assert [c['name'] for c in m.courses] == ["Course 1 (HWS 2020)"]
+			return server.stats['requests'] - before
+		assert login() == 4
+		assert os.path.exists(os.path.join(str(tmp_path), ".iliasdl.session"))
+		assert server.session_id.encode() not in open(os.path.join(str(tmp_path), ".iliasdl.session"), 'rb').read()
+		# The restored session is validated by a single request
+		assert login() == 1
+		# Expired session
+		server.session_id = "expired"
+		assert login() == 5
+		assert login() == 1
+		# The cookies can't be decrypted with another password
+		with pytest.raises(ConnectionError):
+			login("wrong")
+
+def test_deduplicate(tmp_path):
+	ilias = FakeIlias(num_courses=2, depth=0, files_per_folder=2, file_size=50000, task_units=0)
+	course1, course2 = ilias.courses
+	file1, file2 = ilias.nodes[course1]['children'][:2]
+	folder = ilias.addNode(course2, 'folder', "Kopien")
+	# The same file in another course and a copy with another id
+	ilias.linkNode(folder, file1)
+	ilias.addNode(folder, 'file', "Kopie", 50000, content=file2)
+	with FakeIliasServer(ilias) as server:
+		m = downloader(server, tmp_path)
+		m.setParam('num_download_threads', 1)
+		m.setParam('deduplicate', True)
+		m.downloadAllFiles()
+		path = lambda *p: os.path.join(str(tmp_path), *p)
+		assert len(localFiles(tmp_path)) == 6
+		# The linked file isn't downloaded again
+		assert server.stats['files'] == 5
+		assert os.path.samefile(path("Course 1 (HWS 2020)", "Datei 1.pdf"), path("Course 2 (HWS 2020)", "Kopien", "Datei 1.pdf"))
+		assert os.path.samefile(path("Course 1 (HWS 2020)", "Datei 2.pdf"), path("Course 2 (HWS 2020)", "Kopien", "Kopie.pdf"))
+		assert open(path("Course 2 (HWS 2020)", "Kopien", "Kopie.pdf"), 'rb').read() == fileContent(file2, 0, 50000)
+		total = lambda key: sum(c[key] for c in m.metrics.summary()['courses'].values())
+		assert total('linked') == 2
+		assert total('saved') == 100000
+		assert total('not_downloaded') == 50000
+		# Nothing changed, so the next run doesn't download or link anything
+		m = downloader(server, tmp_path)
+		m.setParam('deduplicate', True)
+		m.downloadAllFiles()
+		assert server.stats['files'] == 5
+		assert sum(c['linked'] for c in m.metrics.summary()['courses'].values()) == 0
+
+def test_dry_run_and_download_order(tmp_path):
+	ilias = FakeIlias(num_courses=2, depth=0, files_per_folder=0, task_units=0)
+	course1, course2 = ilias.courses
+	for k, size in enumerate([30000, 10000, 20000]):
+		ilias.addNode(course1, 'file', f"Datei {k + 1}", size)
+	ilias.addNode(course2, 'file', "Skript", 5000)
+	with FakeIliasServer(ilias) as server:
+		m = downloader(server, tmp_path)
+		m.setParam('dry_run', True)
+		m.downloadAllFiles()
+		assert server.stats.get('files', 0) == 0
+		assert localFiles(tmp_path) == []
+		m = downloader(server, tmp_path)
+		m.setParam('dry_run', True)
+		m.scanCourses()
+		plan = m.planDownloads()
+		assert plan.courses["Course 1 (HWS 2020)"]['download'] == 3
+		assert plan.total()['bytes'] == 65000
+		# Download the smallest files first
+		m = downloader(server, tmp_path)
+		m.setParam('num_download_threads', 1)
+		m.setParam('download_order', 'smallest')
+		order = []
+		downloadFile = m.downloadFile
+		m.downloadFile = lambda file: order.append(file['name']) or downloadFile(file)
+		m.downloadAllFiles()
+		assert order == ["Skript.pdf", "Datei 2.pdf", "Datei 3.pdf", "Datei 1.pdf"]
+		assert len(localFiles(tmp_path)) == 4
+		# Everything is up to date now
+		m = downloader(server, tmp_path)
+		m.scanCourses()
+		assert m.planDownloads().total()['skip'] == 4
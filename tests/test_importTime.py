@@ -0,0 +1,36 @@
+import os
+import re
+import subprocess
+import sys
+
+### Import time of the package
+# ------------------------------------------------------------------------------
+
+# Budget in seconds for 'from IliasDownloaderUniMA import IliasDownloaderUniMA'
+# (the eager import of dateparser, bs4 and requests took ~0.4 s)
+budget = float(os.environ.get("ILIASDL_IMPORT_BUDGET", "0.15"))
+repo_path = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def run(code, *args):
+	return subprocess.run([sys.executable, *args, "-c", code], cwd=repo_path,
+		capture_output=True, text=True, check=True)
+
+def importTime():
+	"""
+	Returns the cumulative import time of the package in seconds, measured
+	by 'python -X importtime'.
+	"""
+	stderr = run("from IliasDownloaderUniMA import IliasDownloaderUniMA", "-X", "importtime").stderr
+	match = re.search(r"^import time:\s+\d+ \|\s+(\d+) \| IliasDownloaderUniMA$", stderr, re.M)
+	return int(match.group(1)) * 1e-6
+
+def test_import_time():
+	# Best of three runs to reduce the noise
+	assert min(importTime() for _ in range(3)) < budget
+
+def test_heavy_dependencies_are_loaded_on_first_use():
+	code = ("import sys\n"
+		"from IliasDownloaderUniMA import IliasDownloaderUniMA\n"
+		"m = IliasDownloaderUniMA()\n"
+		"print(','.join(m for m in ['dateparser', 'bs4', 'lxml', 'requests', 'asyncio'] if m in sys.modules))")
+	assert run(code).stdout.strip() == ""
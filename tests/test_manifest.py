@@ -0,0 +1,100 @@
+from IliasDownloaderUniMA import IliasDownloaderUniMA
+from IliasDownloaderUniMA.manifest import SyncManifest, extractRefId
+import datetime
+import math
+import os
+
+### Tests for the sync manifest
+# ------------------------------------------------------------------------------
+
+def fileRecord(mod_date=datetime.datetime(2020, 9, 17, 14, 59), size=0.2873):
+	return {
+		'course': 'Course',
+		'type': 'file',
+		'name': 'Lecture 1.pdf',
+		'size': size,
+		'mod-date': mod_date,
+		'url': 'https://ilias.uni-mannheim.de/goto.php?target=file_1001_download&client_id=ILIAS',
+		'path': 'Course/Slides/'
+	}
+
+def test_extractRefId():
+	assert extractRefId(fileRecord()['url']) == 'file_1001'
+	assert extractRefId("https://ilias.uni-mannheim.de/data/ILIAS/mobs/mm_1318784/a.mp4?il_wac_token=1") == 'mm_1318784'
+	assert extractRefId("https://example.com/a.pdf") is None
+
+def test_record_and_reload(tmp_path):
+	db = str(tmp_path / "manifest.sqlite")
+	manifest = SyncManifest(db)
+	manifest.record('Course/Slides/Lecture 1.pdf', fileRecord())
+	manifest.record('Course/video.mp4', fileRecord(size=math.nan))
+	manifest.close()
+	manifest = SyncManifest(db)
+	assert manifest.get('Course/Slides/Lecture 1.pdf')['ref_id'] == 'file_1001'
+	assert manifest.isUpToDate('Course/Slides/Lecture 1.pdf', fileRecord())
+	assert manifest.isUpToDate('Course/video.mp4', fileRecord(size=12.5))
+	assert not manifest.isUpToDate('Course/Slides/Lecture 1.pdf', fileRecord(mod_date=datetime.datetime(2020, 10, 1)))
+	assert not manifest.isUpToDate('Course/Slides/Lecture 1.pdf', fileRecord(size=0.3))
+	assert not manifest.isUpToDate('Course/Slides/Other.pdf', fileRecord())
+
+def test_isUpToDate_by_manifest(tmp_path):
+	m = IliasDownloaderUniMA()
+	m.setParam('download_path', str(tmp_path))
+	m.manifest = SyncManifest(str(tmp_path / "manifest.sqlite"))
+	m.manifest.record('Course/Slides/Lecture 1.pdf', fileRecord())
+	local = tmp_path / "Lecture 1.pdf"
+	# The file has been deleted locally
+	assert not m.isUpToDate(fileRecord(), str(local))
+	# The manifest decides, not the mtime
+	local.write_bytes(b"pdf")
+	os.utime(local, (0, 0))
+	assert m.isUpToDate(fileRecord(), str(local))
+
+def test_existing_file_is_recorded(tmp_path):
+	m = IliasDownloaderUniMA()
+	m.manifest = SyncManifest(str(tmp_path / "manifest.sqlite"))
+	local = tmp_path / "Lecture 1.pdf"
+	local.write_bytes(b"pdf")
+	assert m.isUpToDate(fileRecord(), str(local))
+	assert m.manifest.get('Course/Slides/Lecture 1.pdf') is not None
+
+def test_dedup_lookups(tmp_path):
+	db = str(tmp_path / "manifest.sqlite")
+	manifest = SyncManifest(db)
+	manifest.record('Course/Slides/Lecture 1.pdf', fileRecord(), "abc", 287300)
+	manifest.record('Course/Slides/Lecture 2.pdf', fileRecord())
+	manifest.close()
+	manifest = SyncManifest(db)
+	assert manifest.findCopy(fileRecord()) == ('Course/Slides/Lecture 1.pdf', manifest.get('Course/Slides/Lecture 1.pdf'))
+	assert manifest.findCopy(fileRecord(size=0.3)) is None
+	assert manifest.findCopy(fileRecord(mod_date=datetime.datetime(2020, 10, 1))) is None
+	assert manifest.findHash("abc", 287300) == 'Course/Slides/Lecture 1.pdf'
+	assert manifest.findHash("abc", 1) is None
+	# A new version of the file replaces the old hash
+	manifest.record('Course/Slides/Lecture 1.pdf', fileRecord(), "def", 287300)
+	assert manifest.findHash("abc", 287300) is None
+
+def test_manifest_without_dedup_columns(tmp_path):
+	import sqlite3
+	db = str(tmp_path / "manifest.sqlite")
+	con = sqlite3.connect(db)
+	con.execute("CREATE TABLE files (path TEXT PRIMARY KEY, url TEXT, ref_id TEXT, size REAL, mod_date TEXT)")
+	con.execute("INSERT INTO files VALUES ('Course/a.pdf', 'url', 'file_1', 1.0, '2020-09-17T14:59:00')")
+	con.commit()
+	con.close()
+	manifest = SyncManifest(db)
+	assert manifest.get('Course/a.pdf')['sha256'] is None
+	manifest.record('Course/b.pdf', fileRecord(), "abc", 1)
+	manifest.close()
+	assert SyncManifest(db).findHash("abc", 1) == 'Course/b.pdf'
+
+def test_extracted_entries(tmp_path):
+	db = str(tmp_path / "manifest.sqlite")
+	manifest = SyncManifest(db)
+	path = 'Course/Aufgaben/Blatt 1/Student_1/abgabe.pdf'
+	assert not manifest.isExtracted(path, 1234, 2000)
+	manifest.recordExtracted(path, 1234, 2000)
+	manifest.close()
+	manifest = SyncManifest(db)
+	assert manifest.isExtracted(path, 1234, 2000)
+	assert not manifest.isExtracted(path, 4321, 2000)
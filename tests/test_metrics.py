@@ -0,0 +1,77 @@
+from IliasDownloaderUniMA.metrics import Metrics
+from IliasDownloaderUniMA import IliasDownloaderUniMA
+from fake_ilias import FakeIlias, FakeIliasServer
+from concurrent.futures import ThreadPoolExecutor
+import json
+import os
+import pstats
+
+### Tests for the metrics
+# ------------------------------------------------------------------------------
+
+def test_requests_per_course():
+	m = Metrics()
+	with m.course("Course 1"):
+		m.recordRequest("GET", 200, 100, 0.5)
+		m.recordRequest("GET", 404, 10, 0.25)
+	m.recordRequest("HEAD", 200, 0, 0.1)
+	s = m.summary()
+	assert s['courses']["Course 1"]['requests'] == 2
+	assert s['courses']["Course 1"]['bytes'] == 110
+	assert s['courses']["-"]['requests'] == 1
+	assert {(r['method'], r['status']): r['count'] for r in s['requests']} == {
+		("GET", 200): 1, ("GET", 404): 1, ("HEAD", 200): 1}
+
+def test_bind_keeps_the_course():
+	m = Metrics()
+	with m.course("Course 1"):
+		fun = m.bind(lambda: m.recordRequest("GET", 200, 1, 0.1))
+	with ThreadPoolExecutor(1) as executor:
+		executor.submit(fun).result()
+	assert m.summary()['courses']["Course 1"]['requests'] == 1
+
+def test_stages():
+	m = Metrics()
+	with m.stage('parse'):
+		pass
+	with m.stage('write') as st:
+		st['bytes'] += 42
+	s = m.summary()['stages']
+	assert s['parse']['count'] == 1
+	assert s['write']['bytes'] == 42
+
+def test_export():
+	m = Metrics()
+	with m.course("Kurs \"A\""):
+		m.recordRequest("GET", 200, 100, 0.5)
+	m.recordRequest("GET", None, 0, 0.1)
+	assert json.loads(m.toJSON())['courses']['Kurs "A"']['requests'] == 1
+	prom = m.toPrometheus()
+	assert 'iliasdl_requests_total{method="GET",status="200"} 1' in prom
+	assert 'iliasdl_requests_total{method="GET",status="error"} 1' in prom
+	assert 'iliasdl_course_requests_total{course="Kurs \\"A\\""} 1' in prom
+	assert "# TYPE iliasdl_stage_seconds_total counter" in prom
+
+def test_sync_metrics_and_profile(tmp_path):
+	ilias = FakeIlias(num_courses=2, depth=1, fanout=2, files_per_folder=2)
+	with FakeIliasServer(ilias) as server:
+		m = IliasDownloaderUniMA()
+		server.configure(m)
+		m.setParam('download_path', str(tmp_path))
+		m.setParam('profile', True)
+		m.login(server.username, server.password)
+		m.addAllSemesterCourses(r"\(HWS 2020\)")
+		m.downloadAllFiles()
+		s = m.metrics.summary()
+		# The redirect after the login POST is followed inside the same request
+		assert sum(r['count'] for r in s['requests']) == server.stats['requests'] - 1
+		assert s['courses']["Course 1 (HWS 2020)"]['files'] == len(ilias.files()) // 2
+		assert s['courses']["Course 1 (HWS 2020)"]['downloads'] == len(ilias.files()) // 2
+		assert s['stages']['write']['bytes'] == server.stats['bytes']
+		assert s['stages']['parse']['count'] > 0
+		assert s['stages']['dates']['count'] > 0
+		stats = pstats.Stats(os.path.join(str(tmp_path), "iliasdl.prof"))
+		assert any(func[2] == "scanFolder" for func in stats.stats)
+		m.exportMetrics(os.path.join(str(tmp_path), "metrics.json"))
+		m.exportMetrics(os.path.join(str(tmp_path), "metrics.prom"))
+		assert json.load(open(os.path.join(str(tmp_path), "metrics.json"))) == s
@@ -0,0 +1,110 @@
+from IliasDownloaderUniMA import IliasDownloaderUniMA
+from IliasDownloaderUniMA.cache import PageCache
+import datetime
+
+### Tests for the page cache of scanFolder()
+# ------------------------------------------------------------------------------
+
+folder_page = """
+<html>
+ <body>
+  <div id="mainscrolldiv">
+<ol>
+<li><a href="#">Magazin</a></li>
+<li><a href="#">HWS 2020</a></li>
+<li><a href="#">Course</a></li>
+<li><a href="#">Folder: Slides</a></li>
+</ol>
+  </div>
+  <div class="il_ContainerListItem">
+   <a href="goto.php?target=file_1001_download&amp;client_id=ILIAS">Lecture 1</a>
+   <div class="ilListItemSection il_ItemProperties">
+    <span class="il_ItemProperty">pdf&nbsp;&nbsp;</span>
+    <span class="il_ItemProperty">287,3 KB&nbsp;&nbsp;</span>
+    <span class="il_ItemProperty">17. Sep 2020, 14:59&nbsp;&nbsp;</span>
+   </div>
+  </div>
+  <div class="il_ContainerListItem">
+   <a href="ilias.php?ref_id=555&amp;cmd=view&amp;cmdClass=ilrepositorygui">Exercises</a>
+  </div>
+ </body>
+</html>
+"""
+
+class Response():
+	def __init__(self, content, status_code=200, headers={}):
+		self.content = content.encode()
+		self.status_code = status_code
+		self.headers = headers
+
+class Session():
+	def __init__(self, content, headers={}):
+		self.content = content
+		self.headers = headers
+		self.requests = []
+
+	def get(self, url, headers={}, **kwargs):
+		self.requests.append(headers)
+		if self.headers.get('ETag') and headers.get('If-None-Match') == self.headers['ETag']:
+			return Response("", 304)
+		return Response(self.content, 200, self.headers)
+
+expected_file = {
+	'course': 'Course',
+	'type': 'file',
+	'name': 'Lecture 1.pdf',
+	'size': 0.2873,
+	'mod-date': datetime.datetime(2020, 9, 17, 14, 59),
+	'url': 'https://ilias.uni-mannheim.de/goto.php?target=file_1001_download&client_id=ILIAS',
+	'path': 'Course/Folder -  Slides/'
+}
+
+def downloader(tmp_path, session):
+	m = IliasDownloaderUniMA()
+	m.session = session
+	m.page_cache = PageCache(str(tmp_path / "cache.sqlite"))
+	return m
+
+def test_unchanged_fingerprint_reuses_children(tmp_path):
+	m = downloader(tmp_path, Session(folder_page))
+	children = m.scanFolder('Course', m.createIliasUrl(1000))
+	assert m.files == [expected_file]
+	assert [c['name'] for c in children] == ['Exercises']
+	m.page_cache.commit()
+	# The second scan must not parse the file properties again
+	m2 = downloader(tmp_path, Session(folder_page))
+	m2._parseFileProperties = None
+	assert m2.scanFolder('Course', m.createIliasUrl(1000)) == children
+	assert m2.files == [expected_file]
+
+def test_changed_fingerprint_is_parsed(tmp_path):
+	m = downloader(tmp_path, Session(folder_page))
+	m.scanFolder('Course', m.createIliasUrl(1000))
+	m.page_cache.commit()
+	m2 = downloader(tmp_path, Session(folder_page.replace("287,3 KB", "300,0 KB")))
+	m2.scanFolder('Course', m.createIliasUrl(1000))
+	assert m2.files[0]['size'] == 0.3
+
+def test_not_modified_response(tmp_path):
+	m = downloader(tmp_path, Session(folder_page, {'ETag': '"abc"'}))
+	children = m.scanFolder('Course', m.createIliasUrl(1000))
+	m.page_cache.commit()
+	m.files = []
+	assert m.scanFolder('Course', m.createIliasUrl(1000)) == children
+	assert m.session.requests[-1] == {'If-None-Match': '"abc"'}
+	assert m.files == [expected_file]
+
+def test_folder_with_videos_is_fetched(tmp_path):
+	video = """<figure class="ilc_media_cont_MediaContainer"><div class="ilc_Mob"><video class="ilPageVideo">
+		<source src="./data/ILIAS/mobs/mm_1318784/Session_02.mp4?il_wac_token={}" type="video/mp4"></video></div></figure>"""
+	page = lambda token: folder_page.replace("<body>", "<body>" + video.format(token))
+	m = downloader(tmp_path, Session(page("old"), {'ETag': '"abc"'}))
+	m.scanFolder('Course', m.createIliasUrl(1000))
+	m.page_cache.commit()
+	m.files = []
+	# No conditional request, the video url carries a new token
+	m.session.content = page("new")
+	m.scanFolder('Course', m.createIliasUrl(1000))
+	assert m.session.requests[-1] == {}
+	assert [f['url'].split("=")[-1] for f in m.files if f['name'] == "Session_02.mp4"] == ["new"]
+	assert expected_file in m.files
@@ -1,4 +1,5 @@
 from IliasDownloaderUniMA import IliasDownloaderUniMA
+from IliasDownloaderUniMA.manifest import SyncManifest
 from bs4 import BeautifulSoup
 import datetime
 import math
@@ -74,8 +75,8 @@ v_no_video = """
 
 m = IliasDownloaderUniMA()
 
-# We ignore the video size for the test as it's not possible to test
-# the HEAD requests without being logged into ilias.
+# parseVideos() doesn't send the HEAD requests, the video sizes are
+# determined by probeVideoSizes().
 
 def test_no_video():
   soup = BeautifulSoup(v_no_video, "lxml")
@@ -85,6 +86,7 @@ def test_without_caption():
   soup = BeautifulSoup(v_without_caption, "lxml")
   v_name, v_size, v_mod_date, v_url = m.parseVideos(soup)
   assert v_name == 'HS20_EinfPoWi_Politische_Kultur_und_Sozialisation_A_komprimiert.m4v'
+  assert math.isnan(v_size)
   assert v_mod_date == datetime.datetime.fromisoformat('2000-01-01')
   assert v_url == 'https://ilias.uni-mannheim.de/data/ILIAS/mobs/mm_1299655/HS20_EinfPoWi_Politische_Kultur_und_Sozialisation_A_komprimiert.m4v?il_wac_token=60e9a0575393b725438513fc1d2aadfba054221a&il_wac_ttl=3&il_wac_ts=1603624667'
 
@@ -94,3 +96,37 @@ def test_with_caption():
   assert v_name == 'Session_02_DesignofFlowLinesPart1.mp4'
   assert v_mod_date == datetime.datetime.fromisoformat('2000-01-01')
   assert v_url == "https://ilias.uni-mannheim.de/data/ILIAS/mobs/mm_1318784/Session_02_DesignofFlowLinesPart1.mp4?il_wac_token=88ff75878db690a37e5fddfddcf055beea79693a&il_wac_ttl=3&il_wac_ts=1603624381"
+
+# Test for probeVideoSizes()
+# ------------------------------------------------------------------------------
+
+class Response():
+  def __init__(self, headers):
+    self.headers = headers
+
+class Session():
+  def __init__(self):
+    self.heads = []
+
+  def head(self, url, **kwargs):
+    self.heads.append(url)
+    return Response({'Content-Length': '2500000'})
+
+def video(mob_id):
+  return {'name': f"{mob_id}.mp4", 'size': math.nan, 'url': f"https://ilias.uni-mannheim.de/data/ILIAS/mobs/{mob_id}/v.mp4?il_wac_token=1"}
+
+def test_probeVideoSizes(tmp_path):
+  p = IliasDownloaderUniMA()
+  p.session = Session()
+  p.manifest = SyncManifest(str(tmp_path / "manifest.sqlite"))
+  p.manifest.recordMedia('mm_1', 12.0)
+  videos = [video('mm_1'), video('mm_2'), video('mm_3')]
+  p.probeVideoSizes(videos)
+  assert [v['size'] for v in videos] == [12.0, 2.5, 2.5]
+  assert len(p.session.heads) == 2
+  # The probed sizes are reused by the next run
+  p.manifest.close()
+  p.manifest = SyncManifest(str(tmp_path / "manifest.sqlite"))
+  p.session = Session()
+  p.probeVideoSizes([video('mm_2')])
+  assert p.session.heads == []
@@ -0,0 +1,50 @@
+from IliasDownloaderUniMA.records import FileRecord, FileList
+import datetime
+import threading
+
+### Tests for FileRecord and FileList
+# ------------------------------------------------------------------------------
+
+def fileDict(i, course="Course"):
+	return {
+		'course': course,
+		'type': 'file',
+		'name': f"file_{i}.pdf",
+		'size': 0.5,
+		'mod-date': datetime.datetime(2020, 9, 17, 14, 59),
+		'url': f"https://ilias.uni-mannheim.de/goto.php?target=file_{i}_download",
+		'path': course + "/" + "Slides/"
+	}
+
+def test_dict_view():
+	r = FileRecord.fromDict(fileDict(1))
+	assert r['mod-date'] == datetime.datetime(2020, 9, 17, 14, 59)
+	assert r.mod_date is r['mod-date']
+	assert dict(r) == fileDict(1)
+	assert r == fileDict(1)
+	r['size'] = 2.5
+	assert r.size == 2.5
+	assert r.get('missing') is None
+	assert not hasattr(r, '__dict__')
+
+def test_interned_strings():
+	a = FileRecord.fromDict(fileDict(1, "".join(["Cour", "se"])))
+	b = FileRecord.fromDict(fileDict(2, "".join(["Co", "urse"])))
+	assert a.course is b.course
+	assert a.path is b.path
+
+def test_concurrent_append():
+	files = FileList()
+	def add(k):
+		for i in range(1000):
+			files.append(fileDict(k * 1000 + i))
+	threads = [threading.Thread(target=add, args=(k,)) for k in range(8)]
+	for t in threads:
+		t.start()
+	for t in threads:
+		t.join()
+	assert len(files) == 8000
+	assert len(set(f['name'] for f in files)) == 8000
+	files += [fileDict(9000)]
+	assert files[-1] == fileDict(9000)
+	assert files.asDicts()[-1] == fileDict(9000)
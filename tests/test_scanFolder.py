@@ -0,0 +1,129 @@
+from IliasDownloaderUniMA import IliasDownloaderUniMA
+from IliasDownloaderUniMA.parsing import strainFolderPage, parseFolderPage
+from bs4 import BeautifulSoup
+import IliasDownloaderUniMA.IliasDL as IliasDL
+
+### Tests for the lxml based parse path of scanFolder()
+# ------------------------------------------------------------------------------
+
+folder_page = """<!DOCTYPE html>
+<html lang="de">
+ <head>
+  <meta charset="utf-8">
+  <title>ILIAS Universität Mannheim</title>
+  <script>var il = {"ol": "<ol><li>not the breadcrumb</li></ol>"};</script>
+ </head>
+ <body>
+  <div id="ilTopBar"><ul><li>Magazin</li></ul></div>
+  <div id="mainscrolldiv">
+<ol class="breadcrumb">
+<li><a href="#">Magazin</a></li>
+<li><a href="#">HWS 2020</a></li>
+<li><a href="#">GPU Programming (HWS 2020)</a></li>
+<li><a href="#">Übungen: Blatt 1</a></li>
+</ol>
+   <div class="ilc_page_Page">
+    <figure class="ilc_media_cont_MediaContainer" style="display:table;">
+     <div class="ilc_Mob">
+      <video class="ilPageVideo" preload="none">
+       <source src="./data/ILIAS/mobs/mm_1318784/Session_02.mp4?il_wac_token=88ff&amp;il_wac_ttl=3&amp;il_wac_ts=1603624381" type="video/mp4">
+      </video>
+     </div>
+    </figure>
+    <figure class="ilc_media_cont_MediaContainer">
+     <div class="ilc_Mob"><img src="./data/ILIAS/mobs/mm_1171726/Quiz.png?il_wac_token=4cac"/></div>
+    </figure>
+   </div>
+   <div class="ilContainerBlock">
+    <div class="ilContainerListItemOuter">
+     <div class="il_ContainerListItem">
+      <div class="il_ContainerItemTitle"><a href="goto.php?target=file_1001_download&amp;client_id=ILIAS">Blatt 1</a></div>
+      <div class="ilListItemSection il_ItemProperties">
+       <span class="il_ItemProperty">pdf&nbsp;&nbsp;</span>
+       <span class="il_ItemProperty">903,1 KB&nbsp;&nbsp;</span>
+       <span class="il_ItemProperty">Version: 2&nbsp;&nbsp;</span>
+       <span class="il_ItemProperty">31. Aug 2020, 14:57&nbsp;&nbsp;</span>
+      </div>
+     </div>
+    </div>
+    <div class="ilContainerListItemOuter">
+     <div class="il_ContainerListItem il_Highlighted">
+      <a href="ilias.php?ref_id=1020950&amp;cmd=view&amp;cmdClass=ilrepositorygui">Lösungen</a>
+     </div>
+    </div>
+    <div class="ilContainerListItemOuter">
+     <div class="il_ContainerListItem">
+      <a href="ilias.php?ref_id=1020951&amp;cmd=showOverview&amp;cmdClass=ilobjexercisegui">Abgabe</a>
+     </div>
+    </div>
+    <div class="ilContainerListItemOuter">
+     <div class="il_ContainerListItem">
+      <a href="ilias.php?ref_id=1020952&amp;cmd=showThreads&amp;cmdClass=ilrepositorygui">Forum</a>
+     </div>
+    </div>
+   </div>
+  </div>
+  <ol><li>Footer</li></ol>
+ </body>
+</html>
+"""
+
+class Response():
+	status_code = 200
+	headers = {}
+	def __init__(self, content):
+		self.content = content.encode()
+
+class Session():
+	def get(self, url, **kwargs):
+		return Response(folder_page)
+
+	def head(self, url, **kwargs):
+		raise ConnectionError()
+
+def scan(monkeypatch, strain):
+	monkeypatch.setattr(IliasDL, "strainFolderPage", strain)
+	m = IliasDownloaderUniMA()
+	m.session = Session()
+	children = m.scanFolder("GPU Programming", m.createIliasUrl(1020946))
+	return m.files, children
+
+def fullTree(content):
+	return BeautifulSoup(content, "lxml")
+
+def test_same_records_as_full_tree(monkeypatch):
+	files, children = scan(monkeypatch, strainFolderPage)
+	assert [f['name'] for f in files] == ['Session_02.mp4', 'Blatt 1.pdf']
+	assert files[0]['path'] == 'GPU Programming/Übungen -  Blatt 1/'
+	assert [c['name'] for c in children] == ['Lösungen', 'Abgabe']
+	full_files, full_children = scan(monkeypatch, fullTree)
+	assert repr(files) == repr(full_files)
+	assert children == full_children
+
+def test_only_relevant_elements():
+	soup = strainFolderPage(folder_page.encode())
+	assert len(soup.find_all("ol")) == 1
+	assert len(soup.find_all("figure", {"class": "ilc_media_cont_MediaContainer"})) == 2
+	assert len(soup.find_all("div", "il_ContainerListItem")) == 4
+	assert soup.find("script") is None
+	assert soup.find("div", {"id": "ilTopBar"}) is None
+
+def test_fallback_without_breadcrumb():
+	soup = strainFolderPage(b"<html><body><p>Kein Zugriff</p></body></html>")
+	assert soup.find("p").text == "Kein Zugriff"
+
+def test_parse_folder_page_in_a_process():
+	from concurrent.futures import ProcessPoolExecutor
+	import pickle
+	page = parseFolderPage(folder_page.encode(), "GPU Programming", IliasDownloaderUniMA.base_url, True)
+	assert [f['name'] for f in page['videos'] + page['files']] == ['Session_02.mp4', 'Blatt 1.pdf']
+	assert [c['name'] for c in page['children']] == ['Lösungen', 'Abgabe']
+	# repr, since the video size is nan
+	assert repr(pickle.loads(pickle.dumps(page))) == repr(page)
+	with ProcessPoolExecutor(1) as executor:
+		assert repr(executor.submit(parseFolderPage, folder_page.encode(), "GPU Programming",
+			IliasDownloaderUniMA.base_url, True).result()) == repr(page)
+	# The ContainerList of an unchanged page isn't parsed
+	cached = parseFolderPage(folder_page.encode(), "GPU Programming", IliasDownloaderUniMA.base_url, True,
+		(page['fingerprint'], page['file_path']))
+	assert cached['files'] is None and cached['children'] is None
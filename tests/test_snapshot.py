@@ -0,0 +1,103 @@
+from IliasDownloaderUniMA import IliasDownloaderUniMA
+from IliasDownloaderUniMA.snapshot import writeSnapshot, readSnapshot, diffSnapshots
+from IliasDownloaderUniMA.records import FileRecord
+from fake_ilias import FakeIlias, FakeIliasServer
+import datetime
+import math
+import os
+import pytest
+
+### Tests for the scan snapshots
+# ------------------------------------------------------------------------------
+
+def fileRecord(name, size=0.5, mod_date=datetime.datetime(2020, 9, 17, 14, 59)):
+	return FileRecord("Kurs Ü", 'file', name, size, mod_date,
+		f"https://ilias.uni-mannheim.de/goto.php?target=file_{len(name)}_download", "Kurs Ü/Folien/")
+
+@pytest.mark.parametrize("name", ["scan.jsonl", "scan.jsonl.gz"])
+def test_write_and_read(tmp_path, name):
+	files = [fileRecord("a.pdf"), fileRecord("video.mp4", math.nan)]
+	path = str(tmp_path / name)
+	assert writeSnapshot(path, iter(files)) == 2
+	read = list(readSnapshot(path))
+	assert read[0] == files[0]
+	assert math.isnan(read[1]['size'])
+	assert not os.path.exists(path + ".tmp")
+
+def test_not_a_snapshot(tmp_path):
+	path = tmp_path / "other.jsonl"
+	path.write_text('{"foo": 1}\n')
+	with pytest.raises(ValueError):
+		list(readSnapshot(str(path)))
+
+def test_diff(tmp_path):
+	old = [fileRecord("a.pdf"), fileRecord("b.pdf"), fileRecord("video.mp4", math.nan)]
+	new = [fileRecord("a.pdf"), fileRecord("b.pdf", mod_date=datetime.datetime(2020, 10, 1)),
+		fileRecord("video.mp4", math.nan), fileRecord("c.pdf")]
+	writeSnapshot(str(tmp_path / "old.jsonl"), old)
+	writeSnapshot(str(tmp_path / "new.jsonl"), new)
+	diff = diffSnapshots(str(tmp_path / "old.jsonl"), str(tmp_path / "new.jsonl"))
+	assert [f['name'] for f in diff] == ["b.pdf", "c.pdf"]
+	assert [f['name'] for f in diffSnapshots(old, new)] == ["b.pdf", "c.pdf"]
+
+def test_diff_ignores_video_tokens():
+	video = lambda token, size=0.5: FileRecord("Kurs", 'file', "video.mp4", size, datetime.datetime(2020, 10, 25),
+		f"https://ilias.uni-mannheim.de/data/ILIAS/mobs/mm_1318784/video.mp4?il_wac_token={token}&il_wac_ts={token}", "Kurs/")
+	assert list(diffSnapshots([video(1)], [video(2)])) == []
+	assert list(diffSnapshots([video(1)], [video(2, 0.6)])) == [video(2, 0.6)]
+
+def test_iterFiles_and_download_from_snapshot(tmp_path):
+	ilias = FakeIlias(num_courses=2, depth=1, fanout=2, files_per_folder=2, task_units=0)
+	download_path = tmp_path / "files"
+	download_path.mkdir()
+	with FakeIliasServer(ilias) as server:
+		m = IliasDownloaderUniMA()
+		server.configure(m)
+		m.setParam('download_path', str(download_path))
+		m.login(server.username, server.password)
+		m.addAllSemesterCourses(r"\(HWS 2020\)")
+		snapshot = str(tmp_path / "scan.jsonl")
+		assert writeSnapshot(snapshot, m.iterFiles()) == len(ilias.files())
+		assert m.file_sinks == []
+		# Another instance downloads the snapshot without scanning
+		m2 = IliasDownloaderUniMA()
+		server.configure(m2)
+		m2.setParam('download_path', str(download_path))
+		m2.login(server.username, server.password)
+		m2.downloadAllFiles(snapshot)
+		assert 'parse' not in m2.metrics.summary()['stages']
+		assert server.stats['files'] == len(ilias.files())
+
+def test_download_own_snapshot(tmp_path):
+	ilias = FakeIlias(num_courses=1, depth=1, fanout=2, files_per_folder=2, task_units=0)
+	with FakeIliasServer(ilias) as server:
+		m = IliasDownloaderUniMA()
+		server.configure(m)
+		m.setParam('download_path', str(tmp_path))
+		m.login(server.username, server.password)
+		m.addAllSemesterCourses(r"\(HWS 2020\)")
+		snapshot = str(tmp_path / "scan.jsonl")
+		writeSnapshot(snapshot, m.iterFiles())
+		# The files found by the scan aren't planned a second time
+		m.downloadAllFiles(snapshot)
+		assert len(m.files) == len(ilias.files())
+		assert server.stats['files'] == len(ilias.files())
+		assert not [f for _, _, files in os.walk(tmp_path) for f in files if f.endswith(".part")]
+
+def test_iterFiles_in_tutor_mode(tmp_path):
+	ilias = FakeIlias(num_courses=1, depth=0, files_per_folder=1, task_units=2, num_submissions=2)
+	with FakeIliasServer(ilias) as server:
+		m = IliasDownloaderUniMA()
+		server.configure(m)
+		m.setParam('download_path', str(tmp_path))
+		m.setParam('tutor_mode', True)
+		m.login(server.username, server.password)
+		m.addAllSemesterCourses(r"\(HWS 2020\)")
+		# No background tasks are left behind on the server
+		assert len(list(m.iterFiles())) == len(ilias.files())
+		assert ilias.next_task_id == 0
+		assert m.background_task_files == {}
+		# Afterwards the submissions are requested again
+		m.downloadAllFiles()
+		assert len([f for _, _, files in os.walk(tmp_path) for f in files if f.endswith(".zip")]) == 2
+		assert ilias.background_tasks == {}
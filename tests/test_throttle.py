@@ -0,0 +1,145 @@
+from IliasDownloaderUniMA.throttle import AdaptiveLimiter, TokenBucket, backoffDelay, parseSchedule, retryAfter
+from IliasDownloaderUniMA import IliasDownloaderUniMA
+from fake_ilias import FakeIlias, FakeIliasServer
+from email.utils import format_datetime
+from datetime import datetime, timedelta, timezone
+from types import SimpleNamespace
+import os
+import pytest
+import threading
+import time
+
+### Tests for the adaptive limiter, the retry delays and the bandwidth limit
+# ------------------------------------------------------------------------------
+
+def response(**headers):
+	return SimpleNamespace(headers=headers)
+
+def test_backoff_delay():
+	assert all(0 <= backoffDelay(attempt) <= 0.5 * 2 ** attempt for attempt in range(5))
+	assert backoffDelay(20) <= 30.0
+
+def test_retry_after():
+	assert retryAfter(response()) is None
+	assert retryAfter(response(**{'Retry-After': "2"})) == 2.0
+	assert retryAfter(response(**{'Retry-After': "3600"})) == 60.0
+	date = format_datetime(datetime.now(timezone.utc) + timedelta(seconds=10), usegmt=True)
+	assert 5 < retryAfter(response(**{'Retry-After': date})) <= 10
+	assert retryAfter(response(**{'Retry-After': "soon"})) is None
+
+def test_multiplicative_decrease_and_additive_increase():
+	limiter = AdaptiveLimiter(8, cooldown=0)
+	limiter.onFailure()
+	assert limiter.limit == 4
+	for _ in range(4):
+		limiter.onSuccess(0.1)
+	assert 4.9 < limiter.limit < 5
+	for _ in range(100):
+		limiter.onSuccess(0.1)
+	assert limiter.limit == 8
+	assert limiter.stats() == {'limit': 8, 'lowest': 4, 'decreases': 1}
+
+def test_cooldown_and_slow_requests():
+	limiter = AdaptiveLimiter(10, cooldown=60)
+	limiter.onFailure()
+	limiter.onFailure()
+	assert limiter.limit == 5
+	limiter = AdaptiveLimiter(10, cooldown=0)
+	limiter.onSuccess(0.1)
+	limiter.onSuccess(1.0)
+	assert limiter.limit == 9
+
+def test_latency_per_kind():
+	limiter = AdaptiveLimiter(10, cooldown=0)
+	for _ in range(10):
+		limiter.onSuccess(0.05, 'HEAD')
+		limiter.onSuccess(0.4, 'GET')
+	# A page is slower than a probe but not slow for a page
+	limiter.onSuccess(0.5, 'GET')
+	assert limiter.decreases == 0
+	limiter.onSuccess(0.5, 'HEAD')
+	assert limiter.decreases == 1
+	# Jitter of a fast server isn't a queue
+	limiter.onSuccess(0.001, 'POST')
+	limiter.onSuccess(0.05, 'POST')
+	assert limiter.decreases == 1
+
+def test_slots():
+	limiter = AdaptiveLimiter(4, cooldown=0)
+	limiter.onFailure()
+	with limiter.slot(), limiter.slot():
+		assert limiter.in_flight == 2
+	assert limiter.in_flight == 0
+
+def test_sync_retries_transient_failures(tmp_path):
+	ilias = FakeIlias(num_courses=2, depth=1, fanout=2, files_per_folder=2)
+	with FakeIliasServer(ilias, error_rate=0.1, seed=1) as server:
+		m = IliasDownloaderUniMA()
+		server.configure(m)
+		m.setParam('download_path', str(tmp_path))
+		m.setParam('max_retries', 10)
+		m.login(server.username, server.password)
+		m.addAllSemesterCourses(r"\(HWS 2020\)")
+		m.downloadAllFiles()
+		s = m.metrics.summary()
+		assert any(r['status'] == 503 for r in s['requests'])
+		assert s['stages']['retry']['count'] > 0
+		assert s['gauges']['concurrency_decreases'] > 0
+		files = [f for _, _, fs in os.walk(tmp_path) for f in fs if not f.startswith(".iliasdl")]
+		assert len(files) == len(ilias.files())
+
+def test_bandwidth_schedule():
+	schedule = parseSchedule([("08:00", "18:00", 2), ("22:00", "06:00", 0.5)])
+	assert schedule == [(480, 1080, 2e6), (1320, 360, 5e5)]
+	bucket = TokenBucket(10e6, schedule)
+	at = lambda h, m=0: bucket.rateAt(datetime(2020, 10, 1, h, m))
+	assert (at(12), at(7, 59), at(18), at(23), at(3)) == (2e6, 10e6, 10e6, 5e5, 5e5)
+	with pytest.raises(ValueError):
+		parseSchedule([("8", "18:00", 1)])
+	with pytest.raises(ValueError):
+		parseSchedule([("20:00", "24:59", 1)])
+	assert parseSchedule([("20:00", "24:00", 1)]) == [(1200, 1440, 1e6)]
+	# Invalid schedules are ignored like other invalid parameters
+	m = IliasDownloaderUniMA()
+	m.setParam('bandwidth_schedule', [(9, 17, 1)])
+	m.setParam('bandwidth_schedule', 5)
+	assert m.params['bandwidth_schedule'] == []
+
+def test_token_bucket_rate():
+	assert TokenBucket().consume(10**9) == 0.0
+	bucket = TokenBucket(1e6, burst=0.0)
+	start = time.monotonic()
+	for _ in range(5):
+		bucket.consume(50000)
+	assert 0.19 < time.monotonic() - start < 0.5
+
+def test_token_bucket_is_fair():
+	# A small file doesn't wait until a large one is complete
+	bucket = TokenBucket(1e6, burst=0.0)
+	done = {}
+	def transfer(name, chunks):
+		for _ in range(chunks):
+			bucket.consume(20000)
+		done[name] = time.monotonic()
+	large = threading.Thread(target=transfer, args=("large", 25))
+	large.start()
+	time.sleep(0.05)
+	transfer("small", 2)
+	large.join()
+	assert done["small"] < done["large"] - 0.2
+
+def test_sync_with_bandwidth_limit(tmp_path):
+	ilias = FakeIlias(num_courses=1, depth=0, files_per_folder=3, file_size=60000, task_units=0)
+	with FakeIliasServer(ilias) as server:
+		m = IliasDownloaderUniMA()
+		server.configure(m)
+		m.setParam('download_path', str(tmp_path))
+		m.setParam('max_bandwidth', 0.05)
+		start = time.monotonic()
+		m.login(server.username, server.password)
+		m.addAllSemesterCourses(r"\(HWS 2020\)")
+		m.downloadAllFiles()
+		# 180 kB at 50 kB/s, less one second of burst and the last chunk
+		assert time.monotonic() - start > 1.2
+		assert m.metrics.summary()['stages']['throttle']['count'] > 0
+		assert server.stats['files'] == 3
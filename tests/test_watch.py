@@ -0,0 +1,119 @@
+from IliasDownloaderUniMA import IliasDownloaderUniMA
+from IliasDownloaderUniMA.watch import PollSchedule
+from fake_ilias import FakeIlias, FakeIliasServer
+import os
+import threading
+import time
+
+### Tests for the watch mode
+# ------------------------------------------------------------------------------
+
+def test_poll_schedule():
+	now = [0.0]
+	schedule = PollSchedule(["A", "B"], min_interval=10, max_interval=40, full_rescan=100, clock=lambda: now[0])
+	assert schedule.next() == ("A", 0.0, True)
+	schedule.done("A", True, True)
+	assert schedule.next() == ("B", 0.0, True)
+	schedule.done("B", False, True)
+	# Unchanged courses are polled less often
+	assert schedule.next() == ("A", 10.0, False)
+	now[0] = 10.0
+	schedule.done("A", False)
+	assert schedule.due == {"A": 30.0, "B": 20.0}
+	for _ in range(5):
+		schedule.done("B", False)
+	assert schedule.intervals["B"] == 40
+	schedule.done("B", True)
+	assert schedule.intervals["B"] == 10
+	now[0] = 100.0
+	assert schedule.isFullDue("A")
+
+def waitFor(condition, timeout=10.0):
+	end = time.monotonic() + timeout
+	while not condition():
+		assert time.monotonic() < end
+		time.sleep(0.02)
+
+def watching(server, tmp_path, params={}, **kwargs):
+	m = IliasDownloaderUniMA()
+	server.configure(m)
+	m.setParam('download_path', str(tmp_path))
+	for param, value in params.items():
+		m.setParam(param, value)
+	m.login(server.username, server.password)
+	m.addAllSemesterCourses(r"\(HWS 2020\)")
+	polls = []
+	pollCourse = m._pollCourse
+	m._pollCourse = lambda *args: polls.append(args[1]) or pollCourse(*args)
+	thread = threading.Thread(target=m.watch, kwargs=kwargs)
+	thread.start()
+	return m, thread, polls
+
+def test_watch_descends_into_changed_folders(tmp_path):
+	ilias = FakeIlias(num_courses=2, depth=2, fanout=2, files_per_folder=1, task_units=0)
+	with FakeIliasServer(ilias) as server:
+		m, thread, polls = watching(server, tmp_path, min_interval=0.05, max_interval=0.1, full_rescan=None)
+		try:
+			files = lambda: server.stats.get('files', 0)
+			waitFor(lambda: files() == len(ilias.files()) and len(polls) > 2)
+			# A poll of an unchanged course fetches the course page only
+			pages, num_polls = server.stats['pages'], len(polls)
+			time.sleep(0.5)
+			assert not any(polls[num_polls:])
+			assert abs((server.stats['pages'] - pages) - (len(polls) - num_polls)) <= 2
+			course = ilias.courses[0]
+			ilias.addNode(course, 'file', "Neu", 1000)
+			folder = ilias.nodes[course]['children'][1]
+			ilias.addNode(folder, 'file', "Auch neu", 1000)
+			waitFor(lambda: files() == len(ilias.files()))
+		finally:
+			m.stopWatching()
+			thread.join()
+
+def test_watch_full_rescan_finds_deep_changes(tmp_path):
+	ilias = FakeIlias(num_courses=1, depth=2, fanout=1, files_per_folder=1, task_units=0)
+	with FakeIliasServer(ilias) as server:
+		m, thread, polls = watching(server, tmp_path, min_interval=0.05, max_interval=0.05, full_rescan=0.5)
+		try:
+			waitFor(lambda: len(polls) > 1)
+			# A file in the innermost folder doesn't change its parents
+			deepest = max((n for n in ilias.nodes.values() if n['kind'] == 'folder'), key=lambda n: n['id'])
+			ilias.addNode(deepest['id'], 'file', "Tief", 1000)
+			waitFor(lambda: server.stats.get('files', 0) == len(ilias.files()))
+			assert polls[0] and polls.count(True) >= 2
+		finally:
+			m.stopWatching()
+			thread.join()
+
+def test_watch_cleans_background_tasks(tmp_path):
+	ilias = FakeIlias(num_courses=1, depth=0, files_per_folder=1, task_units=2, num_submissions=2)
+	with FakeIliasServer(ilias) as server:
+		m, thread, polls = watching(server, tmp_path, {'tutor_mode': True}, min_interval=0.05, max_interval=0.05,
+			full_rescan=0.1)
+		try:
+			waitFor(lambda: polls.count(True) > 2)
+		finally:
+			m.stopWatching()
+			thread.join()
+		zips = [f for _, _, files in os.walk(tmp_path) for f in files if f.endswith(".zip")]
+		assert len(zips) == 2
+		# Every poll requested the zips anew, none of them is left on the server
+		assert ilias.next_task_id > 4
+		assert ilias.background_tasks == {}
+		assert m.background_task_files == {} and m.background_tasks_to_clean == {} and m.submission_urls == set()
+
+def test_watch_finds_new_videos(tmp_path):
+	ilias = FakeIlias(num_courses=1, depth=1, fanout=1, files_per_folder=1, task_units=0)
+	with FakeIliasServer(ilias) as server:
+		m, thread, polls = watching(server, tmp_path, min_interval=0.05, max_interval=0.1, full_rescan=None)
+		try:
+			files = lambda: server.stats.get('files', 0)
+			waitFor(lambda: files() == len(ilias.files()) and len(polls) > 1)
+			# The ContainerList of the course page doesn't change
+			ilias.addNode(ilias.courses[0], 'video', "Vorlesung_1.mp4", 5000)
+			waitFor(lambda: os.path.exists(os.path.join(str(tmp_path), "Course 1 (HWS 2020)", "Vorlesung_1.mp4")))
+			assert files() == len(ilias.files())
+			assert not any(polls[1:])
+		finally:
+			m.stopWatching()
+			thread.join()